@@ -7,15 +7,21 @@
 # Last Modified Date:  24.11.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
+from typing import Any
+from collections.abc import Sequence
 from ampel.base.AmpelABC import AmpelABC
 from ampel.base.decorator import abstractmethod
 from ampel.base.LogicalUnit import LogicalUnit
 from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.alert.AlertFeatures import AlertFeatures
 
 
 class AbsAlertFilter(AmpelABC, LogicalUnit, abstract=True):
 	""" Base class for T0 alert filters """
 
+	#: Feature cache shared by the filter units of an AlertConsumer (set by FilterBlock)
+	_features: None | AlertFeatures = None
+
 	@abstractmethod
 	def process(self, alert: AmpelAlertProtocol) -> None | bool | int:
 		"""
@@ -27,3 +33,28 @@ class AbsAlertFilter(AmpelABC, LogicalUnit, abstract=True):
 			- positive integer greater zero: accept the alert and create t2 documents associated with this group id
 			- negative integer: filter (own) rejection code (must not exceed 255)
 		"""
+
+
+	def process_batch(self, alerts: Sequence[AmpelAlertProtocol]) -> Sequence[None | bool | int]:
+		"""
+		Filters a batch of alerts (default implementation: calls :func:`process` for each alert).
+		Filters able to vectorize their evaluation (numpy, ML inference) should override this method,
+		which is then used by FilterBlock when the AlertConsumer processes alerts in batches (batch_size > 1).
+
+		Note: log records emitted by this method cannot be associated with individual alerts.
+		If a batch evaluation emits records, FilterBlock discards its results and evaluates
+		the alerts individually using :func:`process` from then on.
+
+		:return: one result per alert (see :func:`process`)
+		"""
+		return [self.process(alert) for alert in alerts]
+
+
+	def get_feature(self, alert: AmpelAlertProtocol, name: str) -> Any:
+		"""
+		:returns: quantity derived from the alert (ex: 'ndet', 'last_mag', 'age', 'color',
+		see :class:`~ampel.alert.AlertFeatures.AlertFeatures`). Within an AlertConsumer,
+		features are computed once per alert and shared among the filters of all channels.
+		:raises ValueError: if the feature is unknown
+		"""
+		return (self._features or AlertFeatures()).get(alert, name)
@@ -8,7 +8,7 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from ampel.types import T
-from typing import Generic
+from typing import Any, Generic
 from collections.abc import Iterator
 from ampel.log.AmpelLogger import AmpelLogger
 from ampel.base.AmpelABC import AmpelABC
@@ -31,3 +31,14 @@ class AbsAlertLoader(Generic[T], AmpelABC, AmpelBaseModel, abstract=True):
 
 	def set_logger(self, logger: AmpelLogger) -> None:
 		self.logger = logger
+
+	def get_checkpoint(self) -> None | dict[str, Any]:
+		"""
+		:returns: json serializable position of the loader, right after the last returned element,
+		or None if the loader does not support checkpoints
+		"""
+		return None
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		""" Moves the loader to a position previously returned by :func:`get_checkpoint` """
+		raise NotImplementedError(f"{self.__class__.__name__} does not support checkpoints")
@@ -28,3 +28,8 @@ class AbsAlertRegister(AmpelABC, AmpelRegister, ContextUnit, abstract=True):
 		:param filter_res: result of the filter; ``None`` if the alert was rejected
 		"""
 		...
+
+
+	def flush(self) -> None:
+		""" Writes the filed records to the register file (which remains open) """
+		self._inner_fh.flush()
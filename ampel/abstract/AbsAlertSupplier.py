@@ -7,7 +7,7 @@
 # Last Modified Date:  24.11.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from typing import Iterator
+from typing import Any, Iterator
 from ampel.log.AmpelLogger import AmpelLogger
 from ampel.base.AmpelABC import AmpelABC
 from ampel.base.decorator import abstractmethod
@@ -30,6 +30,19 @@ class AbsAlertSupplier(AmpelUnit, AmpelABC, abstract=True):
 		self.logger = logger
 
 
+	def get_checkpoint(self) -> None | dict[str, Any]:
+		"""
+		:returns: json serializable position of the supplier, right after the last returned alert,
+		or None if the supplier does not support checkpoints
+		"""
+		return None
+
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		""" Resumes alert consumption from a position previously returned by :func:`get_checkpoint` """
+		raise NotImplementedError(f"{self.__class__.__name__} does not support checkpoints")
+
+
 	@abstractmethod
 	def __iter__(self) -> Iterator[AmpelAlertProtocol]:
 		...
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/abstract/AbsAsyncAlertSupplier.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from collections.abc import AsyncIterator
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.base.AmpelABC import AmpelABC
+from ampel.base.decorator import abstractmethod
+from ampel.base.AmpelUnit import AmpelUnit
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+
+
+class AbsAsyncAlertSupplier(AmpelUnit, AmpelABC, abstract=True):
+	"""
+	Asynchronous iterable class that, for each alert payload provided by an underlying (network) source,
+	returns an object that implements :class:`~ampel.protocol.AmpelAlertProtocol`.
+	Used by :class:`~ampel.alert.AsyncAlertConsumer.AsyncAlertConsumer`.
+	"""
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		self.logger: AmpelLogger = AmpelLogger.get_logger()
+
+
+	def set_logger(self, logger: AmpelLogger) -> None:
+		self.logger = logger
+
+
+	@abstractmethod
+	def __aiter__(self) -> AsyncIterator[AmpelAlertProtocol]:
+		raise NotImplementedError
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/AdaptiveFlushSize.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from time import time
+from ampel.alert.AlertConsumerMetrics import stat_flush_size, stat_write_latency
+
+
+class AdaptiveFlushSize:
+	"""
+	Tunes a flush size (number of documents written at once to the database)
+	based on measured write latencies and on the rate at which documents are produced.
+
+	- The per-document write cost is estimated from the observed latencies (moving average).
+	  The size is chosen so that a write lasts about `target_latency` seconds:
+	  a loaded database yields smaller writes (alert processing is blocked for shorter periods),
+	  an idle one larger writes (less round-trips).
+	- If `max_delay` is set, the size is also capped to the number of documents produced during
+	  `max_delay` seconds, so that documents are not held back for long when alerts arrive slowly.
+
+	The chosen sizes and the observed latencies are exported through the metrics
+	alertprocessor_flush_size and alertprocessor_write_latency_seconds (label: target).
+	"""
+
+	def __init__(self,
+		size: int,
+		target: str,
+		target_latency: float = 0.25,
+		min_size: int = 50,
+		max_size: int = 20000,
+		max_delay: None | float = None,
+		smoothing: float = 0.3
+	) -> None:
+		"""
+		:param size: initial size
+		:param target: metric label (ex: 'updates')
+		:param target_latency: desired duration of one write in seconds
+		:param max_delay: maximum time in seconds documents should be buffered before being written
+		:param smoothing: weight of the latest measurement in the moving averages
+		"""
+
+		if target_latency <= 0 or not 0 < smoothing <= 1 or not 0 < min_size <= max_size:
+			raise ValueError("Invalid adaptive flush size parameters")
+
+		self.size = max(min_size, min(size, max_size))
+		self.target_latency = target_latency
+		self.min_size = min_size
+		self.max_size = max_size
+		self.max_delay = max_delay
+		self.smoothing = smoothing
+
+		self.doc_cost: None | float = None
+		self.doc_rate: None | float = None
+		self._docs = 0
+		self._window_start = time()
+
+		self._stat_size = stat_flush_size.labels(target)
+		self._stat_latency = stat_write_latency.labels(target)
+		self._stat_size.set(self.size)
+
+
+	def observe(self, docs: int, latency: float) -> int:
+		"""
+		:param docs: number of documents written
+		:param latency: duration of the write in seconds
+		:returns: the new flush size
+		"""
+
+		if not docs:
+			return self.size
+
+		self._stat_latency.observe(latency)
+		a = self.smoothing
+
+		cost = latency / docs
+		self.doc_cost = cost if self.doc_cost is None else a * cost + (1 - a) * self.doc_cost
+
+		# Production rate, measured over windows of at least one second
+		self._docs += docs
+		now = time()
+		if (dt := now - self._window_start) >= 1:
+			rate = self._docs / dt
+			self.doc_rate = rate if self.doc_rate is None else a * rate + (1 - a) * self.doc_rate
+			self._docs = 0
+			self._window_start = now
+
+		size = self.target_latency / self.doc_cost if self.doc_cost else self.max_size
+		if self.max_delay and self.doc_rate is not None:
+			size = min(size, self.doc_rate * self.max_delay)
+
+		self.size = max(self.min_size, min(int(size), self.max_size))
+		self._stat_size.set(self.size)
+		return self.size
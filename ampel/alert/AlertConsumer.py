@@ -7,7 +7,10 @@
 # Last Modified Date:  11.06.2022
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-import sys
+import sys, os, json
+from time import time, perf_counter
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from signal import signal, SIGINT, SIGTERM, default_int_handler
 from typing import Any
 from collections.abc import Sequence
@@ -22,7 +25,12 @@ from ampel.dev.DevAmpelContext import DevAmpelContext
 from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
 from ampel.abstract.AbsEventUnit import AbsEventUnit
 from ampel.base.AuxUnitRegister import AuxUnitRegister
+from ampel.alert.FilterBlock import FilterBlock
+from ampel.alert.AdaptiveFlushSize import AdaptiveFlushSize
+from ampel.alert.AlertDeduplicator import AlertDeduplicator
+from ampel.alert.reject.DBRejectedLogsHandler import DBRejectedLogsHandler
 from ampel.alert.FilterBlocksHandler import FilterBlocksHandler
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
 from ampel.ingest.ChainedIngestionHandler import ChainedIngestionHandler
 from ampel.mongo.update.DBUpdatesBuffer import DBUpdatesBuffer
 from ampel.log import AmpelLogger, LogFlag, VERBOSE
@@ -30,7 +38,7 @@ from ampel.log.utils import report_exception
 from ampel.log.AmpelLoggingError import AmpelLoggingError
 from ampel.log.LightLogRecord import LightLogRecord
 from ampel.alert.AlertConsumerError import AlertConsumerError
-from ampel.alert.AlertConsumerMetrics import stat_alerts, stat_accepted, stat_time
+from ampel.alert.AlertConsumerMetrics import stat_alerts, stat_accepted, stat_duplicates, stat_time, MetricsBuffer
 from ampel.model.ingest.IngestDirective import IngestDirective
 from ampel.model.ingest.DualIngestDirective import DualIngestDirective
 from ampel.model.ingest.CompilerOptions import CompilerOptions
@@ -76,10 +84,108 @@ class AlertConsumer(AbsEventUnit):
 
 	updates_buffer_size: int = 500
 
+	#: Number of alerts pulled from the supplier and processed together.
+	#: Each filter block is applied to the whole batch before accepted alerts are ingested,
+	#: and per-alert fixed costs (signal handling, stats increments, DB flush checks)
+	#: are paid once per batch. Interruptions (SIGINT, SIGTERM) take effect after the current batch.
+	batch_size: int = 1
+
+	#: Time the processing stages of one batch out of `timing_sample` (0 disables timing).
+	#: Sections of the alertprocessor_time histogram: 'supplier' (time blocked in the alert supplier),
+	#: 'filter.<channel>', 'ingest', 'push' (updates buffer), 'log_flush' (db logging handler),
+	#: 'register.<channel>' and 'rejected_log.<channel>'.
+	#: Note that 'filter.<channel>' includes the time spent in register and rejected log operations.
+	timing_sample: int = 1
+
+	#: Number of threads used to evaluate the filter blocks of a batch concurrently (0: sequential evaluation).
+	#: Only beneficial if the (t0) filters release the GIL (numpy based filters for example)
+	#: and when several channels are configured. Log records emitted by filter blocks are buffered
+	#: during evaluation and then handed over to the logger in directive order.
+	filter_threads: int = 0
+
+	#: Tune the size of the updates buffer (initially `updates_buffer_size`) and the flush length
+	#: of rejected log handlers based on measured write latencies.
+	#: Parameters of :class:`~ampel.alert.AdaptiveFlushSize.AdaptiveFlushSize`
+	#: (an empty dict activates the defaults). Example: {"target_latency": 0.5, "max_delay": 10}
+	adaptive_flush: None | dict[str, Any] = None
+
+	#: Skip alerts whose id was seen before (replays, overlapping archives) before any filter block runs.
+	#: Parameters of :class:`~ampel.alert.AlertDeduplicator.AlertDeduplicator`
+	#: (an empty dict activates the defaults). Example: {"lru_size": 500000, "registers": ["/data/reg/*.bin.gz"]}
+	#: Skipped alerts are counted by the metric alertprocessor_alerts_duplicated.
+	#: Ids are registered once the updates of the alerts are pushed (alerts whose updates were lost are processed again).
+	dedup: None | dict[str, Any] = None
+
+	#: Hold the stock ids of channels using "auto complete" (on_stock_match) or check_new
+	#: in a compact :class:`~ampel.alert.StockIndex.StockIndex` (8 bytes per integer id)
+	#: instead of python sets. Lookups are slower but memory usage is an order of magnitude lower.
+	compact_stock_index: bool = False
+
+	#: Stock ids of the channels requiring them are loaded by a single scan of the stock collection
+	#: shared by all channels (0) or by one query per channel run concurrently using `stock_scan_threads` threads
+	stock_scan_threads: int = 0
+
+	#: Keep the stock ids of channels using auto complete (or check_new) across runs. Each run then only
+	#: loads the stocks tied to these channels since the previous run instead of reloading all ids.
+	#: Stocks removed from channels are only taken into account by full reloads (see `stock_reload_interval`).
+	incremental_stock_refresh: bool = False
+
+	#: Time in seconds after which a full reload of the stock ids is performed anyway
+	#: (if `incremental_stock_refresh` is set, None: never)
+	stock_reload_interval: None | float = None
+
+	#: Local folder where the stock ids of channels using auto complete are saved (one snapshot file per channel).
+	#: Upon startup, snapshots are memory-mapped (processes of the same node share the page cache copy)
+	#: and only the stocks tied to the channels since the snapshots were saved are loaded from the DB.
+	#: Implies `compact_stock_index`.
+	stock_snapshot_dir: None | str = None
+
+	#: Minimum time in seconds between two snapshot saves (performed at the start of runs)
+	stock_snapshot_interval: float = 3600.
+
+	#: Local folder where filter results are cached per alert id (reprocessing runs).
+	#: Cached results are returned without calling the filter unit, one cache file is used per
+	#: filter unit configuration (see :class:`~ampel.alert.FilterVerdictCache.FilterVerdictCache`).
+	verdict_cache: None | str = None
+
+	#: Evaluate filter units once per alert for directives with identical filter models
+	#: (same unit and configuration, 'reject' and 'on_stock_match' may differ) and hand the result over
+	#: to each associated channel (see :class:`~ampel.alert.SharedFilter.SharedFilter`).
+	#: Should not be used with filter units whose results depend on previously processed alerts.
+	share_filters: bool = False
+
+	#: CPU time budget of filter units (per call and per run) and quarantine of repeatedly slow filters.
+	#: Parameters of :class:`~ampel.alert.FilterBudget.FilterBudget`, possibly per channel (key 'channels').
+	#: Example: {"call_limit": 0.05, "strikes": 5, "quarantine_time": 600, "channels": {"HU_SLOW": {"call_limit": 0.5}}}
+	filter_budget: None | dict[str, Any] = None
+
+	#: BasicMultiFilter instances of different channels share the evaluation of their criteria:
+	#: each distinct criterion (attribute, operator, value) is evaluated once per alert
+	#: (see :class:`~ampel.alert.filter.SharedCriteria.SharedCriteria`)
+	share_criteria: bool = False
+
+	#: Aggregated metrics mode: alert counters and processing time histograms accumulate locally
+	#: and are published to the prometheus registry every N alerts or seconds.
+	#: Parameters of :class:`~ampel.alert.AlertConsumerMetrics.MetricsBuffer`
+	#: (an empty dict activates the defaults). Example: {"alerts": 50000, "interval": 30}
+	aggregate_metrics: None | dict[str, Any] = None
+
 	#: Calls `sys.exit()` with `exit_if_no_alert` as return code in case
 	#: no alert was processed (iter_count == 0)
 	exit_if_no_alert: None | int = None
 
+	#: Path of a json file used to persist the position of the alert supplier
+	#: (see :func:`~ampel.abstract.AbsAlertSupplier.AbsAlertSupplier.get_checkpoint`).
+	#: The position is saved each time the updates buffer is pushed, that is once the
+	#: database updates of all alerts processed so far are written. If the file exists,
+	#: alert consumption resumes from the saved position upon instantiation.
+	checkpoint_file: None | str = None
+
+	#: Maximum time in seconds between two updates buffer pushes (and thus checkpoints).
+	#: Only used if `checkpoint_file` is set, time based pushes are then performed by :func:`run`
+	#: instead of the scheduler thread of the updates buffer.
+	checkpoint_interval: float = 3.
+
 
 	@classmethod
 	def from_process(cls, context: AmpelContext, process_name: str, override: None | dict = None):
@@ -150,25 +256,73 @@ class AlertConsumer(AbsEventUnit):
 
 		super().__init__(**kwargs)
 
+		if self.batch_size < 1:
+			raise ValueError("batch_size must be >= 1")
+
+		if self.timing_sample < 0:
+			raise ValueError("timing_sample must be >= 0")
+
+		if self.filter_threads < 0:
+			raise ValueError("filter_threads must be >= 0")
+
+		self._metrics = MetricsBuffer(**self.aggregate_metrics) \
+			if self.aggregate_metrics is not None else None
+
+		# Kept across runs (see _setup_adaptive_flush)
+		self._flush_sizers: dict[str, AdaptiveFlushSize] = {}
+		if self.adaptive_flush is not None:
+			# Raises errors on invalid parameters
+			self._flush_sizers['updates'] = AdaptiveFlushSize(
+				self.updates_buffer_size, "updates", **self.adaptive_flush
+			)
+
 		self._ampel_db = self.context.get_database()
-		self.alert_supplier = AuxUnitRegister.new_unit(
-			model = self.supplier,
-			sub_type = AbsAlertSupplier
-		)
+		self.alert_supplier = self._new_alert_supplier()
 
 		if AmpelLogger.has_verbose_console(self.context, self.log_profile):
 			logger.log(VERBOSE, "AlertConsumer setup")
 
 		# Load filter blocks
 		self._fbh = FilterBlocksHandler(
-			self.context, logger, self.directives, self.process_name, self.db_log_format
+			self.context, logger, self.directives, self.process_name, self.db_log_format,
+			timing_sample = self.timing_sample,
+			compact_index = self.compact_stock_index,
+			stock_scan_threads = self.stock_scan_threads,
+			incremental_refresh = self.incremental_stock_refresh,
+			reload_interval = self.stock_reload_interval,
+			snapshot_dir = self.stock_snapshot_dir,
+			snapshot_interval = self.stock_snapshot_interval,
+			verdict_cache = self.verdict_cache,
+			share_filters = self.share_filters,
+			# Shared filter results must outlive the evaluation of a whole batch
+			shared_memo_size = self.batch_size,
+			filter_budget = self.filter_budget,
+			share_criteria = self.share_criteria
 		)
 
+		if self._metrics:
+			for fb in self._fbh.filter_blocks:
+				fb.buffer_metrics(self._metrics)
+
+		self._dedup = AlertDeduplicator(
+			**self.dedup, channels=[fb.channel for fb in self._fbh.filter_blocks], logger=logger
+		) if self.dedup is not None else None
+
 		#signal(SIGTERM, self.register_sigterm)
 		signal(SIGTERM, default_int_handler) # type: ignore[arg-type]
+		if self.checkpoint_file:
+			self._load_checkpoint(logger)
+
 		logger.info("AlertConsumer setup completed")
 
 
+	def _new_alert_supplier(self) -> AbsAlertSupplier:
+		return AuxUnitRegister.new_unit(
+			model = self.supplier,
+			sub_type = AbsAlertSupplier
+		)
+
+
 	def register_signal(self, signum: int, frame) -> None:
 		""" Executed when SIGINT/SIGTERM is emitted during alert processing """
 		if self._cancel_run == 0:
@@ -193,13 +347,18 @@ class AlertConsumer(AbsEventUnit):
 			self._cancel_run = reason
 
 
-	def process_alerts(self) -> None:
+	def process_alerts(self) -> int:
 		"""
 		Convenience method to process all alerts from a given loader until it dries out
+
+		:returns: Total number of alerts processed
 		"""
 		processed_alerts = self.iter_max
+		total = 0
 		while processed_alerts == self.iter_max:
 			processed_alerts = self.run()
+			total += processed_alerts
+		return total
 
 
 	def run(self) -> int:
@@ -210,20 +369,228 @@ class AlertConsumer(AbsEventUnit):
 		:raises: LogFlushingError, PyMongoError
 		"""
 
+		logger = self._prepare_run(push_interval = None if self.checkpoint_file else 3.)
+		event_hdlr = self._event_hdlr
+		updates_buffer = self._updates_buffer
+		db_logging_handler = self._db_logging_handler
+		iter_max = self.iter_max
+		iter_count = 0
+
+		# Process alerts
+		################
+
+		# The extra is just a feedback for the console stream handler
+		logger.log(self.shout, "Processing alerts", extra={'r': self._run_id})
+
+		try:
+
+			updates_buffer.start()
+			chatty_interrupt = self.chatty_interrupt
+			register_signal = self.register_signal
+			batch_size = self.batch_size
+			alert_supplier = iter(self.alert_supplier)
+
+			timing_sample = self.timing_sample
+			batch_count = 0
+			timed = False
+			stat_supplier = self._stat_time("supplier")
+			stat_push = self._stat_time("push")
+			stat_log_flush = self._stat_time("log_flush")
+
+			# Whether the supplier position matches the processed alerts
+			consistent = False
+			interrupted = False
+
+			# Iterate over batches of alerts
+			while True:
+
+				consistent = False
+				if timing_sample:
+					batch_count += 1
+					timed = batch_count % timing_sample == 0
+
+				if timed:
+					start = perf_counter()
+
+				alerts: list[AmpelAlertProtocol] = []
+				try:
+					for alert in islice(alert_supplier, min(batch_size, iter_max - iter_count)):
+						alerts.append(alert)
+				# SIGINT during supplier execution: alerts already pulled from the supplier
+				# would be lost, the partial batch is processed before exiting
+				except KeyboardInterrupt:
+					if not alerts:
+						raise
+					interrupted = True
+
+				if timed:
+					stat_supplier.observe(perf_counter() - start)
+
+				# Supplier exhausted
+				if not alerts:
+					consistent = True
+					break
+
+				# Allow execution to complete for this batch (loop exited after ingestion of current batch)
+				signal(SIGINT, register_signal)
+				signal(SIGTERM, register_signal)
+
+				self._process_batch(alerts, timed)
+				iter_count += len(alerts)
+				consistent = True
+
+				if timed:
+					start = perf_counter()
+					self._check_push()
+					stat_push.observe(perf_counter() - start)
+					if db_logging_handler:
+						start = perf_counter()
+						db_logging_handler.check_flush()
+						stat_log_flush.observe(perf_counter() - start)
+				else:
+					self._check_push()
+					if db_logging_handler:
+						db_logging_handler.check_flush()
+
+				if iter_count == iter_max:
+					logger.info("Reached max number of iterations")
+					break
+
+				# Exit if so requested (SIGINT, error registered by DBUpdatesBuffer, ...)
+				if self._cancel_run > 0 or interrupted:
+					break
+
+				# Restore system default sig handling so that KeyBoardInterrupt
+				# can be raised during supplier execution
+				signal(SIGINT, chatty_interrupt)
+				signal(SIGTERM, chatty_interrupt)
+
+		# Executed if SIGINT was sent during supplier execution
+		except KeyboardInterrupt:
+			pass
+
+		except Exception as e:
+			# Try to insert doc into trouble collection (raises no exception)
+			# Possible exception will be logged out to console in any case
+			event_hdlr.add_extra(overwrite=True, success=False)
+			report_exception(self._ampel_db, logger, exc=e)
+
+		# Also executed after SIGINT and SIGTERM
+		finally:
+			updates_buffer.stop()
+			# Registers and rejected logs must be flushed before checkpointing
+			if self._finish_run() and self.checkpoint_file and consistent and self._checkpoint_allowed():
+				self._save_checkpoint()
+
+		if self.exit_if_no_alert and iter_count == 0:
+			sys.exit(self.exit_if_no_alert)
+
+		# Return number of processed alerts
+		return iter_count
+
+
+	def _check_push(self) -> None:
+		""" Pushes database updates if needed, followed by a checkpoint if enabled """
+
+		updates_buffer = self._updates_buffer
+		if not self.checkpoint_file:
+			updates_buffer.check_push()
+			return
+
+		# The updates buffer has no scheduler thread in this case, pushes occur only here
+		last_update = updates_buffer._last_update
+		updates_buffer.check_push()
+		if updates_buffer._last_update == last_update and time() - last_update > self.checkpoint_interval:
+			updates_buffer.push_updates()
+
+		if updates_buffer._last_update != last_update and self._checkpoint_allowed() and self._flush_run():
+			self._save_checkpoint()
+
+
+	def _checkpoint_allowed(self) -> bool:
+		"""
+		Whether the supplier position can be saved: not if the run is cancelled or if database updates were lost
+		(DBUpdatesBuffer reports failed bulk writes through the cancellation of the run and keeps the failed operations)
+		"""
+		return not self._cancel_run and not any(self._updates_buffer._err_db_ops.values())
+
+
+	def _flush_run(self) -> bool:
+		"""
+		Writes the logs, rejected logs and register records of the alerts processed so far
+		(the supplier position can only be saved afterwards)
+		:returns: False if they could not be flushed
+		"""
+
+		try:
+			self._logger.flush()
+			self._fbh.flush()
+		except Exception as e:
+			# Try to insert doc into trouble collection (raises no exception)
+			# Possible exception will be logged out to console in any case
+			report_exception(self._ampel_db, self._logger, exc=e)
+			return False
+
+		return True
+
+
+	def _save_checkpoint(self) -> None:
+
+		assert self.checkpoint_file
+		tmp_file = self.checkpoint_file + ".tmp"
+		with open(tmp_file, "w") as f:
+			json.dump(
+				{
+					'process': self.process_name,
+					'run': self._run_id,
+					'checkpoint': self.alert_supplier.get_checkpoint()
+				},
+				f
+			)
+
+		# Atomic replacement, a crash cannot leave a truncated checkpoint behind
+		os.replace(tmp_file, self.checkpoint_file)
+
+
+	def _load_checkpoint(self, logger: AmpelLogger) -> None:
+
+		assert self.checkpoint_file
+		if self.alert_supplier.get_checkpoint() is None:
+			raise ValueError(f"Alert supplier {self.supplier.unit} does not support checkpoints")
+
+		if not os.path.exists(self.checkpoint_file):
+			return
+
+		with open(self.checkpoint_file) as f:
+			doc = json.load(f)
+
+		logger.info(f"Resuming alert consumption from checkpoint of run {doc['run']}: {doc['checkpoint']}")
+		self.alert_supplier.set_checkpoint(doc['checkpoint'])
+
+
+	def _prepare_run(self, push_interval: None | float = 3.) -> AmpelLogger:
+		"""
+		Sets up the logger, event handler, updates buffer, ingestion handler
+		and filter blocks used by the upcoming run (referenced by private instance variables).
+
+		:param push_interval: see :class:`~ampel.mongo.update.DBUpdatesBuffer.DBUpdatesBuffer`
+		:returns: run logger
+		"""
+
 		# Setup stats
 		#############
 
-		stats = {
+		self._stats: dict[str, Any] = {
 			"alerts": stat_alerts,
 			"accepted": stat_accepted.labels("any")
 		}
 
-		run_id = self.context.new_run_id()
+		self._run_id = run_id = self.context.new_run_id()
 
 		# Setup logging
 		###############
 
-		logger = AmpelLogger.from_profile(
+		self._logger = logger = AmpelLogger.from_profile(
 			self.context, self.log_profile, run_id,
 			base_flag = LogFlag.T0 | LogFlag.CORE | self.base_log_flag
 		)
@@ -236,233 +603,382 @@ class AlertConsumer(AbsEventUnit):
 		# DBLoggingHandler formats, saves and pushes log records into the DB
 		if db_logging_handler := logger.get_db_logging_handler():
 			db_logging_handler.auto_flush = False
+		self._db_logging_handler = db_logging_handler
 
 		# Add new doc in the 'events' collection
-		event_hdlr = EventHandler(
+		self._event_hdlr = EventHandler(
 			self.process_name, self.context.db, tier=0,
 			run_id=run_id, raise_exc=self.raise_exc
 		)
 
 		# Collects and executes pymongo.operations in collection Ampel_data
-		updates_buffer = DBUpdatesBuffer(
+		self._updates_buffer = DBUpdatesBuffer(
 			self._ampel_db, run_id, logger,
 			error_callback = self.set_cancel_run,
 			catch_signals = False, # we do it ourself
+			push_interval = push_interval,
 			max_size = self.updates_buffer_size
 		)
 
-		any_filter = any([fb.filter_model for fb in self._fbh.filter_blocks])
+		fblocks = self._fbh.filter_blocks
+		self._any_filter = any([fb.filter_model for fb in fblocks])
+
 		# if bypassing filters, track passing rates at top level
-		if not any_filter:
-			stats["filter_accepted"] = [
+		if not self._any_filter:
+			self._stats["filter_accepted"] = [
 				stat_accepted.labels(channel)
 				for channel in self._fbh.chan_names
 			]
+			self._filter_results: list[tuple[int, bool | int]] = [(i, True) for i, fb in enumerate(fblocks)]
+
+		if self._metrics:
+			m = self._metrics
+			self._stats = {
+				k: [m.counter(el) for el in v] if isinstance(v, list) else m.counter(v)
+				for k, v in self._stats.items()
+			}
 
 		# Setup ingesters
-		ing_hdlr = ChainedIngestionHandler(
-			self.context, self.shaper, self.directives, updates_buffer,
+		self._ing_hdlr = ChainedIngestionHandler(
+			self.context, self.shaper, self.directives, self._updates_buffer,
 			run_id, tier = 0, logger = logger, database = self.database,
 			trace_id = {'alertconsumer': self._trace_id},
 			compiler_opts = self.compiler_opts or CompilerOptions()
 		)
 
-		# Loop variables
-		iter_max = self.iter_max
 		if self.iter_max != self.__class__.iter_max:
 			logger.info(f"Using custom iter_max: {self.iter_max}")
 
 		self._cancel_run = 0
-		iter_count = 0
-		err = 0
+		self._err = 0
 
 		assert self._fbh.chan_names is not None
-		reduced_chan_names: str | list[str] = self._fbh.chan_names[0] \
+		self._reduced_chan_names: str | list[str] = self._fbh.chan_names[0] \
 			if len(self._fbh.chan_names) == 1 else self._fbh.chan_names
-		fblocks = self._fbh.filter_blocks
 
-		if any_filter:
-			filter_results: list[tuple[int, bool | int]] = []
-		else:
-			filter_results = [(i, True) for i, fb in enumerate(fblocks)]
+		self._stat_ingest = self._stat_time("ingest")
+		self._stat_filters = [self._stat_time(f"filter.{fb.chan_str}") for fb in fblocks]
+
+		# Filter blocks are evaluated concurrently if requested (and useful)
+		self._pool = ThreadPoolExecutor(self.filter_threads, thread_name_prefix="FilterBlock") \
+			if self.filter_threads and self._any_filter and len(fblocks) > 1 else None
 
 		# Builds set of stock ids for autocomplete, if needed
-		self._fbh.ready(logger, run_id)
+		self._fbh.ready(logger, run_id, buffer_logs = self._pool is not None)
 
-		# Process alerts
-		################
+		if self.adaptive_flush is not None:
+			self._setup_adaptive_flush()
 
-		# The extra is just a feedback for the console stream handler
-		logger.log(self.shout, "Processing alerts", extra={'r': run_id})
+		if self._dedup:
+			self._setup_dedup()
 
-		try:
+		return logger
 
-			updates_buffer.start()
-			chatty_interrupt = self.chatty_interrupt
-			register_signal = self.register_signal
 
-			# Iterate over alerts
-			for alert in self.alert_supplier:
+	def _setup_adaptive_flush(self) -> None:
 
-				# Allow execution to complete for this alert (loop exited after ingestion of current alert)
-				signal(SIGINT, register_signal)
-				signal(SIGTERM, register_signal)
+		assert self.adaptive_flush is not None
+		updates_buffer = self._updates_buffer
+		sizer = self._flush_sizers['updates']
+		updates_buffer.max_size = sizer.size
+		call_bulk_write = updates_buffer.call_bulk_write
 
-				# Associate upcoming log entries with the current transient id
-				stock_id = alert.stock
+		# Times the bulk_write operations of the updates buffer (executed by DBUpdatesBuffer.push_updates)
+		def timed_bulk_write(col_name: Any, db_ops: list, **kwargs) -> None:
+			start = perf_counter()
+			call_bulk_write(col_name, db_ops, **kwargs)
+			updates_buffer.max_size = sizer.observe(len(db_ops), perf_counter() - start)
 
-				if any_filter:
+		updates_buffer.call_bulk_write = timed_bulk_write # type: ignore[method-assign]
 
-					filter_results = []
+		for fb in self._fbh.filter_blocks:
+			if isinstance(h := getattr(fb, 'rej_log_handler', None), DBRejectedLogsHandler):
+				target = f"rejected.{fb.chan_str}"
+				if target not in self._flush_sizers:
+					self._flush_sizers[target] = AdaptiveFlushSize(h.flush_len, target, **self.adaptive_flush)
+				h.set_flush_sizer(self._flush_sizers[target])
 
-					# Loop through filter blocks
-					for fblock in fblocks:
-						try:
-							# Apply filter (returns None/False in case of rejection or True/int in case of match)
-							res = fblock.filter(alert)
-							if res[1]:
-								filter_results.append(res) # type: ignore[arg-type]
-
-						# Unrecoverable (logging related) errors
-						except (PyMongoError, AmpelLoggingError) as e:
-							print("%s: abording run() procedure" % e.__class__.__name__)
-							self._report_ap_error(e, event_hdlr, logger, run_id, extra={'a': alert.id})
-							raise e
-
-						# Possibly tolerable errors (could be an error from a contributed filter)
-						except Exception as e:
-
-							if db_logging_handler:
-								fblock.forward(db_logging_handler, stock=stock_id, extra={'a': alert.id})
-							self._report_ap_error(
-								e, event_hdlr, logger, run_id,
-								extra={'a': alert.id, 'section': 'filter', 'c': fblock.channel}
-							)
-
-							if self.raise_exc:
-								raise e
-							else:
-								if self.error_max:
-									err += 1
-								if err == self.error_max:
-									logger.error("Max number of error reached, breaking alert processing")
-									self.set_cancel_run(AlertConsumerError.TOO_MANY_ERRORS)
-				else:
-					# if bypassing filters, track passing rates at top level
-					for counter in stats["filter_accepted"]:
-						counter.inc()
 
-				if filter_results:
+	def _setup_dedup(self) -> None:
 
-					stats["accepted"].inc()
+		assert self._dedup is not None
+		dedup = self._dedup
+		updates_buffer = self._updates_buffer
+		push_updates = updates_buffer.push_updates
 
-					try:
-						with stat_time.labels("ingest").time():
-							ing_hdlr.ingest(
-								alert.datapoints, filter_results, stock_id, alert.tag,
-								{'alert': alert.id}, alert.extra.get('stock') if alert.extra else None
-							)
-					except (PyMongoError, AmpelLoggingError) as e:
-						print("%s: abording run() procedure" % e.__class__.__name__)
-						self._report_ap_error(e, event_hdlr, logger, run_id, extra={'a': alert.id})
+		# Ids of processed alerts are registered once their updates are pushed
+		# (DBUpdatesBuffer.push_updates is called by the scheduler thread of the buffer as well)
+		def dedup_push_updates(force: bool = False) -> None:
+			held = dedup.release()
+			last_update = updates_buffer._last_update
+			push_updates(force)
+			# Push postponed (ingestion in progress)
+			if updates_buffer._last_update == last_update:
+				for el in held:
+					dedup.hold(el)
+			else:
+				self._register_pushed(held)
+
+		updates_buffer.push_updates = dedup_push_updates # type: ignore[method-assign]
+
+
+	def _register_pushed(self, alert_ids: set[int | str]) -> None:
+		""" Registers the ids of alerts whose updates were pushed, unless database updates were lost """
+		assert self._dedup is not None
+		if not any(self._updates_buffer._err_db_ops.values()):
+			for el in alert_ids:
+				self._dedup.add(el)
+
+
+	def _process_batch(self, alerts: list[AmpelAlertProtocol], timed: bool = False) -> None:
+		"""
+		Filters and ingests a batch of alerts.
+		:param timed: record the time spent in filter blocks and ingestion
+		"""
+
+		if dedup := self._dedup:
+			batch_ids: set[int | str] = set()
+			unique = []
+			for alert in alerts:
+				if not (alert.id in batch_ids or dedup.seen(alert.id)):
+					batch_ids.add(alert.id)
+					unique.append(alert)
+			if len(unique) != len(alerts):
+				stat_duplicates.inc(len(alerts) - len(unique))
+				if not unique:
+					return
+				alerts = unique
+
+		if self._any_filter:
+			batch_results = self._filter_batch(alerts, timed)
+			self._fbh.features.clear()
+		else:
+			# if bypassing filters, track passing rates at top level
+			for counter in self._stats["filter_accepted"]:
+				counter.inc(len(alerts))
+			batch_results = [self._filter_results] * len(alerts)
+
+		logger = self._logger
+		ing_hdlr = self._ing_hdlr
+		db_logging_handler = self._db_logging_handler
+		stat_ingest = self._stat_ingest
+		accepted = 0
+
+		for alert, filter_results in zip(alerts, batch_results):
+
+			# Associate upcoming log entries with the current transient id
+			stock_id = alert.stock
+
+			if filter_results:
+
+				accepted += 1
+
+				try:
+					if timed:
+						start = perf_counter()
+					ing_hdlr.ingest(
+						alert.datapoints, filter_results, stock_id, alert.tag,
+						{'alert': alert.id}, alert.extra.get('stock') if alert.extra else None
+					)
+					if timed:
+						stat_ingest.observe(perf_counter() - start)
+				except (PyMongoError, AmpelLoggingError) as e:
+					print("%s: abording run() procedure" % e.__class__.__name__)
+					self._report_ap_error(e, self._event_hdlr, logger, self._run_id, extra={'a': alert.id})
+					raise e
+
+				except Exception as e:
+
+					self._report_ap_error(
+						e, self._event_hdlr, logger, self._run_id, filter_results,
+						extra={'a': alert.id, 'section': 'ingest'}
+					)
+
+					if self.raise_exc:
 						raise e
 
+					if self.error_max:
+						self._err += 1
+
+					if self._err == self.error_max:
+						logger.error("Max number of error reached, breaking alert processing")
+						self.set_cancel_run(AlertConsumerError.TOO_MANY_ERRORS)
+
+				else:
+					if dedup:
+						dedup.hold(alert.id)
+
+			else:
+
+				# All channels reject this alert
+				# no log entries goes into the main logs collection sinces those are redirected to Ampel_rej.
+
+				# So we add a notification manually. For that, we don't use logger
+				# cause rejection messages were alreary logged into the console
+				# by the StreamHandler in channel specific RecordBufferingHandler instances.
+				# So we address directly db_logging_handler, and for that, we create
+				# a LogDocument manually.
+				lr = LightLogRecord(logger.name, LogFlag.INFO | logger.base_flag)
+				lr.stock = stock_id
+				lr.channel = self._reduced_chan_names # type: ignore[assignment]
+				lr.extra = {'a': alert.id, 'allout': True}
+				if db_logging_handler:
+					db_logging_handler.handle(lr)
+
+				if dedup:
+					dedup.hold(alert.id)
+
+		self._stats["alerts"].inc(len(alerts))
+		if accepted:
+			self._stats["accepted"].inc(accepted)
+
+		if self._metrics:
+			self._metrics.tick(len(alerts))
+
+
+	def _stat_time(self, section: str) -> Any:
+		""" :returns: stat_time histogram child for `section` (local proxy in aggregated metrics mode) """
+		if self._metrics:
+			return self._metrics.histogram(stat_time.labels(section))
+		return stat_time.labels(section)
+
+
+	def _filter_batch(self,
+		alerts: list[AmpelAlertProtocol], timed: bool = False
+	) -> list[list[tuple[int, bool | int]]]:
+		""" :returns: for each alert, the results of the accepting filter blocks """
+
+		fblocks = self._fbh.filter_blocks
+		batch_results: list[list[tuple[int, bool | int]]] = [[] for alert in alerts]
+
+		if self._pool:
+			# Each filter block processes the whole batch in a worker thread
+			futures = [
+				self._pool.submit(fblock.filter_alerts, alerts, stat_filter.observe if timed else None)
+				for fblock, stat_filter in zip(fblocks, self._stat_filters)
+			]
+			# Results, logs and errors are processed in directive order
+			for fblock, future in zip(fblocks, futures):
+				fblock.flush_logs(self._logger)
+				self._collect_results(fblock, alerts, *future.result(), batch_results)
+
+		# Loop through filter blocks
+		else:
+			for fblock, stat_filter in zip(fblocks, self._stat_filters):
+
+				# Batched evaluation (filter unit implementing process_batch)
+				if fblock.batch_func and len(alerts) > 1:
+					self._collect_results(
+						fblock, alerts, *fblock.filter_alerts(alerts, stat_filter.observe if timed else None),
+						batch_results
+					)
+					continue
+
+				for i, alert in enumerate(alerts):
+					try:
+						# Apply filter (returns None/False in case of rejection or True/int in case of match)
+						if timed:
+							start = perf_counter()
+							res = fblock.filter(alert)
+							stat_filter.observe(perf_counter() - start)
+						else:
+							res = fblock.filter(alert)
+						if res[1]:
+							batch_results[i].append(res) # type: ignore[arg-type]
 					except Exception as e:
+						self._on_filter_error(e, fblock, alert)
 
-						self._report_ap_error(
-							e, event_hdlr, logger, run_id, filter_results,
-							extra={'a': alert.id, 'section': 'ingest'}
-						)
+		return batch_results
 
-						if self.raise_exc:
-							raise e
 
-						if self.error_max:
-							err += 1
+	def _collect_results(self,
+		fblock: FilterBlock,
+		alerts: list[AmpelAlertProtocol],
+		results: list[tuple[int, int | bool | None]],
+		errors: dict[int, tuple[Exception, list]],
+		batch_results: list[list[tuple[int, bool | int]]]
+	) -> None:
+		""" Handles the output of :func:`~ampel.alert.FilterBlock.FilterBlock.filter_alerts` """
 
-						if err == self.error_max:
-							logger.error("Max number of error reached, breaking alert processing")
-							self.set_cancel_run(AlertConsumerError.TOO_MANY_ERRORS)
+		for i, res in enumerate(results):
+			if res[1]:
+				batch_results[i].append(res) # type: ignore[arg-type]
 
-				else:
+		for i, (e, records) in errors.items():
+			if fblock.filter_model:
+				fblock.buffer.extend(records)
+			self._on_filter_error(e, fblock, alerts[i])
 
-					# All channels reject this alert
-					# no log entries goes into the main logs collection sinces those are redirected to Ampel_rej.
-
-					# So we add a notification manually. For that, we don't use logger
-					# cause rejection messages were alreary logged into the console
-					# by the StreamHandler in channel specific RecordBufferingHandler instances.
-					# So we address directly db_logging_handler, and for that, we create
-					# a LogDocument manually.
-					lr = LightLogRecord(logger.name, LogFlag.INFO | logger.base_flag)
-					lr.stock = stock_id
-					lr.channel = reduced_chan_names # type: ignore[assignment]
-					lr.extra = {'a': alert.id, 'allout': True}
-					if db_logging_handler:
-						db_logging_handler.handle(lr)
 
-				iter_count += 1
-				stats["alerts"].inc()
+	def _on_filter_error(self, e: Exception, fblock: FilterBlock, alert: AmpelAlertProtocol) -> None:
 
-				updates_buffer.check_push()
-				if db_logging_handler:
-					db_logging_handler.check_flush()
+		logger = self._logger
 
-				if iter_count == iter_max:
-					logger.info("Reached max number of iterations")
-					break
+		# Unrecoverable (logging related) errors
+		if isinstance(e, (PyMongoError, AmpelLoggingError)):
+			print("%s: abording run() procedure" % e.__class__.__name__)
+			self._report_ap_error(e, self._event_hdlr, logger, self._run_id, extra={'a': alert.id})
+			raise e
 
-				# Exit if so requested (SIGINT, error registered by DBUpdatesBuffer, ...)
-				if self._cancel_run > 0:
-					break
+		# Possibly tolerable errors (could be an error from a contributed filter)
+		if self._db_logging_handler:
+			fblock.forward(self._db_logging_handler, stock=alert.stock, extra={'a': alert.id})
+		self._report_ap_error(
+			e, self._event_hdlr, logger, self._run_id,
+			extra={'a': alert.id, 'section': 'filter', 'c': fblock.channel}
+		)
 
-				# Restore system default sig handling so that KeyBoardInterrupt
-				# can be raised during supplier execution
-				signal(SIGINT, chatty_interrupt)
-				signal(SIGTERM, chatty_interrupt)
+		if self.raise_exc:
+			raise e
+		else:
+			if self.error_max:
+				self._err += 1
+			if self._err == self.error_max:
+				logger.error("Max number of error reached, breaking alert processing")
+				self.set_cancel_run(AlertConsumerError.TOO_MANY_ERRORS)
 
-		# Executed if SIGINT was sent during supplier execution
-		except KeyboardInterrupt:
-			pass
 
-		except Exception as e:
-			# Try to insert doc into trouble collection (raises no exception)
-			# Possible exception will be logged out to console in any case
-			event_hdlr.add_extra(overwrite=True, success=False)
-			report_exception(self._ampel_db, logger, exc=e)
+	def _finish_run(self) -> bool:
+		"""
+		Releases the resources of the current run (updates buffer must have been stopped)
+		:returns: False if loggers, registers or rejected logs could not be flushed
+		"""
 
-		# Also executed after SIGINT and SIGTERM
-		finally:
+		logger = self._logger
 
-			updates_buffer.stop()
+		if self._pool:
+			self._pool.shutdown()
 
-			if self._cancel_run > 0:
-				print("")
-				logger.info("Processing interrupted")
-			else:
-				logger.log(self.shout, "Processing completed")
+		if self._cancel_run > 0:
+			print("")
+			logger.info("Processing interrupted")
+		else:
+			logger.log(self.shout, "Processing completed")
+
+		try:
 
-			try:
+			# Flush loggers
+			logger.flush()
 
-				# Flush loggers
-				logger.flush()
+			# Flush registers and rejected log handlers
+			self._fbh.done()
 
-				# Flush registers and rejected log handlers
-				self._fbh.done()
+			self._event_hdlr.update(logger)
 
-				event_hdlr.update(logger)
+		except Exception as e:
 
-			except Exception as e:
+			# Try to insert doc into trouble collection (raises no exception)
+			# Possible exception will be logged out to console in any case
+			report_exception(self._ampel_db, logger, exc=e)
+			success = False
 
-				# Try to insert doc into trouble collection (raises no exception)
-				# Possible exception will be logged out to console in any case
-				report_exception(self._ampel_db, logger, exc=e)
+		else:
+			success = True
 
-		if self.exit_if_no_alert and iter_count == 0:
-			sys.exit(self.exit_if_no_alert)
+		if self._metrics:
+			self._metrics.flush()
 
-		# Return number of processed alerts
-		return iter_count
+		return success
 
 
 	def _report_ap_error(self,
@@ -2,6 +2,12 @@
 Common counters for AlertConsumer and worker classes
 """
 
+from time import perf_counter, time
+from math import inf, nextafter
+from bisect import bisect_left
+from typing import Any
+from collections.abc import Callable
+from prometheus_client import Counter, Histogram
 from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 
 stat_alerts = AmpelMetricsRegistry.counter(
@@ -9,6 +15,11 @@ stat_alerts = AmpelMetricsRegistry.counter(
     "Number of processed alerts",
     subsystem="alertprocessor",
 )
+stat_duplicates = AmpelMetricsRegistry.counter(
+    "alerts_duplicated",
+    "Number of duplicate alerts skipped (alert deduplication)",
+    subsystem="alertprocessor",
+)
 stat_accepted = AmpelMetricsRegistry.counter(
     "alerts_accepted",
     "Number of accepted alerts",
@@ -27,6 +38,28 @@ stat_autocomplete = AmpelMetricsRegistry.counter(
     subsystem="alertprocessor",
     labelnames=("channel",),
 )
+stat_filter_overruns = AmpelMetricsRegistry.counter(
+    "filter_overruns",
+    "Number of filter calls exceeding their CPU time budget",
+    subsystem="alertprocessor",
+    labelnames=("channel",),
+)
+stat_filter_quarantined = AmpelMetricsRegistry.counter(
+    "filter_quarantined",
+    "Number of alerts not evaluated by quarantined filters",
+    subsystem="alertprocessor",
+    labelnames=("channel",),
+)
+stat_dropped = AmpelMetricsRegistry.counter(
+    "alerts_dropped",
+    "Number of alerts not processed because their worker process died",
+    subsystem="alertprocessor",
+)
+stat_readahead_empty = AmpelMetricsRegistry.counter(
+    "readahead_empty",
+    "Number of times the alert read-ahead queue was found empty",
+    subsystem="alertprocessor",
+)
 stat_time = AmpelMetricsRegistry.histogram(
     "time",
     "Processing time",
@@ -34,9 +67,159 @@ stat_time = AmpelMetricsRegistry.histogram(
     subsystem="alertprocessor",
     labelnames=("section",),
 )
+stat_flush_size = AmpelMetricsRegistry.gauge(
+    "flush_size",
+    "Number of documents written at once to the database (adaptive flush sizing)",
+    subsystem="alertprocessor",
+    labelnames=("target",),
+    multiprocess_mode="liveall",
+)
+stat_write_latency = AmpelMetricsRegistry.histogram(
+    "write_latency",
+    "Database write latency (adaptive flush sizing)",
+    unit="seconds",
+    subsystem="alertprocessor",
+    labelnames=("target",),
+)
 stat_ingestions = AmpelMetricsRegistry.histogram(
     "ingestions",
     "Processing time",
     subsystem="alertprocessor",
     labelnames=("section",),
 )
+
+
+def sampled_timer(func: Callable[..., Any], section: str, sample: int = 1) -> Callable[..., Any]:
+    """
+    Wraps func so that one call out of `sample` is timed into the stat_time histogram
+    using label `section`. Returns func unchanged if sample is 0 (timing disabled).
+    """
+    if not sample:
+        return func
+
+    observe = stat_time.labels(section).observe
+    count = 0
+
+    def timed(*args, **kwargs):
+        nonlocal count
+        count += 1
+        if count % sample:
+            return func(*args, **kwargs)
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe(perf_counter() - start)
+
+    return timed
+
+
+class LocalCounter:
+    """
+    Counter child proxy accumulating increments in a plain number (no lock, no allocation).
+    Increments are published by :func:`flush`.
+    """
+
+    __slots__ = "target", "value"
+
+    def __init__(self, target: Counter) -> None:
+        self.target = target
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def flush(self) -> None:
+        if self.value:
+            self.target.inc(self.value)
+            self.value = 0
+
+
+class LocalHistogram:
+    """
+    Histogram child proxy accumulating observations in local bucket counts and sums.
+    Observations are published by :func:`flush` through the public observe() method of the target:
+    the values observed in a bucket are replaced by their mean, observed as many times as needed,
+    so that bucket counts and sum are identical to the ones obtained by observing each value individually
+    (exemplars are not supported).
+    """
+
+    __slots__ = "target", "bounds", "counts", "sums"
+
+    def __init__(self, target: Histogram) -> None:
+        self.target = target
+        self.bounds = [
+            float(sample.labels['le']) for metric in target.collect()
+            for sample in metric.samples if sample.name.endswith("_bucket")
+        ]
+        self.counts = [0] * len(self.bounds)
+        self.sums = [0.] * len(self.bounds)
+
+    def observe(self, amount: float) -> None:
+        i = bisect_left(self.bounds, amount)
+        self.counts[i] += 1
+        self.sums[i] += amount
+
+    def flush(self) -> None:
+        counts = self.counts
+        if any(counts):
+            bounds = self.bounds
+            observe = self.target.observe
+            for i, n in enumerate(counts):
+                if n:
+                    # The mean of values within (bounds[i-1], bounds[i]] lies within these bounds as well
+                    mean = min(self.sums[i] / n, bounds[i])
+                    if i and mean <= bounds[i - 1]:
+                        mean = nextafter(bounds[i - 1], inf)
+                    for _ in range(n):
+                        observe(mean)
+                    counts[i] = 0
+                    self.sums[i] = 0.
+
+
+class MetricsBuffer:
+    """
+    Aggregated metrics mode: counters and histograms obtained through :func:`counter` and :func:`histogram`
+    accumulate locally and are published to the prometheus registry by :func:`flush`,
+    which :func:`tick` calls every `alerts` processed alerts or every `interval` seconds (whichever comes first).
+    Totals are unchanged, but scraped values can lag behind by up to one flush period.
+    """
+
+    def __init__(self, alerts: None | int = 10000, interval: None | float = 10.) -> None:
+        """
+        :param alerts: number of processed alerts between two flushes (None: no limit)
+        :param interval: time in seconds between two flushes (None: no limit)
+        """
+
+        if (alerts is not None and alerts < 1) or (interval is not None and interval <= 0):
+            raise ValueError("Invalid metrics buffer parameters")
+
+        self.alerts = alerts or float("inf")
+        self.interval = interval or float("inf")
+        self._proxies: dict[int, LocalCounter | LocalHistogram] = {}
+        self._count = 0
+        self._flushed = time()
+
+    def counter(self, target: Counter) -> LocalCounter:
+        """ :param target: counter child (ex: stat_accepted.labels('HU_SN')) """
+        if (ret := self._proxies.get(id(target))) is None:
+            ret = self._proxies[id(target)] = LocalCounter(target)
+        return ret  # type: ignore[return-value]
+
+    def histogram(self, target: Histogram) -> LocalHistogram:
+        """ :param target: histogram child (ex: stat_time.labels('ingest')) """
+        if (ret := self._proxies.get(id(target))) is None:
+            ret = self._proxies[id(target)] = LocalHistogram(target)
+        return ret  # type: ignore[return-value]
+
+    def tick(self, alerts: int) -> None:
+        """ :param alerts: number of alerts processed since the previous call """
+        self._count += alerts
+        if self._count >= self.alerts or time() - self._flushed >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        for proxy in self._proxies.values():
+            proxy.flush()
+        self._count = 0
+        self._flushed = time()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/AlertDeduplicator.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from glob import glob
+from math import ceil, log
+from threading import Lock
+from collections import OrderedDict
+from collections.abc import Iterable, Sequence
+from ampel.types import ChannelId
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.util.register import reg_iter, get_header_content
+
+
+class AlertDeduplicator:
+	"""
+	Detects alert ids seen previously.
+
+	- Exact detection: the `lru_size` most recently seen ids are kept in a LRU cache.
+	- Probabilistic detection (if `bloom_capacity` is set): every seen id is added to a Bloom filter
+	  (about 2.4 bytes per id for bloom_error=1e-4). Ids missing from the LRU cache but matching the
+	  Bloom filter are considered duplicates as well. Note that a false positive (probability
+	  `bloom_error` once `bloom_capacity` ids are registered) causes a new alert to be skipped.
+
+	Ids are only registered (:func:`add`) once the corresponding alerts are processed and their database
+	updates are saved: ids of processed alerts are held (:func:`hold`) meanwhile, held ids are seen as well.
+
+	Both structures can be seeded with the alert ids recorded by alert registers.
+	Ids are hashed using the builtin hash(), structures are thus only valid within a process.
+	"""
+
+	def __init__(self,
+		lru_size: int = 100000,
+		bloom_capacity: None | int = None,
+		bloom_error: float = 1e-4,
+		registers: None | Sequence[str] = None,
+		channels: None | Sequence[ChannelId] = None,
+		logger: None | AmpelLogger = None
+	) -> None:
+		"""
+		:param registers: paths (glob patterns accepted) of alert register files whose alert ids are
+		registered as seen (ids are added to the Bloom filter if available, to the LRU cache otherwise).
+		Registers record the rejections of a channel: only the ids rejected by all channels are registered
+		(alerts accepted by a channel might not have been ingested).
+		:param channels: channels processing the alerts (default: channels of the provided registers)
+		"""
+
+		if lru_size < 1 or (bloom_capacity is not None and bloom_capacity < 1) or not 0 < bloom_error < 1:
+			raise ValueError("Invalid alert deduplication parameters")
+
+		self.lru_size = lru_size
+		self._lru: OrderedDict[int | str, None] = OrderedDict()
+		self._held: set[int | str] = set()
+		self._lock = Lock()
+
+		if bloom_capacity:
+			ln2 = log(2)
+			self._bits = ceil(-bloom_capacity * log(bloom_error) / ln2 ** 2)
+			self._hashes = max(1, round(self._bits / bloom_capacity * ln2))
+			self._bloom: None | bytearray = bytearray((self._bits + 7) // 8)
+		else:
+			self._bloom = None
+
+		if registers:
+			count = self.load_registers(
+				[path for pattern in registers for path in sorted(glob(pattern))], channels
+			)
+			if logger:
+				logger.info(f"Alert deduplication: {count} alert ids loaded from registers")
+
+
+	def _bloom_positions(self, alert_id: int | str) -> list[int]:
+		# Double hashing (Kirsch-Mitzenmacher) from one scrambled 64 bits hash
+		h = (hash(alert_id) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+		h1 = h >> 32
+		h2 = (h & 0xFFFFFFFF) | 1
+		m = self._bits
+		return [(h1 + i * h2) % m for i in range(self._hashes)]
+
+
+	def seen(self, alert_id: int | str) -> bool:
+		""" :returns: whether the id was registered or is held """
+
+		if alert_id in self._held:
+			return True
+
+		with self._lock:
+			lru = self._lru
+			if alert_id in lru:
+				lru.move_to_end(alert_id)
+				return True
+
+		if (bloom := self._bloom) is not None:
+			for pos in self._bloom_positions(alert_id):
+				byte, bit = divmod(pos, 8)
+				if not bloom[byte] >> bit & 1:
+					return False
+			return True
+
+		return False
+
+
+	def hold(self, alert_id: int | str) -> None:
+		""" Holds the id of a processed alert until its database updates are saved (see :func:`release`) """
+		# release() is called by the scheduler thread of the updates buffer as well
+		with self._lock:
+			self._held.add(alert_id)
+
+
+	def release(self) -> set[int | str]:
+		""" :returns: held ids, which are not held anymore (they are to be registered or held again) """
+		with self._lock:
+			held = self._held
+			self._held = set()
+		return held
+
+
+	def add(self, alert_id: int | str, lru: bool = True) -> None:
+		"""
+		Registers the provided id
+		:param lru: add the id to the LRU cache (ids are only added to the Bloom filter if False and if available)
+		"""
+
+		if (bloom := self._bloom) is not None:
+			for pos in self._bloom_positions(alert_id):
+				byte, bit = divmod(pos, 8)
+				bloom[byte] |= 1 << bit
+			if not lru:
+				return
+
+		with self._lock:
+			cache = self._lru
+			cache[alert_id] = None
+			cache.move_to_end(alert_id)
+			if len(cache) > self.lru_size:
+				cache.popitem(last=False)
+
+
+	def load_registers(self, paths: Iterable[str], channels: None | Sequence[ChannelId] = None) -> int:
+		"""
+		Registers the alert ids rejected by all channels according to the provided alert register files
+		(the channel of a register is read from its header)
+		:param channels: default: channels of the provided registers
+		:returns: number of ids loaded
+		"""
+
+		rejected: dict[ChannelId, set[int | str]] = {c: set() for c in channels} if channels else {}
+		for path in paths:
+			header = get_header_content(path, verbose=False)
+			if not header or (channel := header.get('channel')) is None or (channels and channel not in rejected):
+				continue
+			rejected.setdefault(channel, set()).update(el[0] for el in reg_iter(path, verbose=False))
+
+		if not rejected:
+			return 0
+
+		seeds = set.intersection(*rejected.values())
+		for el in seeds:
+			self.add(el, lru = False)
+		return len(seeds)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/AlertFeatures.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from threading import Lock
+from typing import Any, ClassVar
+from collections.abc import Callable
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+
+
+class AlertFeatures:
+	"""
+	Cache of quantities derived from alerts (number of detections, latest magnitude, ...) shared by
+	all filter units of an AlertConsumer process (see :func:`~ampel.abstract.AbsAlertFilter.AbsAlertFilter.get_feature`).
+	A feature is computed on first access and reused by the filters evaluating the same alert.
+
+	Values are memoized for the last `memo_size` alerts (keyed by alert object identity),
+	the AlertConsumer clears the cache once a batch of alerts is filtered.
+
+	Features are functions of the alert and of the cache itself (features can depend on other features),
+	custom features can be registered with :func:`register`::
+
+		@AlertFeatures.register('peak_mag')
+		def peak_mag(alert, features):
+			return min(dp['magpsf'] for dp in features.get(alert, 'detections'))
+	"""
+
+	#: Feature functions by name
+	functions: ClassVar[dict[str, Callable[[AmpelAlertProtocol, 'AlertFeatures'], Any]]] = {}
+
+	def __init__(self, memo_size: int = 1) -> None:
+		"""
+		:param memo_size: see :class:`~ampel.alert.SharedFilter.SharedFilter`
+		"""
+		self.memo_size = max(memo_size, 1)
+		self._memo: dict[int, tuple[AmpelAlertProtocol, dict[str, Any]]] = {}
+		self._lock = Lock()
+		self.computed = 0
+
+
+	@classmethod
+	def register(cls, name: str) -> Callable[
+		[Callable[[AmpelAlertProtocol, 'AlertFeatures'], Any]],
+		Callable[[AmpelAlertProtocol, 'AlertFeatures'], Any]
+	]:
+		""" Decorator registering a feature function under the provided name """
+		def decorator(
+			func: Callable[[AmpelAlertProtocol, 'AlertFeatures'], Any]
+		) -> Callable[[AmpelAlertProtocol, 'AlertFeatures'], Any]:
+			cls.functions[name] = func
+			return func
+		return decorator
+
+
+	def get(self, alert: AmpelAlertProtocol, name: str) -> Any:
+		"""
+		:returns: value of feature `name` for the provided alert
+		:raises ValueError: if the feature is unknown
+		"""
+
+		memo = self._memo
+		if (m := memo.get(id(alert))) is None or m[0] is not alert:
+			with self._lock:
+				if (m := memo.get(id(alert))) is None or m[0] is not alert:
+					m = memo[id(alert)] = alert, {}
+					if len(memo) > self.memo_size:
+						del memo[next(iter(memo))]
+
+		values = m[1]
+		if name in values:
+			return values[name]
+
+		if (func := self.functions.get(name)) is None:
+			raise ValueError(f"Unknown alert feature '{name}'")
+
+		self.computed += 1
+		ret = values[name] = func(alert, self)
+		return ret
+
+
+	def clear(self) -> None:
+		""" Releases cached features """
+		self._memo.clear()
+
+
+@AlertFeatures.register('detections')
+def detections(alert: AmpelAlertProtocol, features: AlertFeatures) -> list[dict[str, Any]]:
+	""" Datapoints with a 'candid' field (see AmpelAlert.get_values) sorted by 'jd' """
+	return sorted((dp for dp in alert.datapoints if 'candid' in dp), key=lambda dp: dp.get('jd', 0))
+
+
+@AlertFeatures.register('ndet')
+def ndet(alert: AmpelAlertProtocol, features: AlertFeatures) -> int:
+	""" Number of detections """
+	return len(features.get(alert, 'detections'))
+
+
+@AlertFeatures.register('last_mag')
+def last_mag(alert: AmpelAlertProtocol, features: AlertFeatures) -> None | float:
+	""" Magnitude (magpsf) of the latest detection """
+	dets = features.get(alert, 'detections')
+	return dets[-1].get('magpsf') if dets else None
+
+
+@AlertFeatures.register('age')
+def age(alert: AmpelAlertProtocol, features: AlertFeatures) -> None | float:
+	""" Time between the first and the latest detection in days """
+	dets = features.get(alert, 'detections')
+	return dets[-1]['jd'] - dets[0]['jd'] if dets and 'jd' in dets[0] and 'jd' in dets[-1] else None
+
+
+@AlertFeatures.register('color')
+def color(alert: AmpelAlertProtocol, features: AlertFeatures) -> None | float:
+	""" Difference of the latest magnitudes in filters 1 and 2 (g - r for ZTF) """
+	last: dict[Any, float] = {}
+	for dp in features.get(alert, 'detections'):
+		if dp.get('magpsf') is not None:
+			last[dp.get('fid')] = dp['magpsf']
+	return last[1] - last[2] if 1 in last and 2 in last else None
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/AsyncAlertConsumer.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import sys, asyncio
+from copy import copy
+from time import time, perf_counter
+from signal import SIGINT, SIGTERM
+from collections.abc import Iterator, AsyncIterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from ampel.base.AuxUnitRegister import AuxUnitRegister
+from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
+from ampel.abstract.AbsAsyncAlertSupplier import AbsAsyncAlertSupplier
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.mongo.update.DBUpdatesBuffer import DBUpdatesBuffer
+from ampel.mongo.update.var.DBLoggingHandler import DBLoggingHandler
+from ampel.log.utils import report_exception
+from ampel.alert.AlertConsumer import AlertConsumer
+from ampel.alert.reject.DBRejectedLogsHandler import DBRejectedLogsHandler
+
+
+def push_updates(updates_buffer: DBUpdatesBuffer, executor: None | Executor = None) -> asyncio.Future:
+	"""
+	Awaitable version of :func:`DBUpdatesBuffer.push_updates`.
+	The buffered operations are detached right away (new updates can be added while the push is pending),
+	bulk_write operations are performed by the provided executor.
+	"""
+
+	# Reference instance buffer locally before creating a new one
+	db_ops = updates_buffer.db_ops
+	updates_buffer._new_buffer()
+	updates_buffer._last_update = time()
+
+	loop = asyncio.get_running_loop()
+	return asyncio.gather(
+		*[
+			loop.run_in_executor(executor, updates_buffer.call_bulk_write, col_name, ops)
+			for col_name, ops in db_ops.items() if ops
+		]
+	)
+
+
+def flush_logs(handler: DBLoggingHandler, executor: None | Executor = None) -> asyncio.Future:
+	"""
+	Awaitable version of :func:`DBLoggingHandler.flush`.
+	Log documents are detached right away, the insertion is performed by the provided executor.
+	"""
+
+	# A shallow copy of the handler takes over the current log documents
+	detached = copy(handler)
+	handler.log_dicts = []
+	handler.prev_record = None
+
+	return asyncio.get_running_loop().run_in_executor(executor, detached.flush)
+
+
+class AsyncAlertConsumer(AlertConsumer):
+	"""
+	:class:`~ampel.alert.AlertConsumer.AlertConsumer` variant driven by an asyncio event loop.
+	Supports alert suppliers implementing :class:`~ampel.abstract.AbsAsyncAlertSupplier.AbsAsyncAlertSupplier`
+	(regular suppliers are accepted as well, they are iterated synchronously).
+
+	- The next batch of alerts is requested before the current batch is filtered and ingested.
+	- Database writes (bulk_write of the updates buffer, insert_many of the db logging
+	  and rejected logs handlers) are awaitable and performed in the background,
+	  overlapping with alert processing. Alert processing waits for their completion only if
+	  more than `max_pending_flushes` are pending.
+
+	pymongo offers no asyncio API: database writes are run by a single dedicated executor thread,
+	which preserves their ordering. Filtering and ingestion run in the event loop thread.
+
+	Use :func:`arun` from a running event loop (always the same one), :func:`run` otherwise.
+	Alerts fetched but not yet processed when a run stops (interruption) are processed by the next run.
+	SIGINT/SIGTERM stop the wait for alerts of asynchronous suppliers without cancelling the pending
+	request to the supplier (which is not closed): the alert it returns is processed by the next run.
+	Time spent waiting for pending flushes is recorded under section 'flush_wait' of alertprocessor_time.
+	"""
+
+	#: Maximum number of pending (background) database flushes
+	max_pending_flushes: int = 2
+
+	#: Push updates to the database at least every `push_interval` seconds
+	push_interval: float = 3.
+
+
+	def __init__(self, **kwargs) -> None:
+		if kwargs.get('checkpoint_file'):
+			raise ValueError("Checkpoints are not supported by AsyncAlertConsumer (alerts are prefetched)")
+		super().__init__(**kwargs)
+		self._prefetched: list[AmpelAlertProtocol] = []
+		self._alert_iter: None | Iterator[AmpelAlertProtocol] | AsyncIterator[AmpelAlertProtocol] = None
+		self._next_alert: None | asyncio.Future = None
+		self._loop: None | asyncio.AbstractEventLoop = None
+
+
+	def _new_alert_supplier(self) -> AbsAlertSupplier:
+		supplier = AuxUnitRegister.new_unit(model = self.supplier)
+		if not isinstance(supplier, (AbsAsyncAlertSupplier, AbsAlertSupplier)):
+			raise ValueError(f"Unit {self.supplier.unit} is not an alert supplier")
+		return supplier # type: ignore[return-value]
+
+
+	def run(self) -> int:
+		"""
+		Process alerts using an event loop owned by this instance
+		(asynchronous supplier iterators are bound to the loop they were created in)
+
+		:returns: Number of alerts processed
+		"""
+		if self._loop is None:
+			self._loop = asyncio.new_event_loop()
+		return self._loop.run_until_complete(self.arun())
+
+
+	async def _fetch(self, n: int) -> None:
+		""" Fetches alerts from the supplier until `n` alerts are available in self._prefetched """
+
+		if self._alert_iter is None:
+			self._alert_iter = aiter(self.alert_supplier) \
+				if isinstance(self.alert_supplier, AbsAsyncAlertSupplier) \
+				else iter(self.alert_supplier)
+
+		it = self._alert_iter
+		buf = self._prefetched
+
+		try:
+			if isinstance(it, Iterator):
+				while len(buf) < n:
+					buf.append(next(it))
+			else:
+				while len(buf) < n:
+					if self._next_alert is None:
+						self._next_alert = asyncio.ensure_future(anext(it))
+					# Cancelling the fetch (signal) must not cancel and thereby close the supplier iterator
+					try:
+						alert = await asyncio.shield(self._next_alert)
+					finally:
+						if self._next_alert.done():
+							self._next_alert = None
+					buf.append(alert)
+		except (StopIteration, StopAsyncIteration):
+			pass
+
+
+	def _apush_updates(self, executor: Executor) -> asyncio.Future:
+		""" Detached push of the buffered updates, ids of the deduplicated alerts are registered once it completes """
+
+		push = push_updates(self._updates_buffer, executor)
+		if self._dedup:
+			held = self._dedup.release()
+
+			def on_push(f: asyncio.Future) -> None:
+				if not f.cancelled() and f.exception() is None:
+					self._register_pushed(held)
+			push.add_done_callback(on_push)
+		return push
+
+
+	async def arun(self) -> int:
+		"""
+		Process alerts using internal alert_supplier
+
+		:returns: Number of alerts processed
+		:raises: LogFlushingError, PyMongoError
+		"""
+
+		# Pushes are triggered by this method rather than by the scheduler thread of the buffer
+		logger = self._prepare_run(push_interval = None)
+		event_hdlr = self._event_hdlr
+		updates_buffer = self._updates_buffer
+		db_logging_handler = self._db_logging_handler
+		iter_max = self.iter_max
+		iter_count = 0
+
+		rej_log_handlers = [
+			h for fb in self._fbh.filter_blocks
+			if isinstance(h := getattr(fb, 'rej_log_handler', None), DBRejectedLogsHandler)
+		]
+		for h in rej_log_handlers:
+			h.auto_flush = False
+
+		logger.log(self.shout, "Processing alerts", extra={'r': self._run_id})
+
+		loop = asyncio.get_running_loop()
+		executor = ThreadPoolExecutor(1, thread_name_prefix="AsyncAlertConsumer")
+		pending: list[asyncio.Future] = []
+		fetch: None | asyncio.Task = None
+
+		def on_signal(signum: int) -> None:
+			self.register_signal(signum, None)
+			# Interrupt waiting for alerts (fetched alerts and the pending request are kept for the next run)
+			if fetch and not fetch.done():
+				fetch.cancel()
+
+		try:
+
+			for sig in (SIGINT, SIGTERM):
+				loop.add_signal_handler(sig, on_signal, sig)
+
+			batch_size = self.batch_size
+			max_pending = self.max_pending_flushes
+			push_interval = self.push_interval
+			last_push = time()
+
+			timing_sample = self.timing_sample
+			batch_count = 0
+			timed = False
+			stat_supplier = self._stat_time("supplier")
+			stat_flush_wait = self._stat_time("flush_wait")
+
+			fetch = asyncio.create_task(self._fetch(min(batch_size, iter_max)))
+
+			# Iterate over batches of alerts
+			while True:
+
+				if timing_sample:
+					batch_count += 1
+					timed = batch_count % timing_sample == 0
+
+				if timed:
+					start = perf_counter()
+
+				try:
+					await fetch
+				except asyncio.CancelledError:
+					if not self._cancel_run:
+						raise
+					break
+
+				if timed:
+					stat_supplier.observe(perf_counter() - start)
+
+				n = min(batch_size, iter_max - iter_count)
+				alerts = self._prefetched[:n]
+				del self._prefetched[:n]
+
+				if not alerts:
+					break
+
+				# Request next batch before processing the current one
+				if (n := min(batch_size, iter_max - iter_count - len(alerts))) > 0:
+					fetch = asyncio.create_task(self._fetch(n))
+					await asyncio.sleep(0)
+
+				self._process_batch(alerts, timed)
+				iter_count += len(alerts)
+
+				# max_size is tuned by the adaptive flush size if enabled (see _setup_adaptive_flush)
+				if (
+					(max_size := updates_buffer.max_size) and
+					any(len(v) > max_size for v in updates_buffer.db_ops.values())
+				) or time() - last_push > push_interval:
+					pending.append(self._apush_updates(executor))
+					last_push = time()
+
+				if db_logging_handler and len(db_logging_handler.log_dicts) > db_logging_handler.flush_len:
+					pending.append(flush_logs(db_logging_handler, executor))
+
+				for h in rej_log_handlers:
+					if len(h.log_dicts) > h.flush_len:
+						pending.append(h.aflush(executor))
+
+				# Retrieve outcome of completed flushes, wait if too many are pending
+				if timed:
+					start = perf_counter()
+				while pending and (len(pending) > max_pending or pending[0].done()):
+					await pending.pop(0)
+				if timed:
+					stat_flush_wait.observe(perf_counter() - start)
+
+				if iter_count == iter_max:
+					logger.info("Reached max number of iterations")
+					break
+
+				# Exit if so requested (SIGINT, error registered by DBUpdatesBuffer, ...)
+				if self._cancel_run > 0:
+					break
+
+		except Exception as e:
+			# Try to insert doc into trouble collection (raises no exception)
+			# Possible exception will be logged out to console in any case
+			event_hdlr.add_extra(overwrite=True, success=False)
+			report_exception(self._ampel_db, logger, exc=e)
+
+		# Also executed after SIGINT and SIGTERM
+		finally:
+
+			for sig in (SIGINT, SIGTERM):
+				loop.remove_signal_handler(sig)
+
+			if fetch and not fetch.done():
+				fetch.cancel()
+				try:
+					await fetch
+				except asyncio.CancelledError:
+					pass
+
+			for p in pending:
+				try:
+					await p
+				except Exception as e:
+					report_exception(self._ampel_db, logger, exc=e)
+
+			executor.shutdown()
+			updates_buffer.stop()
+			self._finish_run()
+
+		if self.exit_if_no_alert and iter_count == 0:
+			sys.exit(self.exit_if_no_alert)
+
+		# Return number of processed alerts
+		return iter_count
@@ -90,3 +90,9 @@ class BaseAlertSupplier(AbsAlertSupplier, abstract=True):
 	def set_logger(self, logger: AmpelLogger) -> None:
 		self.logger = logger
 		self.alert_loader.set_logger(logger)
+
+	def get_checkpoint(self) -> None | dict[str, Any]:
+		return self.alert_loader.get_checkpoint()
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		self.alert_loader.set_checkpoint(checkpoint)
@@ -7,22 +7,33 @@
 # Last Modified Date:  24.11.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
+from time import perf_counter
 from logging import LogRecord
+from functools import partial
 from typing import Any, cast
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Sequence
 from ampel.types import ChannelId, StockId
 from ampel.core.AmpelContext import AmpelContext
 from ampel.model.ingest.FilterModel import FilterModel
 from ampel.log.AmpelLogger import AmpelLogger, INFO
 from ampel.log.handlers.EnclosedChanRecordBufHandler import EnclosedChanRecordBufHandler
 from ampel.log.handlers.ChanRecordBufHandler import ChanRecordBufHandler
+from ampel.log.handlers.RecordBufferingHandler import RecordBufferingHandler
 from ampel.log.LightLogRecord import LightLogRecord
 from ampel.log.LogFlag import LogFlag
 from ampel.protocol.LoggingHandlerProtocol import LoggingHandlerProtocol
 from ampel.abstract.AbsAlertFilter import AbsAlertFilter
 from ampel.abstract.AbsAlertRegister import AbsAlertRegister
-from ampel.alert.AlertConsumerMetrics import stat_accepted, stat_rejected, stat_autocomplete, stat_time
+from ampel.alert.StockIndex import StockIndex
+from ampel.alert.FilterVerdictCache import FilterVerdictCache
+from ampel.alert.SharedFilter import SharedFilter
+from ampel.alert.FilterBudget import FilterBudget
+from ampel.alert.AlertFeatures import AlertFeatures
+from ampel.alert.AlertConsumerMetrics import stat_accepted, stat_rejected, stat_autocomplete, \
+	sampled_timer, MetricsBuffer
 from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.log.AmpelLoggingError import AmpelLoggingError
+from pymongo.errors import PyMongoError
 
 
 def no_filter(alert: Any) -> bool:
@@ -40,7 +51,7 @@ class FilterBlock:
 	__slots__ = '__dict__', 'logger', 'channel', 'context', \
 		'chan_str', 'min_log_msg', 'filter_func', 'ac', 'overrule', \
 		'bypass', 'update_rej', 'rej_log_handler', 'rej_log_handle', \
-		'file', 'log', 'forward', 'buffer', 'buf_hdlr', 'stock_ids'
+		'file', 'log', 'forward', 'forward_rej', 'buffer', 'buf_hdlr', 'stock_ids'
 
 
 	def __init__(self,
@@ -51,7 +62,14 @@ class FilterBlock:
 		process_name: str,
 		logger: AmpelLogger,
 		check_new: bool = False,
-		embed: bool = False
+		embed: bool = False,
+		timing_sample: int = 1,
+		compact_index: bool = False,
+		verdict_cache: None | str = None,
+		shared: 'None | FilterBlock' = None,
+		shared_memo_size: int = 1,
+		budget: None | dict[str, Any] = None,
+		features: None | AlertFeatures = None
 	) -> None:
 		"""
 		:param index: index of the parent AlertConsumerDirective used for creating this FilterBlock
@@ -62,6 +80,16 @@ class FilterBlock:
 		:param process_name: associated T0 process name (as defined in the ampel conf)
 		:param embed: use compact logging (channel embedded in messages).
 		Produces fewer (and bigger) log documents.
+		:param timing_sample: time one register/rejected log operation out of timing_sample (0: no timing)
+		:param compact_index: hold the stock ids used for "auto complete" in a
+		:class:`~ampel.alert.StockIndex.StockIndex` instead of a set (lower memory usage, slower lookups)
+		:param verdict_cache: folder of the :class:`~ampel.alert.FilterVerdictCache.FilterVerdictCache`
+		files (filter results are then only computed for alerts unknown to the cache)
+		:param shared: filter block with an identical filter model whose filter unit should be
+		shared with this block (see :class:`~ampel.alert.SharedFilter.SharedFilter`)
+		:param shared_memo_size: see :class:`~ampel.alert.SharedFilter.SharedFilter`
+		:param budget: parameters of the :class:`~ampel.alert.FilterBudget.FilterBudget` of the filter unit
+		:param features: feature cache shared by the filter units (see :func:`AbsAlertFilter.get_feature`)
 		"""
 
 		self._stock_col = context.db.get_collection('stock')
@@ -77,44 +105,93 @@ class FilterBlock:
 		self._stat_accepted = stat_accepted.labels(self.chan_str)
 		self._stat_rejected = stat_rejected.labels(self.chan_str)
 		self._stat_autocomplete = stat_autocomplete.labels(self.chan_str)
-		self._stat_time = stat_time.labels(f"filter.{self.chan_str}")
+		self.timing_sample = timing_sample
 
 		self.check_new = check_new
+		self.compact_index = compact_index
 		self.rej = self.idx, False
-		self.stock_ids: set[StockId] = set()
+		self.stock_ids: set[StockId] | StockIndex = set()
+		self.shared_filter: None | SharedFilter = None
+		self.unit_instance: AbsAlertFilter
+		self.unit_logger: AmpelLogger
+		self.filter_func: Callable[[AmpelAlertProtocol], Any]
 
 		if filter_model:
 
 			# Minimal log entry in case filter does not log anything
 			self.min_log_msg = {'c': self.channel} if embed else None
 
-			# Instantiate/get filter class associated with this channel
-			logger.info(f"Loading filter: {filter_model.unit}", extra={'c': self.channel})
-
 			self.buf_hdlr: EnclosedChanRecordBufHandler | ChanRecordBufHandler = \
 				EnclosedChanRecordBufHandler(logger.level, self.channel) if embed \
 				else ChanRecordBufHandler(logger.level, self.channel)
 
-			self.unit_instance = context.loader.new_logical_unit(
-				model = filter_model,
-				sub_type = AbsAlertFilter,
-				logger = AmpelLogger.get_logger(
+			self.forward = self.buf_hdlr.forward # type: ignore
+			self.verdict_cache: None | FilterVerdictCache = None
+
+			if shared:
+
+				logger.info(
+					f"Sharing filter {filter_model.unit} with channel {shared.channel}",
+					extra={'c': self.channel}
+				)
+
+				self.unit_instance = shared.unit_instance
+				self.unit_logger = shared.unit_logger
+				if shared.shared_filter is None:
+					shared.shared_filter = SharedFilter(shared.filter_func, shared.unit_logger, shared_memo_size)
+					shared.filter_func = shared.shared_filter.wrap(shared.buf_hdlr)
+					shared.batch_func = None
+
+				self.shared_filter = shared.shared_filter
+				self.filter_func = self.shared_filter.wrap(self.buf_hdlr)
+
+			else:
+
+				# Instantiate/get filter class associated with this channel
+				logger.info(f"Loading filter: {filter_model.unit}", extra={'c': self.channel})
+
+				self.unit_logger = AmpelLogger.get_logger(
 					name = "buf_" + self.chan_str,
 					base_flag = (getattr(logger, 'base_flag', 0) & ~LogFlag.CORE) | LogFlag.UNIT,
 					console = False,
 					handlers = [self.buf_hdlr]
 				)
-			)
 
-			# Log entries potentially logged by filter post_init method
-			if self.buf_hdlr.buffer:
-				self.buf_hdlr.forward(logger)
-				self.buf_hdlr.buffer = []
+				self.unit_instance = context.loader.new_logical_unit(
+					model = filter_model,
+					sub_type = AbsAlertFilter,
+					logger = self.unit_logger
+				)
+
+				# Log entries potentially logged by filter post_init method
+				if self.buf_hdlr.buffer:
+					self.buf_hdlr.forward(logger)
+					self.buf_hdlr.buffer = []
+
+				self.unit_instance._features = features
+				self.filter_func = self.unit_instance.process
 
-			self.forward = self.buf_hdlr.forward # type: ignore
 			self.buffer = self.buf_hdlr.buffer
 
-			self.filter_func = self.unit_instance.process
+			if verdict_cache and not shared:
+				self.verdict_cache = FilterVerdictCache.for_filter(context, filter_model, verdict_cache)
+				self.filter_func = self.verdict_cache.wrap(self.filter_func)
+				logger.info(
+					f"Loaded {len(self.verdict_cache)} cached filter verdicts from {self.verdict_cache.path}",
+					extra={'c': self.channel}
+				)
+
+			self.budget: None | FilterBudget = None
+			if budget:
+				self.budget = FilterBudget(self.channel, **budget)
+				self.filter_func = self.budget.wrap(self.filter_func)
+
+			# Batched evaluation if implemented natively by the unit (results are not cached/shared/budgeted)
+			self.batch_func: None | Callable[[Sequence[AmpelAlertProtocol]], Sequence[None | bool | int]] = \
+				self.unit_instance.process_batch \
+				if type(self.unit_instance).process_batch is not AbsAlertFilter.process_batch \
+				and not (shared or self.shared_filter or self.verdict_cache or self.budget) \
+				else None
 
 			if osm := filter_model.on_stock_match:
 				self.overrule = self.idx, osm in ['overrule', 'silent_overrule']
@@ -127,137 +204,316 @@ class FilterBlock:
 
 			self.rej_log_handle: None | Callable[[LightLogRecord | LogRecord], None] = None
 			self.rej_log_handler: None | LoggingHandlerProtocol = None
+			self.forward_rej: None | Callable[..., None] = None
 			self.file: None | Callable[[AmpelAlertProtocol, None | int], None] = None
 			self.register: None | AbsAlertRegister = None
 		else:
 			self.filter_func = no_filter
+			self.batch_func = None
 			self.bypass = self.idx, False
 			self.overrule = self.idx, False
 
 
 	def filter(self, alert: AmpelAlertProtocol) -> tuple[int, int | bool | None]:
 
-		with self._stat_time.time():
+		if self.bypass[1] and alert.stock in self.stock_ids: # type: ignore[operator]
+			return self.bypass
+
+		# Apply filter (returns None/False in case of rejection or True/int in case of match)
+		res = self.filter_func(alert)
+
+		# Filter accepted alert
+		if res and res > 0:
+			return self._accept(alert, res)
+
+		# Filter rejected alert
+		return self._reject(alert, res)
+
+
+	def _filter_verdict(self, alert: AmpelAlertProtocol, res: None | bool | int) -> tuple[int, int | bool | None]:
+		""" Counterpart of :func:`filter` for a result computed beforehand (see :func:`process_batch`) """
+
+		if self.bypass[1] and alert.stock in self.stock_ids: # type: ignore[operator]
+			return self.bypass
+
+		if res and res > 0:
+			return self._accept(alert, res)
 
-			if self.bypass[1] and alert.stock in self.stock_ids: # type: ignore[operator]
-				return self.bypass
+		return self._reject(alert, res)
 
-			# Apply filter (returns None/False in case of rejection or True/int in case of match)
-			res = self.filter_func(alert)
 
-			# Filter accepted alert
-			if res and res > 0:
+	def _reject(self, alert: AmpelAlertProtocol, res: None | bool | int) -> tuple[int, int | bool | None]:
 
-				self._stat_accepted.inc()
+		self._stat_rejected.inc()
+
+		# 'overrule' or 'silent_overrule' requested for this filter
+		if self.overrule and alert.stock in self.stock_ids:
+
+			extra_ac = {'a': alert.id, 'ac': True, 's': alert.stock, 'c': self.channel}
+
+			# Main logger feedback
+			self.log(INFO, None, extra=extra_ac)
+
+			# Update count
+			self._stat_autocomplete.inc()
+
+			# Rejected alerts notifications can go to rejected log collection
+			# even though it was "auto-completed" because it
+			# was actually rejected by the filter/channel
+			if self.update_rej:
 
-				# Write log entries to main logger
-				# (note: log records already contain chan info)
 				if self.buffer:
-					self.forward(self.logger, stock=alert.stock, extra={'a': alert.id})
+					if self.forward_rej:
+						# Clears the buffer
+						self.forward_rej(stock=alert.stock, extra=extra_ac)
+					else:
+						self.buffer.clear()
 
 				# Log minimal entry if channel did not log anything
 				else:
-					extra = {'a': alert.id, 's': alert.stock}
-					if self.min_log_msg: # embed is True
-						self.log(INFO, self.min_log_msg if isinstance(res, bool) \
-							else {'c': self.channel, 'g': res}, extra=extra)
-					else:
-						extra['c'] = self.channel
-						self.log(INFO, None, extra=extra)
-
-				# stock_id 'exists' if filter bypass/overrule(s) or check_new is requested
-				if self.stock_ids:
-					if alert.stock in self.stock_ids:
-						if self.check_new:
-							return -self.idx, res
-					else:
-						self.stock_ids.add(alert.stock)
+					if self.rej_log_handle:
+						lrec = LightLogRecord(0, 0, None)
+						lrec.stock = alert.stock
+						lrec.extra = extra_ac
+						self.rej_log_handle(lrec)
 
-				return self.idx, res
+				if self.file:
+					self.file(alert, res)
 
-			# Filter rejected alert
-			else:
+			# Use default t2 units (no group) as filter results
+			return self.overrule
+
+		else:
+
+			if self.buffer:
+				self._forward_rejected_logs(alert)
+
+			if self.file:
+				self.file(alert, res)
 
-				self._stat_rejected.inc()
+			# return rejection result
+			return self.rej
+
+
+	def _forward_rejected_logs(self, alert: AmpelAlertProtocol) -> None:
+		""" Routes the log records produced by the filter unit for a rejected alert (buffer must not be empty) """
+
+		# Save possibly existing error to 'main' logs
+		if self.buf_hdlr.has_error:
+			self.forward(
+				self.logger, stock=alert.stock, extra={'a': alert.id},
+				clear=not self.rej_log_handler
+			)
+
+		if self.forward_rej:
+			# Send rejected logs to dedicated separate logger/handler
+			self.forward_rej(stock=alert.stock, extra={'a': alert.id})
+
+		# Records must not be forwarded along with the records of the next alert
+		else:
+			self.buffer.clear()
+
+
+	def _accept(self, alert: AmpelAlertProtocol, res: int | bool) -> tuple[int, int | bool | None]:
+
+		self._stat_accepted.inc()
+
+		# Write log entries to main logger
+		# (note: log records already contain chan info)
+		if self.buffer:
+			self.forward(self.logger, stock=alert.stock, extra={'a': alert.id})
+
+		# Log minimal entry if channel did not log anything
+		else:
+			extra = {'a': alert.id, 's': alert.stock}
+			if self.min_log_msg: # embed is True
+				self.log(INFO, self.min_log_msg if isinstance(res, bool) \
+					else {'c': self.channel, 'g': res}, extra=extra)
+			else:
+				extra['c'] = self.channel
+				self.log(INFO, None, extra=extra)
+
+		# stock_id 'exists' if filter bypass/overrule(s) or check_new is requested
+		if self.stock_ids:
+			if alert.stock in self.stock_ids:
+				if self.check_new:
+					return -self.idx, res
+			else:
+				self.stock_ids.add(alert.stock)
 
-				# 'overrule' or 'silent_overrule' requested for this filter
-				if self.overrule and alert.stock in self.stock_ids:
+		return self.idx, res
 
-					extra_ac = {'a': alert.id, 'ac': True, 's': alert.stock, 'c': self.channel}
 
-					# Main logger feedback
-					self.log(INFO, None, extra=extra_ac)
+	def _filter_reject_fast(self, alert: AmpelAlertProtocol) -> tuple[int, int | bool | None]:
+		"""
+		Replaces :func:`filter` (see :func:`ready`) for filter blocks without rejected logs handler,
+		alert register, auto complete or check_new. Plain rejections allocate nothing
+		(the rejected alerts counter is accumulated locally if aggregated metrics are enabled, see :func:`buffer_metrics`).
+		Log records are handled as in :func:`_reject` (see :func:`_forward_rejected_logs`).
+		"""
 
-					# Update count
-					self._stat_autocomplete.inc()
+		res = self.filter_func(alert)
+		if res and res > 0:
+			return self._accept(alert, res)
 
-					# Rejected alerts notifications can go to rejected log collection
-					# even though it was "auto-completed" because it
-					# was actually rejected by the filter/channel
-					if self.update_rej:
+		self._stat_rejected.inc()
 
-						if self.buffer:
-							if self.rej_log_handler:
-								# Clears the buffer
-								self.forward(self.rej_log_handler, stock=alert.stock, extra=extra_ac)
-							else:
-								self.buffer.clear()
+		if self.buffer:
+			self._forward_rejected_logs(alert)
 
-						# Log minimal entry if channel did not log anything
-						else:
-							if self.rej_log_handle:
-								lrec = LightLogRecord(0, 0, None)
-								lrec.stock = alert.stock
-								lrec.extra = extra_ac
-								self.rej_log_handle(lrec)
+		return self.rej
 
-						if self.file:
-							self.file(alert, res)
 
-					# Use default t2 units (no group) as filter results
-					return self.overrule
+	def filter_alerts(self,
+		alerts: Sequence[AmpelAlertProtocol],
+		observe: None | Callable[[float], None] = None
+	) -> tuple[list[tuple[int, int | bool | None]], dict[int, tuple[Exception, list[LogRecord | LightLogRecord]]]]:
+		"""
+		Applies :func:`filter` to each alert without raising, so that it can run in a worker thread.
+		Alerts are evaluated at once by the filter unit if it implements process_batch natively
+		(see :func:`process_batch`).
+
+		:param observe: time each filter call (or batch evaluation) using this callback
+		:returns: filter results and exceptions keyed by alert index, along with the log records
+		buffered by the filter while processing the failing alert.
+		Iteration stops after an unrecoverable (PyMongoError, AmpelLoggingError) error.
+		"""
 
+		ret: list[tuple[int, int | bool | None]] = []
+		errors: dict[int, tuple[Exception, list[LogRecord | LightLogRecord]]] = {}
+		verdicts = self.process_batch(alerts, observe) if self.batch_func and len(alerts) > 1 else None
+
+		for i, alert in enumerate(alerts):
+			try:
+				if verdicts is not None:
+					ret.append(self._filter_verdict(alert, verdicts[i]))
+				elif observe:
+					start = perf_counter()
+					ret.append(self.filter(alert))
+					observe(perf_counter() - start)
+				else:
+					ret.append(self.filter(alert))
+			except Exception as e:
+				ret.append(self.rej)
+				if self.filter_model:
+					errors[i] = e, list(self.buffer)
+					self.buffer.clear()
 				else:
+					errors[i] = e, []
+				if isinstance(e, (PyMongoError, AmpelLoggingError)):
+					break
+
+		return ret, errors
+
+
+	def process_batch(self,
+		alerts: Sequence[AmpelAlertProtocol],
+		observe: None | Callable[[float], None] = None
+	) -> None | list[None | bool | int]:
+		"""
+		Evaluates the filter unit for the provided alerts using its process_batch method
+		(alerts bypassing the filter, see on_stock_match, are not evaluated and get None).
+		Log records emitted by the unit cannot be associated with individual alerts: if any,
+		batched evaluation is disabled and the alerts are evaluated individually (by :func:`filter`,
+		which routes the records of each alert according to its result).
+
+		:returns: None if the evaluation failed or emitted log records (alerts must then be evaluated
+		individually, which isolates the failing ones)
+		"""
+
+		assert self.batch_func is not None
+		if self.bypass[1]:
+			idx = [i for i, alert in enumerate(alerts) if alert.stock not in self.stock_ids] # type: ignore[operator]
+			todo: Sequence[AmpelAlertProtocol] = [alerts[i] for i in idx]
+		else:
+			todo = alerts
+
+		start = perf_counter()
+		try:
+			res = self.batch_func(todo)
+			if len(res) != len(todo):
+				raise ValueError(f"process_batch returned {len(res)} results for {len(todo)} alerts")
+		except Exception as e:
+			# Records are emitted again by the individual evaluation
+			self.buffer.clear()
+			self.logger.warn(f"Batch evaluation failed ({e!r}), evaluating alerts individually", extra={'c': self.channel})
+			return None
+
+		if self.buffer:
+			self.buffer.clear()
+			self.batch_func = None
+			self.logger.info(
+				"Filter unit emits log records, evaluating alerts individually from now on",
+				extra={'c': self.channel}
+			)
+			return None
+
+		if observe:
+			observe(perf_counter() - start)
+
+		if todo is alerts:
+			return list(res)
 
-					if self.buffer:
+		ret: list[None | bool | int] = [None] * len(alerts)
+		for i, r in zip(idx, res):
+			ret[i] = r
+		return ret
 
-						# Save possibly existing error to 'main' logs
-						if self.buf_hdlr.has_error:
-							self.forward(
-								self.logger, stock=alert.stock, extra={'a': alert.id},
-								clear=not self.rej_log_handler
-							)
 
-						if self.rej_log_handler:
-							# Send rejected logs to dedicated separate logger/handler
-							self.forward(self.rej_log_handler, stock=alert.stock, extra={'a': alert.id})
+	def buffer_metrics(self, metrics: MetricsBuffer) -> None:
+		""" Accumulates the alert counters of this filter block locally (published by `metrics`) """
+		self._stat_accepted = metrics.counter(stat_accepted.labels(self.chan_str)) # type: ignore[assignment]
+		self._stat_rejected = metrics.counter(stat_rejected.labels(self.chan_str)) # type: ignore[assignment]
+		self._stat_autocomplete = metrics.counter(stat_autocomplete.labels(self.chan_str)) # type: ignore[assignment]
 
-					if self.file:
-						self.file(alert, res)
 
-					# return rejection result
-					return self.rej
+	def uses_stock_ids(self) -> bool:
+		""" :returns: whether the ids of the stocks associated with this channel are required (auto complete, check_new) """
+		return self.bypass[1] or self.overrule[1] or self.check_new
 
 
-	def ready(self, logger: AmpelLogger, run_id: int) -> None:
+	def new_stock_ids(self, stocks: Iterable[StockId] = ()) -> set[StockId] | StockIndex:
+		return StockIndex(stocks) if self.compact_index else set(stocks)
+
+
+	def ready(self,
+		logger: AmpelLogger, run_id: int, buffer_logs: bool = False,
+		stock_ids: None | set[StockId] | StockIndex = None
+	) -> None:
 		"""
 		Dependending on channel settings, this method might:
 		- Builds set of transient ids for "auto complete"
 		- open an alert register for rejected alerts.
 		- instantiate a logging handler for rejected logs
+
+		:param buffer_logs: keep log records destined to the main logger in a buffer
+		(which must be emptied using :func:`flush_logs`). Required if filter blocks run concurrently.
+		:param stock_ids: ids of the stocks associated with this channel, loaded from the stock collection
+		if None and required (see :func:`uses_stock_ids`)
 		"""
 
-		self.logger = logger
-		self.log = logger.log
+		if buffer_logs:
+			self.log_buffer: None | RecordBufferingHandler = RecordBufferingHandler(logger.level)
+			self.logger = AmpelLogger(
+				name = logger.name,
+				base_flag = LogFlag(logger.base_flag),
+				handlers = [self.log_buffer],
+				console = False
+			)
+		else:
+			self.log_buffer = None
+			self.logger = logger
+
+		self.log = self.logger.log
 
-		if self.bypass[1] or self.overrule[1] or self.check_new:
+		if self.filter_model and self.budget:
+			self.budget.reset(self.logger)
 
-			# Build set of transient ids for this channel
-			self.stock_ids = {
-				el['stock'] for el in self._stock_col.find(
-					{'channel': self.channel}, {'stock': 1}
-				)
-			}
+		if stock_ids is not None:
+			self.stock_ids = stock_ids
+
+		elif self.uses_stock_ids():
+			self.stock_ids = self.load_stock_ids()
 
 		if self.filter_model and self.filter_model.reject:
 
@@ -281,7 +537,13 @@ class FilterBlock:
 					)
 
 				self.rej_log_handler.set_run_id(run_id) # type: ignore
-				self.rej_log_handle = self.rej_log_handler.handle
+				self.rej_log_handle = sampled_timer(
+					self.rej_log_handler.handle, f"rejected_log.{self.chan_str}", self.timing_sample
+				)
+				self.forward_rej = sampled_timer(
+					partial(self.forward, self.rej_log_handler),
+					f"rejected_log.{self.chan_str}", self.timing_sample
+				)
 
 			if 'register' in self.filter_model.reject:
 
@@ -294,17 +556,79 @@ class FilterBlock:
 					run_id = run_id
 				)
 
-				self.file = self.register.file
+				self.file = sampled_timer(
+					self.register.file, f"register.{self.chan_str}", self.timing_sample
+				)
+
+		# Select the rejection fast path if rejected alerts require no processing
+		if self.filter_model and not (self.rej_log_handler or self.register or self.uses_stock_ids()):
+			self.filter = self._filter_reject_fast # type: ignore[method-assign]
+		else:
+			self.__dict__.pop('filter', None)
+
+
+	def load_stock_ids(self,
+		since: None | float = None,
+		stock_ids: None | set[StockId] | StockIndex = None
+	) -> set[StockId] | StockIndex:
+		"""
+		Builds set of transient ids for this channel
+
+		:param since: only load stocks tied to this channel since the provided time
+		:param stock_ids: add the loaded ids to this set/index rather than to a new one
+		"""
+
+		query: dict[str, Any] = {'channel': self.channel}
+		if since is not None:
+			query[f'ts.{self.channel}.tied'] = {'$gte': since}
+
+		stocks = (el['stock'] for el in self._stock_col.find(query, {'stock': 1, '_id': 0}))
+		if stock_ids is None:
+			return self.new_stock_ids(stocks)
+
+		# StockIndex.add does not trigger merges (which would copy memory-mapped snapshots) for small updates
+		for stock in stocks:
+			stock_ids.add(stock)
+		return stock_ids
+
+
+	def flush_logs(self, logger: AmpelLogger) -> None:
+		""" Hands records buffered while buffer_logs is active over to the provided logger """
+		if self.log_buffer and self.log_buffer.buffer:
+			for rec in self.log_buffer.buffer:
+				logger.handle(rec)
+			self.log_buffer.flush()
+
+
+	def flush(self) -> None:
+		""" Writes rejected logs and register records buffered so far (handlers and registers remain open) """
+
+		if self.filter_model and self.filter_model.reject:
+
+			if self.rej_log_handler:
+				self.rej_log_handler.flush()
+
+			if self.register:
+				self.register.flush()
 
 
 	def done(self) -> None:
 
+		if self.filter_model and self.verdict_cache:
+			self.verdict_cache.flush()
+
+		if self.shared_filter:
+			self.shared_filter.clear()
+
 		if self.filter_model and self.filter_model.reject:
 
 			if self.rej_log_handler:
 				self.rej_log_handler.flush()
 				self.rej_log_handler = None
+				self.rej_log_handle = None
+				self.forward_rej = None
 
 			if self.register:
 				self.register.close()
 				self.register = None
+				self.file = None
@@ -7,9 +7,18 @@
 # Last Modified Date:  21.05.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from typing import Union
-from collections.abc import Sequence
+import os
+from time import time
+from typing import Any, Union
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from ampel.types import ChannelId, StockId
 from ampel.alert.FilterBlock import FilterBlock
+from ampel.alert.AlertFeatures import AlertFeatures
+from ampel.alert.StockIndex import StockIndex
+from ampel.alert.FilterVerdictCache import get_filter_hash
+from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter
+from ampel.alert.filter.SharedCriteria import SharedCriteria
 from ampel.core.AmpelContext import AmpelContext
 from ampel.log.AmpelLogger import AmpelLogger
 from ampel.model.ingest.IngestDirective import IngestDirective
@@ -75,18 +84,76 @@ class FilterBlocksHandler:
 		context: AmpelContext, logger: AmpelLogger,
 		directives: Sequence[IngestDirective | DualIngestDirective],
 		process_name: str,
-		db_log_format: str = "standard"
+		db_log_format: str = "standard",
+		timing_sample: int = 1,
+		compact_index: bool = False,
+		stock_scan_threads: int = 0,
+		incremental_refresh: bool = False,
+		reload_interval: None | float = None,
+		snapshot_dir: None | str = None,
+		snapshot_interval: float = 3600.,
+		verdict_cache: None | str = None,
+		share_filters: bool = False,
+		shared_memo_size: int = 1,
+		filter_budget: None | dict[str, Any] = None,
+		share_criteria: bool = False
 	) -> None:
 		"""
+		:param timing_sample: see :class:`~ampel.alert.FilterBlock.FilterBlock`
+		:param compact_index: see :class:`~ampel.alert.FilterBlock.FilterBlock`
+		:param stock_scan_threads: see :func:`load_stock_ids`
+		:param incremental_refresh: keep the stock ids of filter blocks across calls to :func:`ready`
+		and only load the stocks tied to the channels since the previous call (using the stock document
+		fields ts.<channel>.tied). Note that stocks removed from a channel are only detected by a full reload.
+		:param reload_interval: if incremental_refresh is used, time in seconds after which
+		a full reload is performed anyway (None: never)
+		:param snapshot_dir: folder where the stock ids of each channel are saved
+		(see :func:`~ampel.alert.StockIndex.StockIndex.save`, implies compact_index).
+		The first call to :func:`ready` loads the available snapshots (memory-mapped)
+		and then only the stocks tied to the channels since the snapshots were saved.
+		:param snapshot_interval: minimum time in seconds between two snapshot saves (performed by :func:`ready`)
+		:param verdict_cache: see :class:`~ampel.alert.FilterBlock.FilterBlock`
+		:param share_filters: directives with identical filter models (same unit, resolved config
+		and unit source, see :func:`~ampel.alert.FilterVerdictCache.get_filter_hash`) share a single
+		filter unit instance, evaluated once per alert (see :class:`~ampel.alert.SharedFilter.SharedFilter`).
+		The parameters 'reject' and 'on_stock_match' of the filter models may differ.
+		:param shared_memo_size: see :class:`~ampel.alert.SharedFilter.SharedFilter`
+		:param filter_budget: parameters of the :class:`~ampel.alert.FilterBudget.FilterBudget` of each
+		filter unit. Parameters specific to a channel can be provided using the key 'channels'
+		(ex: {"call_limit": 0.01, "channels": {"HU_SLOW": {"call_limit": 0.1}}})
+		:param share_criteria: BasicMultiFilter instances (of different channels) evaluate their conditions
+		using criteria masks computed once per alert (see :class:`~ampel.alert.filter.SharedCriteria.SharedCriteria`)
 		:raises: ValueError if no process can be loaded or if a process is
 		associated with an unknown channel
 		"""
 
 		embed = db_log_format == "compact"
+		self.stock_scan_threads = stock_scan_threads
+		self.incremental_refresh = incremental_refresh
+		self.reload_interval = reload_interval
+		self.snapshot_dir = snapshot_dir
+		self.snapshot_interval = snapshot_interval
+		self._loaded: None | float = None
+		self._refreshed: None | float = None
+		self._saved: None | float = None
+		self._stock_col = context.db.get_collection('stock')
 
 		# Create FilterBlock instances (instantiates channel filter and loggers)
-		self.filter_blocks = [
-			FilterBlock(
+		self.filter_blocks: list[FilterBlock] = []
+		shared: dict[str, FilterBlock] = {}
+
+		#: Derived alert quantities shared by filter units (cleared by the AlertConsumer once a batch is filtered)
+		self.features = AlertFeatures(shared_memo_size)
+
+		for i, model in enumerate(directives):
+
+			key = get_filter_hash(context, model.filter) if share_filters and model.filter else None
+			budget = None
+			if filter_budget is not None:
+				budget = {k: v for k, v in filter_budget.items() if k != 'channels'} | \
+					filter_budget.get('channels', {}).get(model.channel, {})
+
+			fb = FilterBlock(
 				i,
 				context,
 				channel = model.channel,
@@ -94,10 +161,30 @@ class FilterBlocksHandler:
 				process_name = process_name,
 				logger = logger,
 				check_new = isinstance(model, DualIngestDirective),
-				embed = embed
+				embed = embed,
+				timing_sample = timing_sample,
+				compact_index = compact_index or bool(snapshot_dir),
+				verdict_cache = verdict_cache,
+				shared = shared.get(key) if key else None,
+				shared_memo_size = shared_memo_size,
+				budget = budget,
+				features = self.features
 			)
-			for i, model in enumerate(directives)
-		]
+
+			if key and key not in shared:
+				shared[key] = fb
+			self.filter_blocks.append(fb)
+
+		self.shared_criteria: None | SharedCriteria = None
+		if share_criteria:
+			units = {
+				id(fb.unit_instance): fb.unit_instance for fb in self.filter_blocks
+				if fb.filter_model and isinstance(fb.unit_instance, BasicMultiFilter)
+			}
+			if len(units) > 1:
+				self.shared_criteria = SharedCriteria(shared_memo_size)
+				n = sum(unit.share_criteria(self.shared_criteria) for unit in units.values())
+				logger.info(f"{n} filters share {len(self.shared_criteria) - 1} distinct criteria")
 
 		# Robustness
 		if len(self.filter_blocks) == 0:
@@ -138,11 +225,160 @@ class FilterBlocksHandler:
 		"""
 
 
-	def ready(self, logger: 'AmpelLogger', run_id: int) -> None:
+	#: Stocks tied to a channel less than `refresh_margin` seconds before the previous refresh
+	#: are loaded again by incremental refreshes (stock documents are written some time after
+	#: their ts.<channel>.tied field was computed, possibly by other processes)
+	refresh_margin: float = 60.
+
+
+	def ready(self, logger: 'AmpelLogger', run_id: int, buffer_logs: bool = False) -> None:
+
+		now = time()
+
+		if self.incremental_refresh and self._refreshed is not None and not (
+			self.reload_interval is not None and now - self._loaded > self.reload_interval # type: ignore[operator]
+		):
+			stock_ids = self.load_stock_ids(since=self._refreshed - self.refresh_margin, update=True)
+
+		elif self.snapshot_dir and self._refreshed is None:
+			stock_ids = self.load_snapshots(logger)
+			self._loaded = now
+
+		else:
+			stock_ids = self.load_stock_ids()
+			self._loaded = now
+			self._saved = None
+
+		self._refreshed = now
+
+		for fb in self.filter_blocks:
+			fb.ready(logger, run_id, buffer_logs, stock_ids.get(fb.idx))
+
+		if self.snapshot_dir and (self._saved is None or now - self._saved > self.snapshot_interval):
+			self.save_snapshots(now)
+
+
+	def get_snapshot_path(self, fb: FilterBlock) -> str:
+		return os.path.join(self.snapshot_dir, f"{fb.chan_str}.idx") # type: ignore[arg-type]
+
+
+	def load_snapshots(self, logger: 'AmpelLogger') -> dict[int, set[StockId] | StockIndex]:
+		"""
+		Loads the stock ids of the filter blocks requiring them from snapshot files if available
+		(along with the stocks tied to their channels since the snapshots were saved), from the DB otherwise.
+		"""
+
+		snaps: list[FilterBlock] = []
+		since: None | float = None
+
+		for fb in self.filter_blocks:
+
+			if not fb.uses_stock_ids() or not os.path.exists(path := self.get_snapshot_path(fb)):
+				continue
+
+			try:
+				fb.stock_ids, ts = StockIndex.load(path)
+			except (OSError, ValueError) as e:
+				logger.warn(f"Ignoring stock snapshot {path}: {e}")
+				continue
+
+			logger.info(f"Loaded {len(fb.stock_ids)} stock ids from {path}", extra={'c': fb.channel})
+			snaps.append(fb)
+			since = ts if since is None else min(since, ts)
+
+		stock_ids = self.load_stock_ids(
+			fbs = [fb for fb in self.filter_blocks if fb.uses_stock_ids() and fb not in snaps]
+		)
+
+		if snaps:
+			stock_ids.update(
+				self.load_stock_ids(since=since - self.refresh_margin, update=True, fbs=snaps) # type: ignore[operator]
+			)
+
+		return stock_ids
+
+
+	def save_snapshots(self, ts: float) -> None:
+		""" :param ts: time of the last refresh of the stock ids """
+		os.makedirs(self.snapshot_dir, exist_ok=True) # type: ignore[arg-type]
+		for fb in self.filter_blocks:
+			if fb.uses_stock_ids() and isinstance(fb.stock_ids, StockIndex):
+				fb.stock_ids.save(self.get_snapshot_path(fb), ts)
+		self._saved = ts
+
+
+	def load_stock_ids(self,
+		since: None | float = None, update: bool = False,
+		fbs: None | Sequence[FilterBlock] = None
+	) -> dict[int, set[StockId] | StockIndex]:
+		"""
+		Loads the ids of the stocks associated with the channels of the filter blocks requiring them
+		(see :func:`~ampel.alert.FilterBlock.FilterBlock.uses_stock_ids`).
+		By default, a single query ({'channel': {'$in': [...]}}) scans the stock collection once for all channels.
+		If `stock_scan_threads` is set, one query per channel is run instead, concurrently using as many threads.
+
+		:param since: only load stocks tied to the channels since the provided time
+		:param update: add the loaded ids to the current stock ids of the filter blocks
+		:param fbs: filter blocks to consider (default: all filter blocks requiring stock ids)
+		:returns: stock ids keyed by filter block index
+		"""
+
+		if fbs is None:
+			fbs = [fb for fb in self.filter_blocks if fb.uses_stock_ids()]
+
+		if not fbs:
+			return {}
+
+		if self.stock_scan_threads:
+			with ThreadPoolExecutor(self.stock_scan_threads, thread_name_prefix="StockScan") as executor:
+				return dict(
+					zip(
+						[fb.idx for fb in fbs],
+						executor.map(
+							lambda fb: fb.load_stock_ids(since, fb.stock_ids if update else None), fbs
+						)
+					)
+				)
+
+		ret: dict[int, set[StockId] | StockIndex] = {}
+		adders: dict[ChannelId, list[Callable[[StockId], None]]] = {}
+		for fb in fbs:
+			ret[fb.idx] = ids = fb.stock_ids if update else fb.new_stock_ids()
+			adders.setdefault(fb.channel, []).append(
+				ids.append if isinstance(ids, StockIndex) and not update else ids.add
+			)
+
+		query: dict[str, Any] = {'channel': {'$in': list(adders)}}
+		if since is not None:
+			query = {
+				'$or': [
+					{'channel': chan, f'ts.{chan}.tied': {'$gte': since}}
+					for chan in adders
+				]
+			}
+
+		for el in self._stock_col.find(query, {'stock': 1, 'channel': 1, '_id': 0}):
+			for chan in el['channel'] if isinstance(el['channel'], (list, tuple)) else [el['channel']]:
+				if chan in adders:
+					for add in adders[chan]:
+						add(el['stock'])
+
+		if not update:
+			for ids in ret.values():
+				if isinstance(ids, StockIndex):
+					ids.merge()
+
+		return ret
+
+
+	def flush(self) -> None:
 		for fb in self.filter_blocks:
-			fb.ready(logger, run_id)
+			fb.flush()
 
 
 	def done(self) -> None:
 		for fb in self.filter_blocks:
 			fb.done()
+		if self.shared_criteria:
+			self.shared_criteria.clear()
+		self.features.clear()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/FilterBudget.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from time import time, thread_time
+from typing import Any
+from collections.abc import Callable
+from ampel.types import ChannelId
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.alert.AlertConsumerMetrics import stat_filter_overruns, stat_filter_quarantined
+
+
+class FilterBudget:
+	"""
+	CPU time budget of a filter unit (measured with time.thread_time, that is per thread).
+
+	- A call lasting more than `call_limit` seconds is an overrun: its result is replaced
+	  by `verdict` and the metric alertprocessor_filter_overruns is incremented.
+	- After `strikes` overruns, or once the filter used more than `run_limit` seconds during the current
+	  run, the filter is quarantined: it is not called anymore during `quarantine_time` seconds
+	  (None: until the end of the run) and alerts get `verdict` directly
+	  (counted by the metric alertprocessor_filter_quarantined).
+
+	Note that calls are not interrupted: the budget is checked once a call returns.
+	A quarantine thus bounds the cost of a filter which is repeatedly slow, not of a filter which never returns.
+	"""
+
+	def __init__(self,
+		channel: ChannelId,
+		call_limit: None | float = None,
+		run_limit: None | float = None,
+		verdict: bool = False,
+		strikes: int = 3,
+		quarantine_time: None | float = None
+	) -> None:
+		"""
+		:param call_limit: CPU time allowed per call in seconds (None: no limit)
+		:param run_limit: CPU time allowed per run in seconds (None: no limit)
+		:param verdict: filter result of the alerts whose evaluation overran or was skipped (False: rejection)
+		:param strikes: number of overruns (during a run) triggering a quarantine
+		:param quarantine_time: duration of quarantines in seconds (None: until the end of the run)
+		"""
+
+		if (call_limit is not None and call_limit <= 0) or (run_limit is not None and run_limit <= 0) or strikes < 1:
+			raise ValueError("Invalid filter budget parameters")
+
+		self.channel = channel
+		self.call_limit = call_limit
+		self.run_limit = run_limit
+		self.verdict = verdict
+		self.strikes = strikes
+		self.quarantine_time = quarantine_time
+		self._stat_overruns = stat_filter_overruns.labels(str(channel))
+		self._stat_quarantined = stat_filter_quarantined.labels(str(channel))
+		self.logger: None | AmpelLogger = None
+		self.reset()
+
+
+	def reset(self, logger: None | AmpelLogger = None) -> None:
+		""" Starts a new run (clears CPU time usage, overruns and quarantine) """
+		self.used = 0.
+		self.overruns = 0
+		self.quarantined: None | float = None
+		if logger:
+			self.logger = logger
+
+
+	def wrap(self, func: Callable[[AmpelAlertProtocol], Any]) -> Callable[[AmpelAlertProtocol], Any]:
+		""" :returns: function calling `func` within the budget """
+
+		verdict = self.verdict
+		call_limit = self.call_limit or float('inf')
+		run_limit = self.run_limit or float('inf')
+
+		def budgeted(alert: AmpelAlertProtocol) -> Any:
+
+			if self.quarantined is not None:
+				if self.quarantined > time():
+					self._stat_quarantined.inc()
+					return verdict
+				self.release()
+
+			start = thread_time()
+			res = func(alert)
+			elapsed = thread_time() - start
+			self.used += elapsed
+
+			if elapsed > call_limit:
+				self._stat_overruns.inc()
+				self.overruns += 1
+				if self.overruns >= self.strikes:
+					self.quarantine(f"{self.overruns} calls exceeded {self.call_limit}s")
+				return verdict
+
+			if self.used > run_limit:
+				self.quarantine(f"run budget of {self.run_limit}s exhausted")
+
+			return res
+
+		return budgeted
+
+
+	def quarantine(self, reason: str) -> None:
+		self.quarantined = float('inf') if self.quarantine_time is None else time() + self.quarantine_time
+		if self.logger:
+			self.logger.warn(
+				f"Quarantining filter ({reason})"
+				+ ("" if self.quarantine_time is None else f" for {self.quarantine_time}s"),
+				extra={'c': self.channel}
+			)
+
+
+	def release(self) -> None:
+		self.quarantined = None
+		self.overruns = 0
+		self.used = 0.
+		if self.logger:
+			self.logger.info("Filter quarantine ended", extra={'c': self.channel})
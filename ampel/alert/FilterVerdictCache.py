@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/FilterVerdictCache.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import os
+from struct import Struct
+from typing import Any
+from collections.abc import Callable
+from ampel.core.AmpelContext import AmpelContext
+from ampel.core.UnitLoader import UnitLoader
+from ampel.model.ingest.FilterModel import FilterModel
+from ampel.util.hash import build_unsafe_dict_id
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.alert.StockIndex import INT64_MIN, INT64_MAX, hash_stock
+
+#: alert id (or hash thereof), encoded verdict
+RECORD = Struct('=qi')
+
+#: encoded verdicts (other values are group ids)
+REJECTED = 0
+ACCEPTED = -2**31
+
+
+def get_filter_hash(context: AmpelContext, filter_model: FilterModel) -> str:
+	"""
+	:returns: hex digest of the filter unit name, of its resolved configuration and of the digest
+	of the unit source file (modifying the code of the unit thus invalidates cached verdicts as well)
+	"""
+	return build_unsafe_dict_id(
+		{
+			'unit': filter_model.unit,
+			'config': context.loader.get_init_config(filter_model.config, filter_model.override),
+			'digest': UnitLoader.get_digest(
+				context.loader.get_class_by_name(filter_model.unit)
+			)
+		},
+		ret = str
+	)
+
+
+class FilterVerdictCache:
+	"""
+	Persistent cache of the results of a filter unit, keyed by alert id.
+	Meant for reprocessing runs (archives re-run with unchanged filter configurations).
+
+	Verdicts are stored in the file <folder>/<unit>_<filter hash>.vc (see :func:`get_filter_hash`),
+	changing the filter configuration thus automatically results in a new (empty) cache.
+	Each verdict takes 12 bytes (alert id as int64, or 64 bits hash of non-integer ids, and int32 result).
+	New verdicts are appended to the file by :func:`flush`.
+
+	Rejections are cached as False (or as the negative rejection code returned by the unit)
+	and group ids beyond int32 are not cached.
+	"""
+
+	def __init__(self, path: str) -> None:
+
+		self.path = path
+		self._verdicts: dict[int, int] = {}
+		self._new = bytearray()
+		self.hits = 0
+
+		if os.path.exists(path):
+			with open(path, 'rb') as f:
+				data = f.read()
+			# Ignore truncated trailing record (interrupted write)
+			end = len(data) - len(data) % RECORD.size
+			self._verdicts = dict(RECORD.iter_unpack(memoryview(data)[:end]))
+
+
+	@classmethod
+	def for_filter(cls, context: AmpelContext, filter_model: FilterModel, folder: str) -> 'FilterVerdictCache':
+		os.makedirs(folder, exist_ok=True)
+		return cls(
+			os.path.join(folder, f"{filter_model.unit}_{get_filter_hash(context, filter_model)}.vc")
+		)
+
+
+	def __len__(self) -> int:
+		return len(self._verdicts)
+
+
+	def wrap(self, func: Callable[[AmpelAlertProtocol], Any]) -> Callable[[AmpelAlertProtocol], Any]:
+		""" :returns: function returning the cached verdict if available, calling `func` otherwise """
+
+		verdicts = self._verdicts
+		new = self._new
+		pack = RECORD.pack
+
+		def cached(alert: AmpelAlertProtocol) -> Any:
+
+			aid = alert.id
+			key = aid if isinstance(aid, int) and INT64_MIN <= aid <= INT64_MAX else hash_stock(aid)
+
+			if (code := verdicts.get(key)) is not None:
+				self.hits += 1
+				return False if code == REJECTED else True if code == ACCEPTED else code
+
+			res = func(alert)
+
+			if res is True:
+				code = ACCEPTED
+			elif not res:
+				code = REJECTED
+			elif ACCEPTED < res < 2**31:
+				code = res
+			else:
+				return res
+
+			verdicts[key] = code
+			new.extend(pack(key, code))
+			return res
+
+		return cached
+
+
+	def flush(self) -> None:
+		""" Appends new verdicts to the cache file """
+		if self._new:
+			with open(self.path, 'ab') as f:
+				f.write(self._new)
+			self._new.clear()
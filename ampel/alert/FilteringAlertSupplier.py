@@ -7,7 +7,7 @@
 # Last Modified Date:  24.11.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from typing import Iterator
+from typing import Any, Iterator
 from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
 from ampel.model.UnitModel import UnitModel
 from ampel.log.AmpelLogger import AmpelLogger
@@ -53,3 +53,9 @@ class FilteringAlertSupplier(AbsAlertSupplier):
 	def set_logger(self, logger: AmpelLogger) -> None:
 		self.logger = logger
 		self.underlying_alert_supplier.set_logger(logger)
+
+	def get_checkpoint(self) -> None | dict[str, Any]:
+		return self.underlying_alert_supplier.get_checkpoint()
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		self.underlying_alert_supplier.set_checkpoint(checkpoint)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/QueueAlertSupplier.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from typing import Any
+from collections.abc import Iterator
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
+
+
+class QueueAlertSupplier(AbsAlertSupplier):
+	"""
+	Supplies alerts received through a (multiprocessing) queue,
+	typically fed by :class:`~ampel.alert.ShardedAlertConsumer.ShardedAlertConsumer`.
+	Queue items are lists of alerts, None marks the end of the stream.
+	The queue must be set using :func:`set_queue` before iterating.
+	"""
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		self.queue: Any = None
+		self._chunk: Iterator[AmpelAlertProtocol] = iter(())
+		self._done = False
+
+
+	def set_queue(self, queue: Any) -> None:
+		self.queue = queue
+
+
+	def __iter__(self) -> Iterator[AmpelAlertProtocol]:
+		return self
+
+
+	def __next__(self) -> AmpelAlertProtocol:
+
+		# Note: state is kept across iterations, AlertConsumer.run() can stop mid-chunk
+		if (alert := next(self._chunk, None)) is not None:
+			return alert
+
+		if self._done:
+			raise StopIteration
+
+		if (chunk := self.queue.get()) is None:
+			self._done = True
+			raise StopIteration
+
+		self._chunk = iter(chunk)
+		return next(self)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/ReadAheadAlertSupplier.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from time import perf_counter
+from threading import Thread, Condition
+from collections import deque
+from typing import Any
+from collections.abc import Iterator
+from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
+from ampel.model.UnitModel import UnitModel
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.base.AuxUnitRegister import AuxUnitRegister
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.alert.AlertConsumerMetrics import stat_readahead_empty, stat_time
+
+
+class ReadAheadAlertSupplier(AbsAlertSupplier):
+	"""
+	Wraps another alert supplier whose alerts are loaded and deserialized
+	in a background thread while the consumer is busy filtering and ingesting.
+	Loader I/O (file reads, tar decompression) releases the GIL and thus overlaps with alert processing.
+
+	example::
+
+	  "supplier": {
+	    "unit": "ReadAheadAlertSupplier",
+	    "config": {
+	      "supplier": {"unit": "ZiAlertSupplier", "config": {...}},
+	      "queue_size": 500
+	    }
+	  }
+
+	The metric alertprocessor_readahead_empty counts how often the consumer found the queue empty,
+	the time spent waiting is recorded under the 'readahead_wait' section of alertprocessor_time.
+	"""
+
+	#: Underlying alert supplier
+	supplier: UnitModel
+
+	#: Maximum number of alerts waiting in the queue
+	queue_size: int = 1000
+
+	#: Maximum total number of datapoints held by queued alerts (memory cap)
+	max_datapoints: None | int = None
+
+
+	def __init__(self, **kwargs) -> None:
+
+		if isinstance(kwargs.get('supplier'), str):
+			kwargs['supplier'] = {"unit": kwargs['supplier']}
+
+		super().__init__(**kwargs)
+
+		self.underlying_alert_supplier: AbsAlertSupplier = AuxUnitRegister.new_unit(
+			model = self.supplier, sub_type = AbsAlertSupplier
+		)
+
+		# Alerts are queued along with the position of the underlying supplier right after them
+		self._queue: deque[tuple[AmpelAlertProtocol, None | dict[str, Any]]] = deque()
+		self._checkpoint: None | dict[str, Any] = None
+		self._cond = Condition()
+		self._queued_dps = 0
+		self._done = False
+		self._exc: None | BaseException = None
+		self._thread: None | Thread = None
+		self._stat_wait = stat_time.labels("readahead_wait")
+
+
+	def set_logger(self, logger: AmpelLogger) -> None:
+		self.logger = logger
+		self.underlying_alert_supplier.set_logger(logger)
+
+
+	def get_checkpoint(self) -> None | dict[str, Any]:
+		""" :returns: position of the underlying supplier right after the last alert returned by this supplier """
+		if self._thread is None:
+			return self.underlying_alert_supplier.get_checkpoint()
+		return self._checkpoint
+
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		if self._thread is not None:
+			raise ValueError("Checkpoints must be set before alert consumption starts")
+		self.underlying_alert_supplier.set_checkpoint(checkpoint)
+
+
+	def __iter__(self) -> Iterator[AmpelAlertProtocol]:
+		return self
+
+
+	def __next__(self) -> AmpelAlertProtocol:
+
+		if self._thread is None:
+			self._checkpoint = self.underlying_alert_supplier.get_checkpoint()
+			self._thread = Thread(target=self._read_ahead, daemon=True, name="ReadAheadAlertSupplier")
+			self._thread.start()
+
+		with self._cond:
+
+			if not self._queue and not self._done:
+				stat_readahead_empty.inc()
+				start = perf_counter()
+				while not self._queue and not self._done:
+					self._cond.wait()
+				self._stat_wait.observe(perf_counter() - start)
+
+			if not self._queue:
+				if self._exc:
+					exc, self._exc = self._exc, None
+					raise exc
+				raise StopIteration
+
+			alert, self._checkpoint = self._queue.popleft()
+			self._queued_dps -= len(alert.datapoints)
+			self._cond.notify()
+			return alert
+
+
+	def _read_ahead(self) -> None:
+
+		queue = self._queue
+		cond = self._cond
+		queue_size = self.queue_size
+		max_dps = self.max_datapoints
+		supplier = self.underlying_alert_supplier
+
+		try:
+			for alert in supplier:
+				checkpoint = supplier.get_checkpoint()
+				n = len(alert.datapoints)
+				with cond:
+					# An alert is always accepted into an empty queue, whatever its size
+					while queue and (
+						len(queue) >= queue_size or
+						(max_dps and self._queued_dps + n > max_dps)
+					):
+						cond.wait()
+					queue.append((alert, checkpoint))
+					self._queued_dps += n
+					cond.notify()
+
+		except BaseException as e:
+			self._exc = e
+
+		finally:
+			with cond:
+				self._done = True
+				cond.notify()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/ShardedAlertConsumer.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from copy import copy, deepcopy
+from zlib import crc32
+from queue import Full, Empty
+from multiprocessing import get_context
+from typing import Any
+from ampel.types import StockId
+from ampel.core.AmpelContext import AmpelContext
+from ampel.util.freeze import recursive_unfreeze
+from ampel.model.UnitModel import UnitModel
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.abstract.AbsEventUnit import AbsEventUnit
+from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
+from ampel.base.AuxUnitRegister import AuxUnitRegister
+from ampel.alert.AlertConsumer import AlertConsumer
+from ampel.alert.AlertConsumerMetrics import stat_dropped
+
+
+def get_shard(stock: StockId, shards: int) -> int:
+	"""
+	Stable (across processes and runs) mapping of stock ids to shard numbers.
+	Note: the builtin hash() cannot be used as it is salted for str/bytes.
+	"""
+	if isinstance(stock, int):
+		return stock % shards
+	return crc32(stock if isinstance(stock, bytes) else stock.encode()) % shards
+
+
+class ShardedAlertConsumer(AbsEventUnit):
+	"""
+	Runs several :class:`~ampel.alert.AlertConsumer.AlertConsumer` worker processes fed by a single
+	alert supplier. Alerts are dispatched to workers based on their stock id so that every alert
+	of a given stock is processed by the same worker, keeping the per-channel autocomplete stock sets
+	of the workers consistent. Each worker has its own DB updates buffer, filter blocks and registers.
+
+	The alert supplier runs in the parent process, alerts are sent to the workers in chunks
+	through bounded queues (workers use :class:`~ampel.alert.QueueAlertSupplier.QueueAlertSupplier`).
+
+	Example::
+
+	  ShardedAlertConsumer(
+	      context=ctx, process_name="T0/ztf_uw_public", workers=4,
+	      supplier={"unit": "ZiAlertSupplier", "config": {...}},
+	      consumer={"shaper": "ZiDataPointShaper", "directives": [...]}
+	  ).run()
+
+	Note: workers are forked, units and configurations registered in the parent process are inherited.
+	If a worker dies, dispatching stops: the alerts which could not be delivered to the worker are counted
+	(metric alertprocessor_alerts_dropped) and a RuntimeError is raised once the other workers are done.
+	"""
+
+	#: Number of AlertConsumer worker processes
+	workers: int = 2
+
+	#: Unit to use to supply alerts (instantiated in the parent process)
+	supplier: UnitModel
+
+	#: Configuration of the worker :class:`~ampel.alert.AlertConsumer.AlertConsumer` instances.
+	#: Parameter 'supplier' is ignored.
+	consumer: dict[str, Any]
+
+	#: Number of alerts sent at once to a worker
+	chunk_size: int = 100
+
+	#: Maximum number of chunks waiting in each worker queue
+	queue_size: int = 10
+
+
+	def __init__(self, **kwargs) -> None:
+
+		if isinstance(kwargs.get('supplier'), str):
+			kwargs['supplier'] = {"unit": kwargs['supplier']}
+
+		super().__init__(**kwargs)
+
+		if self.workers < 1:
+			raise ValueError("At least one worker is required")
+
+
+	def run(self) -> int:
+		"""
+		Dispatches all alerts from the supplier to the workers and waits for their completion
+
+		:returns: Number of alerts processed by the workers
+		"""
+
+		logger = AmpelLogger.get_logger(
+			console=self.context.config.get(f"logging.{self.log_profile}.console", dict)
+		)
+
+		alert_supplier = AuxUnitRegister.new_unit(
+			model = self.supplier,
+			sub_type = AbsAlertSupplier
+		)
+		alert_supplier.set_logger(logger)
+
+		mp = get_context("fork")
+		shards = self.workers
+		queues = [mp.Queue(self.queue_size) for i in range(shards)]
+		counts: Any = mp.Array('q', shards)
+		procs = [
+			mp.Process(
+				target = self._work, args = (i, queues[i], counts),
+				name = f"{self.process_name}.{i}"
+			)
+			for i in range(shards)
+		]
+
+		for p in procs:
+			p.start()
+
+		logger.info(f"Started {shards} alert consumer workers")
+
+		chunk_size = self.chunk_size
+		chunks: list[list[Any]] = [[] for i in range(shards)]
+		dropped = [0] * shards
+
+		def put(i: int, item: None | list[Any]) -> bool:
+			""" :returns: False if worker i is not running anymore (item is dropped) """
+			while procs[i].is_alive():
+				try:
+					queues[i].put(item, timeout=1)
+					return True
+				except Full:
+					pass
+			if item:
+				dropped[i] += len(item)
+			return False
+
+		try:
+			for alert in alert_supplier:
+				i = get_shard(alert.stock, shards)
+				chunks[i].append(alert)
+				if len(chunks[i]) == chunk_size:
+					sent = put(i, chunks[i])
+					chunks[i] = []
+					if not sent:
+						raise RuntimeError(f"Worker {i} is not running anymore")
+
+		# SIGINT is also received by the workers (same process group)
+		except KeyboardInterrupt:
+			logger.info("Alert dispatching interrupted")
+
+		finally:
+
+			for i in range(shards):
+				if chunks[i]:
+					put(i, chunks[i])
+				put(i, None)
+
+			for i, p in enumerate(procs):
+				p.join()
+				if p.exitcode:
+					# Alerts delivered to the worker but not fetched
+					while True:
+						try:
+							item = queues[i].get(timeout=0.1)
+						except Empty:
+							break
+						if item:
+							dropped[i] += len(item)
+					logger.error(
+						f"Worker {i} exited with code {p.exitcode}, "
+						f"at least {dropped[i]} alerts were not processed"
+					)
+
+			if sum(dropped):
+				stat_dropped.inc(sum(dropped))
+
+		if sum(dropped):
+			raise RuntimeError(f"{sum(dropped)} alerts were not processed (worker failure)")
+
+		return sum(counts[:])
+
+
+	def _work(self, shard: int, queue: Any, counts: Any) -> None:
+
+		ac = AlertConsumer(
+			context = self._new_context(),
+			**self.get_worker_config(shard)
+		)
+
+		ac.alert_supplier.set_queue(queue) # type: ignore[attr-defined]
+		counts[shard] = ac.process_alerts()
+
+
+	def _new_context(self) -> AmpelContext:
+		"""
+		:returns: copy of the context with a new database instance
+		(database connections inherited from the parent process are not fork-safe)
+		"""
+
+		db = self.context.db
+		context = copy(self.context)
+		context.db = type(db)(**{k: getattr(db, k) for k in db.get_model_keys()})
+		context.loader = copy(self.context.loader)
+		context.loader.db = context.db
+		return context
+
+
+	def get_worker_config(self, shard: int) -> dict[str, Any]:
+		"""
+		Worker specific AlertConsumer config.
+		Alert registers get a worker specific file prefix since concurrent updates
+		of a register are not supported.
+		"""
+
+		conf = deepcopy(recursive_unfreeze(self.consumer)) # type: ignore[arg-type]
+		conf['supplier'] = {"unit": "QueueAlertSupplier"}
+		conf['process_name'] = self.process_name
+		conf.setdefault('raise_exc', self.raise_exc)
+		conf.setdefault('log_profile', self.log_profile)
+
+		if isinstance(conf['directives'], dict):
+			conf['directives'] = [conf['directives']]
+
+		conf['directives'] = [
+			el if isinstance(el, dict) else el.dict()
+			for el in conf['directives']
+		]
+
+		for directive in conf['directives']:
+
+			if not (f := directive.get('filter')) or not (rej := f.get('reject')) or 'register' not in rej:
+				continue
+
+			if isinstance(rej['register'], str):
+				rej['register'] = {"unit": rej['register']}
+
+			reg_conf = rej['register'].get('config') or {}
+			prefix = reg_conf.get('file_prefix', '$channel')
+
+			# run ids differ between workers
+			if prefix == '$run_id':
+				continue
+
+			reg_conf['file_prefix'] = (
+				str(directive['channel']) if prefix == '$channel' else prefix
+			) + f"_shard{shard}"
+
+			rej['register']['config'] = reg_conf
+
+		return conf
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/SharedFilter.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from logging import LogRecord
+from threading import Lock
+from typing import Any
+from collections.abc import Callable
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.log.LightLogRecord import LightLogRecord
+from ampel.log.handlers.RecordBufferingHandler import RecordBufferingHandler
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+
+
+def copy_record(rec: LogRecord | LightLogRecord) -> LogRecord | LightLogRecord:
+	"""
+	:returns: copy of the provided record whose 'extra' dict can be updated independently
+	(note: copy.copy does not support LightLogRecord, whose __getattr__ returns None for unknown attributes)
+	"""
+	ret = object.__new__(type(rec))
+	d = ret.__dict__
+	d.update(rec.__dict__)
+	if extra := d.get('extra'):
+		d['extra'] = dict(extra)
+	return ret
+
+
+class SharedFilter:
+	"""
+	Filter unit shared by several filter blocks (channels with identical filter models):
+	the unit is evaluated once per alert and its result is handed over to each filter block.
+
+	Results are memoized for the last `memo_size` alerts (keyed by alert object identity) along with
+	the log records emitted by the unit, which are copied into the record buffer of every filter block
+	requesting the result. Channel specific handling of the result (logging, rejected logs,
+	registers, auto complete) is thus unchanged.
+	Failing evaluations are not memoized (the error is raised for each filter block).
+
+	Each evaluation collects the records of the unit with a dedicated handler (the handlers of the unit logger
+	are swapped during the evaluation), record buffers of filter blocks are thus only used by their own block.
+	"""
+
+	def __init__(self,
+		func: Callable[[AmpelAlertProtocol], Any],
+		logger: AmpelLogger,
+		memo_size: int = 1
+	) -> None:
+		"""
+		:param func: filter function (process method of the unit)
+		:param logger: logger of the unit
+		:param memo_size: number of results kept, should be at least the number of alerts
+		processed by a filter block before the next one runs (AlertConsumer batch size)
+		"""
+		self.func = func
+		self.logger = logger
+		self.memo_size = max(memo_size, 1)
+		self._memo: dict[int, tuple[AmpelAlertProtocol, Any, list[LogRecord | LightLogRecord], bool]] = {}
+		self._lock = Lock()
+		self.calls = 0
+		self.evaluations = 0
+
+
+	def wrap(self, buf_hdlr: RecordBufferingHandler) -> Callable[[AmpelAlertProtocol], Any]:
+		"""
+		:param buf_hdlr: record buffering handler of the calling filter block
+		:returns: filter function for the filter block associated with `buf_hdlr`
+		"""
+
+		memo = self._memo
+
+		def shared(alert: AmpelAlertProtocol) -> Any:
+
+			with self._lock:
+
+				self.calls += 1
+				if (m := memo.get(id(alert))) is None or m[0] is not alert:
+					m = memo[id(alert)] = self._evaluate(alert, buf_hdlr)
+					if len(memo) > self.memo_size:
+						del memo[next(iter(memo))]
+
+			if m[2]:
+				buf_hdlr.buffer.extend(map(copy_record, m[2]))
+				if m[3]:
+					buf_hdlr.has_error = True
+
+			return m[1]
+
+		return shared
+
+
+	def _evaluate(self,
+		alert: AmpelAlertProtocol, buf_hdlr: RecordBufferingHandler
+	) -> tuple[AmpelAlertProtocol, Any, list[LogRecord | LightLogRecord], bool]:
+
+		self.evaluations += 1
+		logger = self.logger
+		handlers = logger.handlers
+		hdlr = RecordBufferingHandler(logger.level)
+		logger.handlers = [hdlr]
+
+		try:
+			res = self.func(alert)
+		except Exception:
+			# Hand the records over to the calling filter block
+			buf_hdlr.buffer.extend(hdlr.buffer)
+			buf_hdlr.has_error = buf_hdlr.has_error or hdlr.has_error
+			raise
+		finally:
+			logger.handlers = handlers
+
+		return alert, res, hdlr.buffer, hdlr.has_error
+
+
+	def clear(self) -> None:
+		""" Releases memoized results """
+		self._memo.clear()
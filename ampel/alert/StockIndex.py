@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/StockIndex.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import os, mmap
+from array import array
+from struct import Struct
+from bisect import bisect_left
+from hashlib import blake2b
+from collections.abc import Iterable
+from ampel.types import StockId
+
+try:
+	import numpy as np
+except ImportError:
+	np = None # type: ignore[assignment]
+
+
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+#: magic, refresh time, number of integer ids, number of hashes
+SNAPSHOT_HEADER = Struct('=8sdqq')
+SNAPSHOT_MAGIC = b'AMPSTIDX'
+
+
+def hash_stock(stock: StockId) -> int:
+	"""
+	:returns: stable (across processes) signed 64 bits hash of a non-int64 stock id.
+	A leading null byte distinguishes (large) integers from strings.
+	"""
+	if isinstance(stock, int):
+		b = b'\0' + str(stock).encode()
+	elif isinstance(stock, str):
+		b = stock.encode()
+	else:
+		b = stock
+	return int.from_bytes(blake2b(b, digest_size=8).digest(), 'little', signed=True)
+
+
+def concat(*arrays: array | memoryview) -> array:
+	""" :returns: concatenation of int64 arrays (or memoryviews of int64) """
+	ret = array('q')
+	for el in arrays:
+		ret.frombytes(memoryview(el).cast('B'))
+	return ret
+
+
+def sorted_unique(values: array) -> array:
+	""" :returns: sorted copy of the provided int64 array, without duplicates """
+	if not values:
+		return array('q')
+	if np is not None:
+		ret = array('q')
+		ret.frombytes(np.unique(np.frombuffer(values, dtype=np.int64)).tobytes())
+		return ret
+	return array('q', sorted(set(values)))
+
+
+class StockIndex:
+	"""
+	Compact set-like container of stock ids supporting `in`, `add` and `len()`,
+	used by :class:`~ampel.alert.FilterBlock.FilterBlock` for "auto complete".
+
+	Integer stock ids are stored in a sorted int64 array (8 bytes per id, compared to
+	about 60 to 90 bytes per id for a python set) and looked up by binary search.
+	Other stock ids (strings, bytes, integers beyond int64) are stored as 64 bits hashes
+	in a second sorted array. A hash collision (probability about n² / 2^65 for n such ids)
+	would make an unknown stock appear as known.
+
+	Ids added after construction are kept in a set which is merged into the arrays
+	once it holds `merge_size` elements. Sorting the arrays (merging) uses numpy if available.
+
+	Indexes can be saved into snapshot files (:func:`save`) which are memory-mapped when loaded
+	(:func:`load`): processes loading the same snapshot share a single page cache copy of the arrays
+	as long as the index is not merged. Snapshots use the native byte order and are thus not portable.
+	"""
+
+	def __init__(self, stocks: Iterable[StockId] = (), merge_size: int = 100000) -> None:
+		self.merge_size = merge_size
+		self._ints: array | memoryview = array('q')
+		self._hashes: array | memoryview = array('q')
+		self._added: set[StockId] = set()
+		self._pending_ints = array('q')
+		self._pending_hashes = array('q')
+		self.update(stocks)
+
+
+	def update(self, stocks: Iterable[StockId]) -> None:
+		""" Bulk addition of stock ids """
+		for stock in stocks:
+			self.append(stock)
+		self.merge()
+
+
+	def append(self, stock: StockId) -> None:
+		"""
+		Bulk loading: adds a stock id without membership check (duplicates are allowed).
+		Appended ids are not visible until :func:`merge` is called.
+		"""
+		if isinstance(stock, int) and INT64_MIN <= stock <= INT64_MAX:
+			self._pending_ints.append(stock)
+		else:
+			self._pending_hashes.append(hash_stock(stock))
+
+
+	def merge(self) -> None:
+		""" Merges appended and recently added ids into the sorted arrays """
+		if self._added or self._pending_ints or self._pending_hashes:
+			self._ints, self._hashes = self._merged()
+			self._added = set()
+			self._pending_ints = array('q')
+			self._pending_hashes = array('q')
+
+
+	def _merged(self) -> tuple[array | memoryview, array | memoryview]:
+
+		ints, hashes = array('q'), array('q')
+		for stock in self._added:
+			if isinstance(stock, int) and INT64_MIN <= stock <= INT64_MAX:
+				ints.append(stock)
+			else:
+				hashes.append(hash_stock(stock))
+
+		return (
+			sorted_unique(concat(self._ints, self._pending_ints, ints))
+			if ints or self._pending_ints else self._ints,
+			sorted_unique(concat(self._hashes, self._pending_hashes, hashes))
+			if hashes or self._pending_hashes else self._hashes
+		)
+
+
+	def save(self, path: str, ts: float) -> None:
+		"""
+		Saves the index (including unmerged ids) into a snapshot file.
+		The file is replaced atomically (processes having mapped the previous file are unaffected).
+
+		:param ts: time of the last refresh of the index, returned by :func:`load`
+		"""
+
+		ints, hashes = self._merged()
+		tmp = f"{path}.{os.getpid()}.tmp"
+		with open(tmp, 'wb') as f:
+			f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, ts, len(ints), len(hashes)))
+			f.write(ints)
+			f.write(hashes)
+		os.replace(tmp, path)
+
+
+	@classmethod
+	def load(cls, path: str, merge_size: int = 100000) -> tuple['StockIndex', float]:
+		"""
+		Memory-maps a snapshot file created by :func:`save`
+		:returns: index and time of the last refresh of the saved index
+		:raises: ValueError if the file is not a valid snapshot
+		"""
+
+		with open(path, 'rb') as f:
+			mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		if len(mm) < SNAPSHOT_HEADER.size:
+			raise ValueError(f"Invalid stock index snapshot: {path}")
+
+		magic, ts, n_ints, n_hashes = SNAPSHOT_HEADER.unpack_from(mm)
+		if magic != SNAPSHOT_MAGIC or len(mm) != SNAPSHOT_HEADER.size + (n_ints + n_hashes) * 8:
+			raise ValueError(f"Invalid stock index snapshot: {path}")
+
+		ret = cls(merge_size=merge_size)
+		view = memoryview(mm)
+		offset = SNAPSHOT_HEADER.size + n_ints * 8
+		ret._ints = view[SNAPSHOT_HEADER.size:offset].cast('q')
+		ret._hashes = view[offset:].cast('q')
+		return ret, ts
+
+
+	def __contains__(self, stock: StockId) -> bool:
+
+		if stock in self._added:
+			return True
+
+		if isinstance(stock, int) and INT64_MIN <= stock <= INT64_MAX:
+			arr = self._ints
+			key = stock
+		else:
+			arr = self._hashes
+			key = hash_stock(stock)
+
+		i = bisect_left(arr, key)
+		return i != len(arr) and arr[i] == key
+
+
+	def add(self, stock: StockId) -> None:
+		if stock not in self:
+			self._added.add(stock)
+			if len(self._added) >= self.merge_size:
+				self.merge()
+
+
+	def __len__(self) -> int:
+		return len(self._ints) + len(self._hashes) + len(self._added)
+
+
+	def nbytes(self) -> int:
+		""" :returns: approximate memory footprint of the arrays (recently added ids excluded) """
+		return (len(self._ints) + len(self._hashes)) * 8
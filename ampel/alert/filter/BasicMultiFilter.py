@@ -8,13 +8,21 @@
 # Last Modified By:    Jakob van Santen <jakob.van.santen@desy.de>
 
 import operator
+from ampel.types import JDict
 from ampel.abstract.AbsAlertFilter import AbsAlertFilter
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.filter.SharedCriteria import SharedCriteria
 from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
 
 from ampel.base.AmpelBaseModel import AmpelBaseModel
-from typing import Literal, ClassVar
+from typing import Any, Literal, ClassVar
 from collections.abc import Callable, Sequence
 
+try:
+	import numpy as np
+except ImportError:
+	np = None # type: ignore[assignment]
+
 
 class PhotoAlertQuery(AmpelBaseModel):
 	"""
@@ -54,14 +62,197 @@ class BasicFilterCondition(AmpelBaseModel):
 		if self.len < 0:
 			raise ValueError("Len must be >= 0")
 		self._operator = PhotoAlertQuery._ops[self.operator]
+		self._connection = PhotoAlertQuery._ops[self.logicalConnection]
 		self._criteria = [el.dict() for el in ([self.criteria] if isinstance(self.criteria, PhotoAlertQuery) else self.criteria)]
 
 
+#: Number of matching datapoints from which the result of a condition cannot change anymore
+#: (as a function of the condition operator and len)
+_settle_counts: dict[str, Callable[[int], int]] = {
+	'>=': lambda n: n,
+	'>': lambda n: n + 1,
+	'<': lambda n: n,
+	'<=': lambda n: n + 1,
+	'==': lambda n: n + 1,
+	'!=': lambda n: n + 1
+}
+
+
+def compile_conditions(
+	conditions: Sequence[BasicFilterCondition]
+) -> None | Callable[[Sequence[JDict]], bool]:
+	"""
+	Compiles filter conditions into a single function evaluating datapoints
+	(equivalent to :func:`BasicMultiFilter.process` applied to an AmpelAlert with these datapoints).
+	Datapoints are scanned once: the number of matches of every condition is computed in the same pass
+	and the scan stops as soon as the combined result is decided (matches counts only increase).
+	The final AND/OR combination short-circuits.
+
+	:returns: None if the conditions cannot be compiled (no condition, 'AND'/'OR' used as comparison operator)
+	"""
+
+	if not conditions or any(
+		c.operator not in _settle_counts or any(q['operator'] not in _settle_counts for q in c._criteria)
+		for c in conditions
+	):
+		return None
+
+	ns: dict[str, Any] = {}
+	counts = ", ".join(f"n{i}" for i in range(len(conditions)))
+	settle = [_settle_counts[c.operator](c.len) for c in conditions]
+	lines = ["def evaluate(dps):"]
+	lines += [f"\tn{i} = 0" for i in range(len(conditions))]
+	lines += ["\tfor d in dps:", "\t\tif 'candid' in d:"]
+
+	for i, c in enumerate(conditions):
+
+		tests = []
+		for j, q in enumerate(c._criteria):
+			ns[f"v{i}_{j}"] = q['value']
+			attr = repr(q['attribute'])
+			tests.append(f"{attr} in d and d[{attr}] {q['operator']} v{i}_{j}")
+
+		lines += [f"\t\t\tif {' and '.join(tests) or 'True'}:", f"\t\t\t\tn{i} += 1"]
+
+		if len(conditions) == 1:
+			lines.append(f"\t\t\t\tif n{i} == {settle[i]}: return {c._operator(settle[i], c.len)}")
+		else:
+			lines.append(f"\t\t\t\tif n{i} == {settle[i]} and (r := decide({counts})) is not None: return r")
+
+	expr = f"(n0 {conditions[0].operator} {conditions[0].len})"
+	for i, c in enumerate(conditions[1:], 1):
+		expr = f"({expr} {c.logicalConnection.lower()} (n{i} {c.operator} {c.len}))"
+	lines.append(f"\treturn {expr}")
+
+	spec = [
+		(c._operator, c.len, settle[i], None if i == 0 else c.logicalConnection)
+		for i, c in enumerate(conditions)
+	]
+
+	def decide(*counts: int) -> None | bool:
+		""" :returns: combined result if decided by the conditions already settled, None otherwise """
+		res: None | bool = None
+		for (op, n, settle_count, connection), count in zip(spec, counts):
+			v = op(count, n) if count >= settle_count else None
+			if connection is None:
+				res = v
+			elif connection == 'AND':
+				res = False if res is False or v is False else (None if res is None or v is None else True)
+			else:
+				res = True if res is True or v is True else (None if res is None or v is None else False)
+		return res
+
+	ns['decide'] = decide
+	exec(compile("\n".join(lines), "<BasicMultiFilter>", "exec"), ns)
+	return ns['evaluate']
+
+
+#: Largest magnitude of numbers whose comparison with a float is exact once converted to float64
+_MAX_EXACT = 2 ** 53
+
+
+def vectorize_conditions(
+	conditions: Sequence[BasicFilterCondition]
+) -> None | Callable[[Sequence[JDict]], None | bool]:
+	"""
+	Numpy counterpart of :func:`compile_conditions`: the values of the attributes referenced by
+	the criteria are converted into numpy columns (once per alert and attribute, only when needed),
+	each criterion becomes a boolean mask and the number of matches of a condition a mask count.
+
+	Missing fields never match (NaN placeholders, plus an explicit presence mask for '!=').
+	The returned function returns None if a column is not numeric (None values, strings)
+	or holds numbers too large to be compared exactly as float64: such alerts must be evaluated
+	by :func:`compile_conditions` which preserves the semantics of python comparisons.
+
+	:returns: None if numpy is not available or if the conditions cannot be compiled
+	"""
+
+	if np is None or not conditions or any(
+		c.operator not in _settle_counts or any(q['operator'] not in _settle_counts for q in c._criteria)
+		for c in conditions
+	):
+		return None
+
+	ops = PhotoAlertQuery._ops
+	nan = float('nan')
+	specs = [
+		(c._operator, c.len, c.logicalConnection, [(q['attribute'], ops[q['operator']], q['value']) for q in c._criteria])
+		for c in conditions
+	]
+
+	def evaluate(dps: Sequence[JDict]) -> None | bool:
+
+		base = np.fromiter(['candid' in d for d in dps], bool, len(dps))
+		columns: dict[str, Any] = {}
+		res = False
+
+		for i, (op, n, connection, criteria) in enumerate(specs):
+
+			# Combined result already decided
+			if i and (res if connection == 'OR' else not res):
+				continue
+
+			mask = base
+			for attr, qop, value in criteria:
+
+				if (col := columns.get(attr)) is None:
+					col = columns[attr] = np.array([d.get(attr, nan) for d in dps])
+					if col.dtype.kind not in 'biuf' or (col.dtype.kind != 'b' and (np.abs(col) > _MAX_EXACT).any()):
+						return None
+
+				if qop is operator.ne:
+					mask = mask & (col != value) & np.fromiter([attr in d for d in dps], bool, len(dps))
+				else:
+					mask = mask & qop(col, value)
+
+			res = op(int(np.count_nonzero(mask)), n)
+
+		return res
+
+	return evaluate
+
 
 class BasicMultiFilter(AbsAlertFilter):
 
 	filters: Sequence[BasicFilterCondition]
 
+	#: Execution backend: 'python' (single pass evaluator, see :func:`compile_conditions`)
+	#: or 'numpy' (vectorized evaluation, see :func:`vectorize_conditions`).
+	#: Building numpy columns from datapoint dicts costs about as much as a python scan:
+	#: numpy only pays off for long light curves evaluated by many criteria referencing few attributes
+	#: (see :func:`~ampel.dev.BasicMultiFilterBenchmark.benchmark_backends`)
+	backend: Literal['python', 'numpy'] = 'python'
+
+	#: Alerts with fewer datapoints are evaluated by the python backend
+	numpy_min_datapoints: int = 500
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		if self.backend == 'numpy' and np is None:
+			raise ValueError("Backend 'numpy' requires numpy")
+		self._evaluate = compile_conditions(self.filters)
+		self._vectorized = vectorize_conditions(self.filters) if self.backend == 'numpy' else None
+		self._shared: None | SharedCriteria = None
+		self._shared_spec: list[tuple[Callable, int, str, list[int]]] = []
+
+
+	def share_criteria(self, shared: SharedCriteria) -> bool:
+		"""
+		Evaluates conditions using criteria masks shared with other filters (see :class:`SharedCriteria`)
+		:returns: False if the conditions cannot be evaluated this way (python backend only)
+		"""
+
+		if not self._evaluate or self.backend != 'python':
+			return False
+
+		self._shared = shared
+		self._shared_spec = [
+			(c._operator, c.len, c.logicalConnection, [shared.register(q) for q in c._criteria])
+			for c in self.filters
+		]
+		return True
+
+
 	def process(self, alert: AmpelAlertProtocol) -> bool:
 		"""
 		Filter alerts via AmpelAlert.get_values(). Criteria in each condition
@@ -105,8 +296,49 @@ class BasicMultiFilter(AbsAlertFilter):
 		        "operator": ">="
 		      }
 		    ]
+
+		Conditions are compiled into a single pass evaluator (see :func:`compile_conditions`)
+		used for AmpelAlert instances (whose get_values method is known).
 		"""
 
+		if self._evaluate and type(alert).get_values is AmpelAlert.get_values:
+			dps = alert.datapoints
+			if self._shared:
+				return self._evaluate_shared(dps)
+			if self._vectorized and len(dps) >= self.numpy_min_datapoints and (res := self._vectorized(dps)) is not None:
+				return res
+			return self._evaluate(dps)
+
+		return self._process_generic(alert)
+
+
+	def _evaluate_shared(self, dps: Sequence[JDict]) -> bool:
+
+		shared = self._shared
+		assert shared is not None
+		masks = shared.masks(dps)
+		get = shared.get
+		res = False
+
+		for i, (op, n, connection, criteria) in enumerate(self._shared_spec):
+
+			# Combined result already decided
+			if i and (res if connection == 'OR' else not res):
+				continue
+
+			m = get(dps, masks, shared.base)
+			for j in criteria:
+				if not m:
+					break
+				m &= get(dps, masks, j)
+
+			res = op(m.bit_count(), n)
+
+		return res
+
+
+	def _process_generic(self, alert: AmpelAlertProtocol) -> bool:
+
 		filter_res = []
 
 		for param in self.filters:
@@ -127,8 +359,6 @@ class BasicMultiFilter(AbsAlertFilter):
 			if i == 0:
 				current_res = filter_res[i]
 			else:
-				current_res = self.filters[i].logicalConnection( # type: ignore[misc]
-					current_res, filter_res[i]
-				)
+				current_res = self.filters[i]._connection(current_res, filter_res[i])
 
 		return current_res
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/filter/ExpressionFilter.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import ast
+from typing import Any, Literal
+from collections.abc import Callable, Sequence
+from ampel.types import JDict
+from ampel.abstract.AbsAlertFilter import AbsAlertFilter
+from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
+from ampel.alert.filter.BasicMultiFilter import np, _MAX_EXACT
+
+
+_cmp_ops: dict[type, str] = {
+	ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='
+}
+
+_arith_ops: dict[type, str] = {
+	ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'
+}
+
+
+class _Translator:
+	"""
+	Validates the syntax tree of an expression (see :class:`ExpressionFilter`) and translates it
+	into python source code. Datapoints are referenced by the variable 'd', the number
+	of datapoints matching the i-th distinct count() predicate by the variable 'n<i>'.
+	"""
+
+	def __init__(self, expression: str) -> None:
+
+		try:
+			self.tree = ast.parse(expression.strip(), mode='eval').body
+		except SyntaxError as e:
+			raise ValueError(f"Invalid filter expression {expression!r}: {e.msg}") from None
+
+		self.expression = expression
+		#: source code of distinct count() predicates (None: count all datapoints)
+		self.predicates: list[None | str] = []
+		#: syntax trees of distinct count() predicates
+		self.predicate_trees: list[None | ast.expr] = []
+		self.source = self.expr(self.tree)
+
+
+	def error(self, node: ast.expr, msg: str) -> ValueError:
+		return ValueError(f"Invalid filter expression {self.expression!r} (column {node.col_offset + 1}): {msg}")
+
+
+	def expr(self, node: ast.expr) -> str:
+		""" Translates the (top level) expression: boolean combination of comparisons of counts """
+
+		if isinstance(node, ast.BoolOp):
+			op = ' and ' if isinstance(node.op, ast.And) else ' or '
+			return '(' + op.join(self.expr(el) for el in node.values) + ')'
+
+		if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+			return f"(not {self.expr(node.operand)})"
+
+		if isinstance(node, ast.Compare):
+			return self.compare(node, self.number)
+
+		raise self.error(node, "expected a comparison of counts (ex: count(rb > 0.8) >= 2)")
+
+
+	def number(self, node: ast.expr) -> str:
+		""" Translates operands of top level comparisons: counts, numbers and arithmetic thereof """
+
+		if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'count':
+			if node.keywords or len(node.args) > 1:
+				raise self.error(node, "count() accepts a single predicate")
+			pred = self.predicate(node.args[0]) if node.args else None
+			if pred not in self.predicates:
+				self.predicates.append(pred)
+				self.predicate_trees.append(node.args[0] if node.args else None)
+			return f"n{self.predicates.index(pred)}"
+
+		if isinstance(node, ast.Name):
+			raise self.error(node, f"field '{node.id}' used outside of count()")
+
+		return self.arithmetic(node, self.number)
+
+
+	def predicate(self, node: ast.expr) -> str:
+		""" Translates count() predicates: boolean combination of comparisons of fields """
+
+		if isinstance(node, ast.BoolOp):
+			op = ' and ' if isinstance(node.op, ast.And) else ' or '
+			return '(' + op.join(self.predicate(el) for el in node.values) + ')'
+
+		if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+			return f"(not {self.predicate(node.operand)})"
+
+		if isinstance(node, ast.Compare):
+			fields: list[str] = []
+			cmp = self.compare(node, lambda el: self.value(el, fields))
+			# Comparisons referencing missing fields are false (as PhotoAlertQuery criteria)
+			guard = ''.join(f"{f!r} in d and " for f in dict.fromkeys(fields))
+			return f"({guard}{cmp})" if guard else cmp
+
+		raise self.error(node, "expected a comparison of fields (ex: magpsf < 18)")
+
+
+	def value(self, node: ast.expr, fields: list[str]) -> str:
+		""" Translates operands of predicate comparisons: fields, constants and arithmetic thereof """
+
+		if isinstance(node, ast.Name):
+			fields.append(node.id)
+			return f"d[{node.id!r}]"
+
+		if isinstance(node, ast.Constant) and isinstance(node.value, str | None):
+			return repr(node.value)
+
+		return self.arithmetic(node, lambda el: self.value(el, fields))
+
+
+	def compare(self, node: ast.Compare, operand: Callable[[ast.expr], str]) -> str:
+		ret = [operand(node.left)]
+		for op, el in zip(node.ops, node.comparators):
+			if type(op) not in _cmp_ops:
+				raise self.error(node, f"unsupported comparison operator {type(op).__name__}")
+			ret += [_cmp_ops[type(op)], operand(el)]
+		return '(' + ' '.join(ret) + ')'
+
+
+	def arithmetic(self, node: ast.expr, operand: Callable[[ast.expr], str]) -> str:
+
+		# bool is a subclass of int
+		if isinstance(node, ast.Constant) and isinstance(node.value, int | float):
+			return repr(node.value)
+
+		if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub | ast.UAdd):
+			return f"({'-' if isinstance(node.op, ast.USub) else '+'}{operand(node.operand)})"
+
+		if isinstance(node, ast.BinOp) and type(node.op) in _arith_ops:
+			return f"({operand(node.left)} {_arith_ops[type(node.op)]} {operand(node.right)})"
+
+		raise self.error(node, f"unsupported syntax ({type(node).__name__})")
+
+
+def compile_expression(expression: str) -> Callable[[Sequence[JDict]], bool]:
+	"""
+	Compiles an expression (see :class:`ExpressionFilter`) into a function evaluating datapoints.
+	Datapoints are scanned once: the matches of every count() predicate are counted in the same pass.
+
+	:raises ValueError: if the expression is invalid
+	"""
+
+	t = _Translator(expression)
+	lines = ["def evaluate(dps):"]
+	lines += [f"\tn{i} = 0" for i in range(len(t.predicates))]
+	lines += ["\tfor d in dps:", "\t\tif 'candid' in d:"]
+	for i, pred in enumerate(t.predicates):
+		lines += [f"\t\t\tn{i} += 1"] if pred is None else [f"\t\t\tif {pred}:", f"\t\t\t\tn{i} += 1"]
+	lines.append(f"\treturn bool({t.source})")
+
+	ns: dict[str, Any] = {}
+	exec(compile("\n".join(lines), "<ExpressionFilter>", "exec"), ns)
+	return ns['evaluate']
+
+
+def vectorize_expression(expression: str) -> None | Callable[[Sequence[JDict]], None | bool]:
+	"""
+	Numpy counterpart of :func:`compile_expression`: referenced fields are converted into numpy columns
+	(NaN placeholders plus presence masks), predicates into boolean masks and counts into mask counts.
+	As :func:`~ampel.alert.filter.BasicMultiFilter.vectorize_conditions`, the returned function returns None
+	if a column is not numeric or holds numbers too large to be compared exactly as float64.
+
+	:returns: None if numpy is not available or if the expression cannot be vectorized
+	(predicates referencing string or None constants, or using divisions, which do not raise
+	ZeroDivisionError with numpy)
+	"""
+
+	t = _Translator(expression)
+	if np is None:
+		return None
+
+	fields: dict[str, int] = {}
+
+	def vec(node: ast.expr) -> str:
+		""" :returns: numpy source of a predicate """
+
+		if isinstance(node, ast.BoolOp):
+			op = ' & ' if isinstance(node.op, ast.And) else ' | '
+			return '(' + op.join(vec(el) for el in node.values) + ')'
+
+		if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+			return f"(~{vec(node.operand)})"
+
+		if isinstance(node, ast.Compare):
+			refs: list[str] = []
+			operands = [operand(el, refs) for el in [node.left, *node.comparators]]
+			if not refs:
+				raise NotImplementedError
+			cmps = [
+				f"({operands[i]} {_cmp_ops[type(op)]} {operands[i + 1]})"
+				for i, op in enumerate(node.ops)
+			]
+			cmps += [f"p{fields[f]}" for f in dict.fromkeys(refs)]
+			return '(' + ' & '.join(cmps) + ')'
+
+		raise NotImplementedError
+
+	def operand(node: ast.expr, refs: list[str]) -> str:
+
+		if isinstance(node, ast.Name):
+			refs.append(node.id)
+			return f"c{fields.setdefault(node.id, len(fields))}"
+
+		if isinstance(node, ast.Constant):
+			if not isinstance(node.value, int | float) or abs(node.value) > _MAX_EXACT:
+				raise NotImplementedError
+			return repr(node.value)
+
+		if isinstance(node, ast.UnaryOp):
+			return f"({'-' if isinstance(node.op, ast.USub) else '+'}{operand(node.operand, refs)})"
+
+		if isinstance(node, ast.BinOp) and not isinstance(node.op, ast.Div):
+			return f"({operand(node.left, refs)} {_arith_ops[type(node.op)]} {operand(node.right, refs)})"
+
+		raise NotImplementedError
+
+	try:
+		masks = [None if el is None else vec(el) for el in t.predicate_trees]
+	except NotImplementedError:
+		return None
+
+	lines = [
+		"def evaluate(dps):",
+		"\tbase = fromiter(['candid' in d for d in dps], bool, len(dps))"
+	]
+	for f, i in fields.items():
+		lines += [f"\tc{i}, p{i} = column(dps, {f!r})", f"\tif c{i} is None:", "\t\treturn None"]
+	lines += [
+		f"\tn{i} = int(count_nonzero(base))" if mask is None else f"\tn{i} = int(count_nonzero(base & {mask}))"
+		for i, mask in enumerate(masks)
+	]
+	lines.append(f"\treturn bool({t.source})")
+
+	nan = float('nan')
+
+	def column(dps: Sequence[JDict], field: str) -> tuple[Any, Any]:
+		""" :returns: values and presence mask of a field, None if the values cannot be vectorized """
+		col = np.array([d.get(field, nan) for d in dps])
+		if col.dtype.kind not in 'biuf' or (col.dtype.kind != 'b' and (np.abs(col) > _MAX_EXACT).any()):
+			return None, None
+		return col, np.fromiter([field in d for d in dps], bool, len(dps))
+
+	ns: dict[str, Any] = {'fromiter': np.fromiter, 'count_nonzero': np.count_nonzero, 'column': column}
+	exec(compile("\n".join(lines), "<ExpressionFilter>", "exec"), ns)
+	return ns['evaluate']
+
+
+class ExpressionFilter(AbsAlertFilter):
+	"""
+	Filters alerts using an expression over the fields of datapoints, for example:
+	"count(rb > 0.8 and fid == 1 and magpsf < 18) >= 4 or count(magdiff > 0.01) >= 4"
+
+	- The expression is a boolean combination ('and', 'or', 'not', parentheses) of comparisons
+	  ('==', '!=', '<', '<=', '>', '>=', chained comparisons allowed) of counts and numbers.
+	- count(predicate) is the number of datapoints with a 'candid' field (see AmpelAlert.get_values)
+	  matching the predicate, count() the number of such datapoints.
+	- A predicate is a boolean combination of comparisons of fields (ex: magpsf) and constants
+	  (numbers, strings, None). A comparison referencing a field missing from a datapoint is false.
+	- Arithmetic operators ('+', '-', '*', '/') are allowed in both contexts (ex: magpsf + sigmapsf < 19).
+
+	The expression is validated when the unit is instantiated and compiled into a single pass function
+	(see :func:`compile_expression`).
+	"""
+
+	expression: str
+
+	#: Execution backend: 'python' (see :func:`compile_expression`) or 'numpy' (see :func:`vectorize_expression`).
+	#: As for BasicMultiFilter, numpy only pays off for long light curves.
+	backend: Literal['python', 'numpy'] = 'python'
+
+	#: Alerts with fewer datapoints are evaluated by the python backend
+	numpy_min_datapoints: int = 500
+
+	def __init__(self, **kwargs) -> None:
+		super().__init__(**kwargs)
+		if self.backend == 'numpy' and np is None:
+			raise ValueError("Backend 'numpy' requires numpy")
+		self._evaluate = compile_expression(self.expression)
+		self._vectorized = vectorize_expression(self.expression) if self.backend == 'numpy' else None
+
+
+	def process(self, alert: AmpelAlertProtocol) -> bool:
+		dps = alert.datapoints
+		if self._vectorized and len(dps) >= self.numpy_min_datapoints and (res := self._vectorized(dps)) is not None:
+			return res
+		return self._evaluate(dps)
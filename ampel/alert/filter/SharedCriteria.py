@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/alert/filter/SharedCriteria.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from threading import Lock
+from typing import Any
+from collections.abc import Callable, Sequence
+from ampel.types import JDict
+
+
+def compile_mask(attribute: str, operator: str, value: Any) -> Callable[[Sequence[JDict]], int]:
+	"""
+	:param operator: comparison operator ('>', '<', '>=', '<=', '==', '!=') or 'exists'
+	:returns: function computing the mask of the datapoints matching the criterion
+	(integer holding one byte per datapoint, 1 if the datapoint matches, 0 otherwise)
+	"""
+
+	attr = repr(attribute)
+	test = f"{attr} in d" if operator == 'exists' else f"{attr} in d and d[{attr}] {operator} v"
+	ns: dict[str, Any] = {'v': value}
+	exec(
+		compile(
+			f"def mask(dps):\n\treturn int.from_bytes(bytes([{test} for d in dps]), 'little')",
+			"<SharedCriteria>", "exec"
+		),
+		ns
+	)
+	return ns['mask']
+
+
+class SharedCriteria:
+	"""
+	Criteria (:class:`~ampel.alert.filter.BasicMultiFilter.PhotoAlertQuery`) registered by several
+	BasicMultiFilter instances (channels), evaluated at most once per alert.
+
+	The datapoints matching a criterion are represented by an integer mask (one byte per datapoint),
+	the number of datapoints matching a condition is thus obtained by ANDing the masks of its criteria
+	and counting the set bits. Masks are computed lazily (criteria of conditions whose result does not matter
+	are not evaluated) and memoized for the datapoints of the last `memo_size` alerts (keyed by identity).
+	"""
+
+	def __init__(self, memo_size: int = 1) -> None:
+		"""
+		:param memo_size: see :class:`~ampel.alert.SharedFilter.SharedFilter`
+		"""
+		self.memo_size = max(memo_size, 1)
+		self._index: dict[tuple[str, str, Any], int] = {}
+		self._funcs: list[Callable[[Sequence[JDict]], int]] = []
+		self._memo: dict[int, tuple[Sequence[JDict], list[None | int]]] = {}
+		self._lock = Lock()
+		self.evaluations = 0
+
+		#: Index of the mask of datapoints with a 'candid' field (see AmpelAlert.get_values)
+		self.base = self.register({'attribute': 'candid', 'operator': 'exists', 'value': True})
+
+
+	def __len__(self) -> int:
+		return len(self._funcs)
+
+
+	def register(self, criterion: JDict) -> int:
+		""" :returns: index of the criterion """
+		key = criterion['attribute'], criterion['operator'], criterion['value']
+		if (i := self._index.get(key)) is None:
+			i = self._index[key] = len(self._funcs)
+			self._funcs.append(compile_mask(*key))
+		return i
+
+
+	def masks(self, dps: Sequence[JDict]) -> list[None | int]:
+		""" :returns: memoized masks of the provided datapoints (None: not computed yet, see :func:`get`) """
+
+		memo = self._memo
+		with self._lock:
+			if (m := memo.get(id(dps))) is None or m[0] is not dps:
+				m = memo[id(dps)] = dps, [None] * len(self._funcs)
+				if len(memo) > self.memo_size:
+					del memo[next(iter(memo))]
+		return m[1]
+
+
+	def get(self, dps: Sequence[JDict], masks: list[None | int], i: int) -> int:
+		""" :returns: mask of criterion `i` for the provided datapoints """
+		if (m := masks[i]) is None:
+			self.evaluations += 1
+			m = masks[i] = self._funcs[i](dps)
+		return m
+
+
+	def clear(self) -> None:
+		""" Releases memoized masks """
+		self._memo.clear()
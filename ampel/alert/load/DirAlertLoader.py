@@ -8,6 +8,7 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from io import BytesIO, StringIO
+from typing import Any
 from ampel.abstract.AbsAlertLoader import AbsAlertLoader
 
 
@@ -26,6 +27,9 @@ class DirAlertLoader(AbsAlertLoader[StringIO | BytesIO]):
 		super().__init__(**kwargs)
 		self.files: list[str] = []
 		self.open_mode = "rb" if self.binary_mode else "r"
+		self._mtimes: dict[str, float] = {}
+		self._resume_after: None | tuple[float, str] = None
+		self._last: None | str = None
 
 
 	def set_extension(self, extension: str) -> None:
@@ -59,12 +63,19 @@ class DirAlertLoader(AbsAlertLoader[StringIO | BytesIO]):
 		self.logger.debug("Building internal file list")
 
 		import glob, os
-		all_files = sorted(
-			glob.glob(
-				os.path.join(self.folder, self.extension)
-			),
-			key=os.path.getmtime
-		)
+		entries = [
+			(os.path.getmtime(f), f)
+			for f in glob.glob(os.path.join(self.folder, self.extension))
+		]
+
+		if self._resume_after:
+			self.logger.debug(f"Ignoring files up to {self._resume_after[1]} (checkpoint)")
+			entries = [el for el in entries if el > self._resume_after]
+
+		# Files are ordered by modification time (and path for identical mtimes)
+		entries.sort()
+		self._mtimes = {f: mtime for mtime, f in entries}
+		all_files = [f for mtime, f in entries]
 
 		if self.min_index is not None:
 			self.logger.debug("Filtering files using min_index criterium")
@@ -91,7 +102,26 @@ class DirAlertLoader(AbsAlertLoader[StringIO | BytesIO]):
 		self.logger.debug(f"File list contains {len(self.files)} elements")
 
 
-	def __next__(self) -> StringIO | BytesIO:
+	def get_checkpoint(self) -> dict[str, Any]:
+		""" :returns: modification time and path of the last returned file """
+		if self._last is None:
+			return {}
+		if (mtime := self._mtimes.get(self._last)) is None:
+			import os
+			mtime = os.path.getmtime(self._last)
+		return {'mtime': mtime, 'path': self._last}
+
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		"""
+		Files older than the checkpoint (or as old and with a lower path) are skipped.
+		Must be called before iteration starts.
+		"""
+		if checkpoint:
+			self._resume_after = checkpoint['mtime'], checkpoint['path']
+
+
+	def next_path(self) -> str:
 
 		if not self.files:
 			self.build_file_list()
@@ -103,5 +133,12 @@ class DirAlertLoader(AbsAlertLoader[StringIO | BytesIO]):
 		if self.logger.verbose > 1:
 			self.logger.debug("Loading " + fpath)
 
+		self._last = fpath
+		return fpath
+
+
+	def __next__(self) -> StringIO | BytesIO:
+
+		fpath = self.next_path()
 		with open(fpath, self.open_mode) as alert_file:
 			return BytesIO(alert_file.read()) if self.binary_mode else StringIO(alert_file.read())
@@ -8,6 +8,7 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 import glob, os
+from typing import Any
 from ampel.abstract.AbsAlertLoader import AbsAlertLoader
 
 
@@ -28,23 +29,37 @@ class DirFileNamesLoader(AbsAlertLoader[str]):
 		super().__init__(**kwargs)
 		self.logger.debug("Building internal file list")
 
-		files = sorted(
-			glob.glob(os.path.join(self.folder, f"*.{self.extension}")),
-			key=os.path.getmtime
+		# Files are ordered by modification time (and path for identical mtimes)
+		self._entries = sorted(
+			(os.path.getmtime(f), f)
+			for f in glob.glob(os.path.join(self.folder, f"*.{self.extension}"))
 		)
 
 		if self.max_entries is not None:
 			self.logger.debug("Filtering files using max_entries criterium")
-			files = files[:self.max_entries]
+			self._entries = self._entries[:self.max_entries]
 
-		self.iter_files = iter(files)
-		self.logger.debug(f"File list contains {len(files)} elements")
+		self.iter_entries = iter(self._entries)
+		self._last: None | tuple[float, str] = None
+		self.logger.debug(f"File list contains {len(self._entries)} elements")
 
 
 	def __next__(self) -> str:
 
-		fpath = next(self.iter_files)
+		self._last = next(self.iter_entries)
+		fpath = self._last[1]
 		if self.logger.verbose > 1:
 			self.logger.debug("Returning " + fpath)
 
 		return fpath
+
+
+	def get_checkpoint(self) -> dict[str, Any]:
+		""" :returns: modification time and path of the last returned file """
+		return {'mtime': self._last[0], 'path': self._last[1]} if self._last else {}
+
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		if checkpoint:
+			after = checkpoint['mtime'], checkpoint['path']
+			self.iter_entries = iter([el for el in self._entries if el > after])
@@ -28,15 +28,7 @@ class DirTaggedAlertLoader(DirAlertLoader):
 
 	def __next__(self) -> tuple[StringIO | BytesIO, None | list[str | int]]: # type: ignore[override]
 
-		if not self.files:
-			self.build_file_list()
-			self.iter_files = iter(self.files)
-
-		if (fpath := next(self.iter_files, None)) is None:
-			raise StopIteration
-
-		if self.logger.verbose > 1:
-			self.logger.debug("Loading " + fpath)
+		fpath = self.next_path()
 
 		# basename("/usr/local/auth.AAA.BBB.py").split(".")[1:-1] -> ['AAA', 'BBB']
 		base = basename(fpath).split(".")
@@ -8,7 +8,7 @@
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
 from io import BytesIO
-from typing import List
+from typing import Any
 from ampel.abstract.AbsAlertLoader import AbsAlertLoader
 
 
@@ -31,10 +31,20 @@ class FileAlertLoader(AbsAlertLoader[BytesIO]):
 			self.logger.info(f"Registering {len(self.files)} file(s) to load")
 
 		self.iter_files = iter(self.files)
+		self.index = 0
 
 	def __iter__(self):
 		return self
 
 	def __next__(self) -> BytesIO:
 		with open(next(self.iter_files), "rb") as alert_file:
+			self.index += 1
 			return BytesIO(alert_file.read())
+
+	def get_checkpoint(self) -> dict[str, Any]:
+		""" :returns: index of the next file to load """
+		return {'index': self.index}
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		self.index = checkpoint['index']
+		self.iter_files = iter(self.files[self.index:])
@@ -9,7 +9,7 @@
 
 import tarfile
 from gzip import GzipFile
-from typing import IO
+from typing import IO, Any
 from ampel.log.AmpelLogger import AmpelLogger
 from ampel.abstract.AbsAlertLoader import AbsAlertLoader
 
@@ -36,6 +36,8 @@ class TarAlertLoader(AbsAlertLoader[IO[bytes]]):
 		super().__init__(**kwargs)
 
 		self.chained_tal: 'None | TarAlertLoader' = None
+		# Archive offset of the member containing the chained tar
+		self._chained_offset = 0
 
 		if self.file_obj:
 			self.tar_file = tarfile.open(fileobj=self.file_obj, mode=self.tar_mode)
@@ -44,12 +46,11 @@ class TarAlertLoader(AbsAlertLoader[IO[bytes]]):
 		else:
 			raise ValueError("Please provide value either for 'file_path' or 'file_obj'")
 
-		if self.start != 0:
-			count = 0
-			for tarinfo in self.tar_file:
-				count += 1
-				if count < self.start:
-					continue
+		# Skip the first 'start' members (use checkpoints to avoid reading them)
+		for i in range(self.start):
+			if self.tar_file.next() is None:
+				break
+		self.tar_file.members.clear() # type: ignore
 
 
 	def __iter__(self):
@@ -99,6 +100,7 @@ class TarAlertLoader(AbsAlertLoader[IO[bytes]]):
 			# Handle tars with nested tars
 			if tar_info.name.endswith('.tar.gz'):
 				self.chained_tal = TarAlertLoader(file_obj=file_obj)
+				self._chained_offset = tar_info.offset
 				if (subfile_obj := self.get_chained_next()) is not None:
 					return subfile_obj
 				else:
@@ -118,3 +120,57 @@ class TarAlertLoader(AbsAlertLoader[IO[bytes]]):
 			return None
 
 		return file_obj
+
+
+	def get_checkpoint(self) -> dict[str, Any]:
+		"""
+		:returns: offset of the next member header in the (uncompressed) archive stream,
+		along with the checkpoint of the nested archive being read, if any
+		"""
+
+		if self.chained_tal is not None:
+			cp: dict[str, Any] = {
+				'offset': self._chained_offset,
+				'nested': self.chained_tal.get_checkpoint()
+			}
+		else:
+			cp = {
+				'offset': self.tar_file.firstmember.offset # type: ignore[attr-defined]
+				if self.tar_file.firstmember else self.tar_file.offset # type: ignore[attr-defined]
+			}
+
+		if self.file_path:
+			cp['file'] = self.file_path
+
+		return cp
+
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		"""
+		Seeks directly to the provided position.
+		Note that gzip compressed archives are nonetheless decompressed up to this position.
+		"""
+
+		if self.file_path and checkpoint.get('file', self.file_path) != self.file_path:
+			raise ValueError(f"Checkpoint of {checkpoint['file']} cannot be applied to {self.file_path}")
+
+		# Offset 0: the first member, read by TarFile upon opening, is the next one
+		# (nested archives can be the first member of the archive)
+		if checkpoint['offset']:
+			# The member read by TarFile upon opening is discarded, the
+			# next call to TarFile.next() reads the header located at self.offset
+			self.tar_file.firstmember = None # type: ignore[attr-defined]
+			self.tar_file.offset = checkpoint['offset'] # type: ignore[attr-defined]
+			self.tar_file.members.clear() # type: ignore
+
+		if 'nested' in checkpoint:
+
+			tar_info = self.tar_file.next()
+			if tar_info is None:
+				raise ValueError(f"Invalid checkpoint: {checkpoint}")
+
+			file_obj = self.tar_file.extractfile(tar_info)
+			assert file_obj is not None
+			self.chained_tal = TarAlertLoader(file_obj=file_obj)
+			self.chained_tal.set_checkpoint(checkpoint['nested'])
+			self._chained_offset = tar_info.offset
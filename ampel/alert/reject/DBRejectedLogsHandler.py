@@ -7,9 +7,11 @@
 # Last Modified Date:  09.05.2020
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from time import time
+from time import time, perf_counter
+from asyncio import Future, get_running_loop
 from logging import DEBUG, WARNING, LogRecord
 from typing import Any
+from concurrent.futures import Executor
 from pymongo.errors import BulkWriteError
 from pymongo.operations import UpdateOne
 
@@ -19,6 +21,7 @@ from ampel.log.LightLogRecord import LightLogRecord
 from ampel.log.AmpelLoggingError import AmpelLoggingError
 from ampel.log.LoggingErrorReporter import LoggingErrorReporter
 from ampel.core.ContextUnit import ContextUnit
+from ampel.alert.AdaptiveFlushSize import AdaptiveFlushSize
 
 
 class DBRejectedLogsHandler(ContextUnit):
@@ -35,6 +38,9 @@ class DBRejectedLogsHandler(ContextUnit):
 	single_rej_col: bool = False
 	aggregate_interval: int = 1
 	flush_len: int = 1000
+	#: Flush automatically when more than `flush_len` documents are buffered.
+	#: If False, :func:`check_flush` or :func:`aflush` must be called by the owner.
+	auto_flush: bool = True
 	log_dicts: list[dict[str, Any]] = []
 	prev_record: None | LightLogRecord | LogRecord = None
 	run_id: None | int | list[int] = None
@@ -58,6 +64,13 @@ class DBRejectedLogsHandler(ContextUnit):
 		col_name = "rejected" if self.single_rej_col else self.channel
 		self.context.db.enable_rejected_collections([col_name])
 		self.col = self.context.db.get_collection(col_name)
+		self.flush_sizer: None | AdaptiveFlushSize = None
+
+
+	def set_flush_sizer(self, flush_sizer: AdaptiveFlushSize) -> None:
+		""" flush_len will be adjusted by the provided instance after each insertion """
+		self.flush_sizer = flush_sizer
+		self.flush_len = flush_sizer.size
 
 
 	def set_run_id(self, run_id: int | list[int]) -> None:
@@ -92,7 +105,7 @@ class DBRejectedLogsHandler(ContextUnit):
 
 			else:
 
-				if len(self.log_dicts) > self.flush_len:
+				if self.auto_flush and len(self.log_dicts) > self.flush_len:
 					self.flush()
 
 				# If duplication exists between keys in extra and in standard rec,
@@ -128,6 +141,11 @@ class DBRejectedLogsHandler(ContextUnit):
 			raise AmpelLoggingError from None
 
 
+	def check_flush(self) -> None:
+		if len(self.log_dicts) > self.flush_len:
+			self.flush()
+
+
 	def flush(self) -> None:
 		""" Will raise Exception if DB issue occurs """
 
@@ -135,14 +153,41 @@ class DBRejectedLogsHandler(ContextUnit):
 		if not self.log_dicts:
 			return
 
-		try:
+		self._insert(self._detach())
+
+
+	def aflush(self, executor: None | Executor = None) -> Future:
+		"""
+		Awaitable flush: buffered log entries are detached right away
+		(new records can be handled while the insertion is pending),
+		the database insertion is performed by the provided executor.
+		Must be called from a running event loop.
+		"""
+
+		loop = get_running_loop()
+		if not self.log_dicts:
+			fut = loop.create_future()
+			fut.set_result(None)
+			return fut
+
+		return loop.run_in_executor(executor, self._insert, self._detach())
 
-			# Empty referenced logs entries
-			dicts = self.log_dicts
-			self.log_dicts = []
-			self.prev_record = None
 
+	def _detach(self) -> list[dict[str, Any]]:
+		""" Empty referenced logs entries """
+		dicts = self.log_dicts
+		self.log_dicts = []
+		self.prev_record = None
+		return dicts
+
+
+	def _insert(self, dicts: list[dict[str, Any]]) -> None:
+
+		try:
+			start = perf_counter()
 			self.col.insert_many(dicts, ordered=False)
+			if self.flush_sizer:
+				self.flush_len = self.flush_sizer.observe(len(dicts), perf_counter() - start)
 
 		except BulkWriteError as bwe:
 
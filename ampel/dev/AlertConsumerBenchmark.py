@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/dev/AlertConsumerBenchmark.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+import sys, resource
+from time import perf_counter
+from random import Random
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from itertools import product
+from contextlib import nullcontext
+from unittest.mock import patch
+from multiprocessing import get_context
+from typing import Any, cast
+from collections.abc import Sequence
+from ampel.types import StockId
+from ampel.base.LogicalUnit import LogicalUnit
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.AlertConsumer import AlertConsumer
+from ampel.dev.DevAmpelContext import DevAmpelContext
+from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
+
+
+def make_alerts(
+	count: int, datapoints: int = 10, stocks: None | int = None, seed: int = 0
+) -> list[AmpelAlert]:
+	"""
+	Generates synthetic alerts whose datapoints carry ZTF-like fields
+	(candid, jd, fid, magpsf, sigmapsf, rb, magdiff).
+
+	:param datapoints: number of datapoints per alert
+	:param stocks: number of distinct stocks (default: one stock per alert)
+	"""
+	rand = Random(seed)
+	alerts = []
+	for i in range(count):
+		stock: StockId = i % stocks if stocks else i
+		alerts.append(
+			AmpelAlert(
+				id = i,
+				stock = stock,
+				datapoints = [
+					{
+						'id': i * datapoints + j,
+						'candid': i * datapoints + j,
+						'jd': 2459000.5 + i + j / datapoints,
+						'fid': rand.randint(1, 3),
+						'magpsf': rand.uniform(15., 21.),
+						'sigmapsf': rand.uniform(0.01, 0.3),
+						'rb': rand.random(),
+						'magdiff': rand.uniform(-0.5, 0.5)
+					}
+					for j in range(datapoints)
+				]
+			)
+		)
+	return alerts
+
+
+def peak_rss() -> int:
+	""" :returns: peak resident set size of the current process in bytes """
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def collect_time() -> dict[str, tuple[float, float]]:
+	""" :returns: current (sum, count) of the alertprocessor_time histogram for each section """
+	ret: dict[str, list[float]] = {}
+	for metric in AmpelMetricsRegistry.registry().collect():
+		if metric.name != 'ampel_alertprocessor_time_seconds':
+			continue
+		for sample in metric.samples:
+			if sample.name.endswith('_sum'):
+				ret.setdefault(sample.labels['section'], [0., 0.])[0] = sample.value
+			elif sample.name.endswith('_count'):
+				ret.setdefault(sample.labels['section'], [0., 0.])[1] = sample.value
+	return {k: (v[0], v[1]) for k, v in ret.items()}
+
+
+def collect_counter(name: str, **labels: str) -> float:
+	""" :returns: sum of the values of the matching samples of a counter """
+	return sum(
+		sample.value
+		for metric in AmpelMetricsRegistry.registry().collect()
+		for sample in metric.samples
+		if sample.name == name and labels.items() <= sample.labels.items()
+	)
+
+
+class AlertConsumerBenchmark:
+	"""
+	End-to-end throughput benchmark of :class:`~ampel.alert.AlertConsumer.AlertConsumer`.
+
+	Synthetic alerts (see :func:`make_alerts`) are fed through a UnitTestAlertSupplier
+	into an AlertConsumer ingesting into a mongomock database (default)
+	or into a local mongod (parameter `mongo`, ex: "mongodb://localhost:27017").
+	Each scenario is a combination of the parameters provided to :meth:`benchmark`:
+	number of channels, filter type ('none' or 'BasicMultiFilter'), usage of reject registers
+	and db log format ('standard' or 'compact').
+
+	Reported for each scenario:
+	  - alerts/s (wall time of AlertConsumer.run(), alert generation and unit instantiation excluded)
+	  - fraction of alerts accepted by at least one channel
+	  - time spent in each section of the alertprocessor_time histogram (seconds per alert)
+	  - peak RSS of the process that ran the scenario
+
+	Example::
+
+	  AlertConsumerBenchmark("ampel_conf.yaml").benchmark(
+	      alerts=10000, datapoints=[10, 100], channels=[1, 4],
+	      filters=['none', 'BasicMultiFilter'], registers=[False, True]
+	  )
+
+	Note: peak RSS is a high-water mark (getrusage) and can only decrease between scenarios
+	when these are run in separate processes (parameter `isolate`, default).
+	"""
+
+	#: accepts alerts with at least one datapoint with rb > 0.9 and magpsf < 19
+	#: (about half of the alerts generated with 10 datapoints)
+	filter_config: dict[str, Any] = {
+		"filters": [
+			{
+				"criteria": [
+					{"attribute": "rb", "operator": ">", "value": 0.9},
+					{"attribute": "magpsf", "operator": "<", "value": 19}
+				],
+				"len": 1,
+				"operator": ">="
+			}
+		]
+	}
+
+
+	def __init__(self,
+		config: str | Path | dict[str, Any],
+		mongo: None | str = None,
+		db_prefix: str = "AmpelBenchmark",
+		isolate: bool = True
+	) -> None:
+		"""
+		:param config: ampel config (path or dict)
+		:param mongo: mongodb uri, mongomock is used if None.
+		Beware: databases with prefix `db_prefix` are purged before each scenario.
+		:param isolate: run each scenario in a forked process
+		"""
+		self.config = str(config) if isinstance(config, Path) else config
+		self.mongo = mongo
+		self.db_prefix = db_prefix
+		self.isolate = isolate
+
+
+	def benchmark(self,
+		alerts: int = 1000,
+		datapoints: int | Sequence[int] = 10,
+		channels: int | Sequence[int] = (1, 4),
+		filters: str | Sequence[str] = ('none', 'BasicMultiFilter'),
+		registers: bool | Sequence[bool] = (False, True),
+		db_log_formats: str | Sequence[str] = ('standard', 'compact'),
+		verbose: bool = True,
+		**consumer_config: Any
+	) -> list[dict[str, Any]]:
+		"""
+		Runs all combinations of the provided parameters.
+		Scenarios using reject registers without filter are skipped (registers record rejected alerts).
+
+		:param alerts: number of alerts per scenario
+		:param consumer_config: additional AlertConsumer parameters (ex: batch_size, filter_threads)
+		:returns: one result dict per scenario
+		"""
+
+		results = []
+		for dps, chans, filt, reg, fmt in product(
+			[datapoints] if isinstance(datapoints, int) else datapoints,
+			[channels] if isinstance(channels, int) else channels,
+			[filters] if isinstance(filters, str) else filters,
+			[registers] if isinstance(registers, bool) else registers,
+			[db_log_formats] if isinstance(db_log_formats, str) else db_log_formats
+		):
+
+			if reg and filt == 'none':
+				continue
+
+			scenario: dict[str, Any] = {
+				'datapoints': dps, 'channels': chans, 'filter': filt,
+				'register': reg, 'db_log_format': fmt
+			}
+
+			if self.isolate:
+				ctx = get_context("fork")
+				queue = ctx.Queue()
+				p = ctx.Process(
+					target = self._run_isolated, args = (queue, alerts, consumer_config, scenario)
+				)
+				p.start()
+				res = queue.get()
+				p.join()
+				if isinstance(res, BaseException):
+					raise res
+			else:
+				res = self.run_scenario(alerts, consumer_config=consumer_config, **scenario)
+
+			results.append(res)
+			if verbose:
+				self.print_result(res)
+
+		return results
+
+
+	def _run_isolated(self,
+		queue: Any, alerts: int, consumer_config: dict[str, Any], scenario: dict[str, Any]
+	) -> None:
+		try:
+			queue.put(self.run_scenario(alerts, consumer_config=consumer_config, **scenario))
+		except BaseException as e:
+			queue.put(e)
+
+
+	def run_scenario(self,
+		alerts: int, datapoints: int, channels: int, filter: str,
+		register: bool, db_log_format: str, consumer_config: None | dict[str, Any] = None
+	) -> dict[str, Any]:
+
+		with (
+			TemporaryDirectory() as tmp_dir,
+			nullcontext() if self.mongo else self._patch_mongomock()
+		):
+
+			custom_conf: dict[str, Any] = {"resource.folder.rejected_alerts": tmp_dir}
+			if self.mongo:
+				custom_conf["resource.mongo"] = self.mongo
+
+			# AmpelContext.load instantiates the class it is called on
+			context = cast(
+				DevAmpelContext,
+				DevAmpelContext.load(self.config, db_prefix=self.db_prefix, custom_conf=custom_conf)
+			)
+			context.db.drop_all_databases()
+
+			from ampel.alert.reject.DBRejectedLogsHandler import DBRejectedLogsHandler
+			from ampel.alert.reject.GeneralActiveAlertRegister import GeneralActiveAlertRegister
+			# register_unit handles context units as well (its annotation only mentions logical units)
+			for Unit in (DBRejectedLogsHandler, GeneralActiveAlertRegister):
+				context.register_unit(cast(type[LogicalUnit], Unit))
+
+			directives = []
+			for i in range(channels):
+				chan = f"BENCHMARK_{i}"
+				context.add_channel(chan)
+				directive: dict[str, Any] = {"channel": chan}
+				if filter != 'none':
+					directive['filter'] = {
+						"unit": filter,
+						"config": self.filter_config if filter == 'BasicMultiFilter' else {},
+						"reject": {"log": {"unit": "DBRejectedLogsHandler"}}
+					}
+					if register:
+						directive['filter']['reject']['register'] = {"unit": "GeneralActiveAlertRegister"}
+				directives.append(directive)
+
+			ac = AlertConsumer(
+				context = context,
+				process_name = "AlertConsumerBenchmark",
+				shaper = "NoShaper",
+				directives = directives,
+				db_log_format = db_log_format,
+				supplier = {
+					"unit": "UnitTestAlertSupplier",
+					"config": {"alerts": make_alerts(alerts, datapoints)}
+				},
+				**(consumer_config or {})
+			)
+
+			times = collect_time()
+			accepted = collect_counter('ampel_alertprocessor_alerts_accepted_total', channel='any')
+			start = perf_counter()
+			processed = ac.run()
+			elapsed = perf_counter() - start
+			accepted = collect_counter('ampel_alertprocessor_alerts_accepted_total', channel='any') - accepted
+
+			stages = {}
+			for k, v in collect_time().items():
+				s, c = v[0] - times.get(k, (0., 0.))[0], v[1] - times.get(k, (0., 0.))[1]
+				if c:
+					stages[k] = s / max(processed, 1)
+
+		return {
+			'datapoints': datapoints, 'channels': channels, 'filter': filter,
+			'register': register, 'db_log_format': db_log_format,
+			'alerts': processed,
+			'seconds': elapsed,
+			'alerts_per_sec': processed / elapsed if elapsed else 0.,
+			'accepted': accepted / processed if processed else 0.,
+			'stages': stages,
+			'peak_rss': peak_rss()
+		}
+
+
+	def _patch_mongomock(self) -> Any:
+		import mongomock # type: ignore[import]
+		return patch("ampel.core.AmpelDB.MongoClient", mongomock.MongoClient)
+
+
+	@staticmethod
+	def print_result(res: dict[str, Any]) -> None:
+		print(
+			f"dps: {res['datapoints']}, channels: {res['channels']}, filter: {res['filter']}, "
+			f"register: {res['register']}, db_log_format: {res['db_log_format']}"
+		)
+		print(
+			f"  {res['alerts_per_sec']:.1f} alerts/s ({res['alerts']} alerts in {res['seconds']:.2f}s), "
+			f"accepted: {res['accepted']:.0%}, peak rss: {res['peak_rss'] / 2**20:.1f} MB"
+		)
+		for k, v in sorted(res['stages'].items(), key=lambda x: -x[1]):
+			print(f"  {k}: {v * 1e6:.1f} us/alert")
+		print('')
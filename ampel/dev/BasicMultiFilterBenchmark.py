@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/dev/BasicMultiFilterBenchmark.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from time import perf_counter
+from typing import Any
+from collections.abc import Sequence
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter, np
+from ampel.dev.AlertConsumerBenchmark import AlertConsumerBenchmark, make_alerts
+
+
+def benchmark_backends(
+	filters: None | Sequence[dict[str, Any]] = None,
+	lengths: Sequence[int] = (10, 100, 1000),
+	alerts: int = 1000,
+	repeat: int = 3,
+	verbose: bool = True
+) -> dict[int, dict[str, float]]:
+	"""
+	Compares the execution backends of :class:`~ampel.alert.filter.BasicMultiFilter.BasicMultiFilter`
+	for alerts (see :func:`~ampel.dev.AlertConsumerBenchmark.make_alerts`) with different numbers of datapoints:
+
+	- 'generic': one get_values() scan per condition (implementation prior to compiled evaluators)
+	- 'python': single pass compiled evaluator
+	- 'numpy': vectorized evaluation (skipped if numpy is not installed)
+
+	:param filters: BasicMultiFilter conditions (default: :attr:`AlertConsumerBenchmark.filter_config`)
+	:param lengths: numbers of datapoints per alert
+	:returns: best time per alert in microseconds for each length and backend
+	"""
+
+	logger = AmpelLogger.get_logger(console=False)
+	conf = {'filters': filters or AlertConsumerBenchmark.filter_config['filters'], 'logger': logger}
+	units = {
+		'generic': BasicMultiFilter(**conf)._process_generic,
+		'python': BasicMultiFilter(**conf, backend='python').process
+	}
+
+	if np is not None:
+		units['numpy'] = BasicMultiFilter(**conf, backend='numpy', numpy_min_datapoints=0).process
+
+	ret: dict[int, dict[str, float]] = {}
+
+	for length in lengths:
+
+		samples = make_alerts(alerts, datapoints=length)
+		ret[length] = {}
+
+		for name, func in units.items():
+			best = float('inf')
+			for i in range(repeat):
+				start = perf_counter()
+				for alert in samples:
+					func(alert)
+				best = min(best, perf_counter() - start)
+			ret[length][name] = best / alerts * 1e6
+
+		if verbose:
+			print(
+				f"{length} datapoints: " +
+				", ".join(f"{k}: {v:.1f} us/alert" for k, v in ret[length].items())
+			)
+
+	return ret
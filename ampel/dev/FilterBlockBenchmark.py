@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File:                Ampel-alerts/ampel/dev/FilterBlockBenchmark.py
+# License:             BSD-3-Clause
+# Author:              valery brinnel <firstname.lastname@gmail.com>
+# Date:                15.10.2026
+# Last Modified Date:  15.10.2026
+# Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
+
+from time import perf_counter
+from typing import Any
+from ampel.core.AmpelContext import AmpelContext
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.model.ingest.FilterModel import FilterModel
+from ampel.alert.FilterBlock import FilterBlock
+from ampel.dev.AlertConsumerBenchmark import make_alerts
+
+
+def reject(alert: Any) -> None:
+	return None
+
+
+def benchmark_rejection(
+	context: AmpelContext,
+	filter_model: None | FilterModel = None,
+	alerts: int = 100000,
+	repeat: int = 5,
+	overhead_only: bool = True,
+	verbose: bool = True
+) -> dict[str, float]:
+	"""
+	Micro-benchmark of the rejection path of :class:`~ampel.alert.FilterBlock.FilterBlock`:
+	compares the generic :func:`~ampel.alert.FilterBlock.FilterBlock.filter` with the fast path
+	selected by :func:`~ampel.alert.FilterBlock.FilterBlock.ready` for blocks without rejected logs handler,
+	register, auto complete or check_new.
+
+	:param filter_model: filter to use, must reject the generated alerts (default: rejecting BasicMultiFilter)
+	:param overhead_only: replace the filter unit with a function rejecting all alerts
+	so that only the FilterBlock overhead is measured
+	:returns: best time per alert in nanoseconds for the keys 'generic' and 'fast'
+	"""
+
+	if filter_model is None:
+		filter_model = FilterModel(
+			unit = "BasicMultiFilter",
+			config = {
+				"filters": [
+					{
+						"criteria": [{"attribute": "rb", "operator": ">", "value": 1}],
+						"len": 1,
+						"operator": ">="
+					}
+				]
+			}
+		)
+
+	logger = AmpelLogger.get_logger(console=False)
+	fb = FilterBlock(0, context, "BENCHMARK", filter_model, "FilterBlockBenchmark", logger)
+	fb.ready(logger, 0)
+
+	if fb.filter != fb._filter_reject_fast: # type: ignore[comparison-overlap]
+		raise ValueError("Rejection fast path is not applicable to the provided filter model")
+
+	if overhead_only:
+		fb.filter_func = reject
+
+	funcs = {'generic': FilterBlock.filter.__get__(fb), 'fast': fb.filter}
+
+	samples = make_alerts(alerts, datapoints=1)
+	ret: dict[str, float] = {}
+
+	for name, func in funcs.items():
+		best = float('inf')
+		for i in range(repeat):
+			start = perf_counter()
+			for alert in samples:
+				func(alert)
+			best = min(best, perf_counter() - start)
+		ret[name] = best / alerts * 1e9
+
+	fb.done()
+
+	if verbose:
+		for k, v in ret.items():
+			print(f"{k}: {v:.0f} ns/alert")
+		print(f"speedup: {ret['generic'] / ret['fast']:.2f}x")
+
+	return ret
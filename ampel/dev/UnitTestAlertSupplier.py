@@ -7,7 +7,7 @@
 # Last Modified Date:  24.11.2021
 # Last Modified By:    valery brinnel <firstname.lastname@gmail.com>
 
-from typing import List
+from typing import Any
 from ampel.protocol.AmpelAlertProtocol import AmpelAlertProtocol
 from ampel.abstract.AbsAlertSupplier import AbsAlertSupplier
 
@@ -31,10 +31,22 @@ class UnitTestAlertSupplier(AbsAlertSupplier):
 	def __init__(self, **kwargs) -> None:
 		super().__init__(**kwargs)
 		self.it = iter(self.alerts)
+		self.index = 0
 
 	def __next__(self):
-		return next(self.it)
+		alert = next(self.it)
+		self.index += 1
+		return alert
 
 	# Mandatory implementation
 	def __iter__(self):
-		return self.it
+		for alert in self.it:
+			self.index += 1
+			yield alert
+
+	def get_checkpoint(self) -> dict[str, Any]:
+		return {'index': self.index}
+
+	def set_checkpoint(self, checkpoint: dict[str, Any]) -> None:
+		self.index = checkpoint['index']
+		self.it = iter(self.alerts[self.index:])
@@ -26,3 +26,28 @@ def dummy_units(dev_context: DevAmpelContext):
 
     for unit in (DummyStockT2Unit, DummyPointT2Unit, DummyStateT2Unit):
         dev_context.register_unit(unit)
+
+
+@pytest.fixture
+def random_filters():
+    """
+    Returns a function generating random BasicMultiFilter conditions
+    from (attribute, low, high) tuples
+    """
+    operators = [">", "<", ">=", "<=", "==", "!="]
+
+    def make(rand, attributes, max_len=6, max_conditions=4):
+        return [
+            {
+                "criteria": [
+                    {"attribute": attr, "operator": rand.choice(operators), "value": rand.uniform(lo, hi)}
+                    for attr, lo, hi in rand.sample(attributes, rand.randint(0, 3))
+                ],
+                "len": rand.randint(0, max_len),
+                "operator": rand.choice(operators),
+                "logicalConnection": rand.choice(["AND", "OR"]),
+            }
+            for _ in range(rand.randint(1, max_conditions))
+        ]
+
+    return make
@@ -0,0 +1,9 @@
+from ampel.alert.AdaptiveFlushSize import AdaptiveFlushSize
+
+
+def test_adaptive_flush_size():
+    sizer = AdaptiveFlushSize(500, "test", target_latency=0.25, min_size=10)
+    assert sizer.observe(100, 1.0) == 25, "slow writes shrink the flush size"
+    assert sizer.observe(0, 0) == 25
+    sizer = AdaptiveFlushSize(500, "test", target_latency=0.25, min_size=10)
+    assert sizer.observe(100, 0.001) == 20000, "fast writes enlarge the flush size (up to max_size)"
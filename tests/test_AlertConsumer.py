@@ -8,7 +8,7 @@
 # Last Modified By:    vb
 
 import pytest
-import os, signal, time, threading
+import os, signal, time, threading, asyncio, json
 from contextlib import contextmanager
 
 from ampel.dev.DevAmpelContext import DevAmpelContext
@@ -17,11 +17,26 @@ from ampel.model.ingest.IngestDirective import IngestDirective
 from ampel.model.ingest.T1Combine import T1Combine
 from ampel.model.ingest.T2Compute import T2Compute
 
+from ampel.abstract.AbsAsyncAlertSupplier import AbsAsyncAlertSupplier
+from ampel.core.ContextUnit import ContextUnit
 from ampel.alert.AlertConsumer import AlertConsumer
+from ampel.alert.reject.GeneralAlertRegister import GeneralAlertRegister
+from ampel.alert.StockIndex import StockIndex
+from ampel.alert.AsyncAlertConsumer import AsyncAlertConsumer
 from ampel.alert.AlertConsumerError import AlertConsumerError
+from ampel.alert.QueueAlertSupplier import QueueAlertSupplier
+from ampel.alert.ReadAheadAlertSupplier import ReadAheadAlertSupplier
+from ampel.alert.ShardedAlertConsumer import ShardedAlertConsumer, get_shard
+from ampel.alert.FilterBlock import FilterBlock
+from ampel.alert.FilterBlocksHandler import FilterBlocksHandler
 from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.abstract.AbsAlertFilter import AbsAlertFilter
 from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter
 from ampel.dev.UnitTestAlertSupplier import UnitTestAlertSupplier
+from ampel.dev.AlertConsumerBenchmark import AlertConsumerBenchmark, make_alerts
+from ampel.dev.FilterBlockBenchmark import benchmark_rejection
+from ampel.log.AmpelLogger import AmpelLogger
+from ampel.log.LightLogRecord import LightLogRecord
 from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
 from ampel.model.ingest.FilterModel import FilterModel
 
@@ -209,6 +224,55 @@ def test_suspend_in_supplier(dev_context, single_source_directive):
     t.join()
 
 
+def test_suspend_in_supplier_batch(dev_context, single_source_directive):
+
+    # simulate a producer that blocks once while waiting for upstream input
+    class StallingAlertSupplier(UnitTestAlertSupplier):
+        def __iter__(self):
+            while True:
+                if self.index == 2 and not stalled:
+                    stalled.append(True)
+                    time.sleep(3)
+                try:
+                    el = next(self.it)
+                except StopIteration:
+                    return
+                self.index += 1
+                yield el
+
+    stalled: list[bool] = []
+    dev_context.register_unit(StallingAlertSupplier)
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        batch_size=5,
+        supplier={
+            "unit": "StallingAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=f"stock{i}", datapoints=[{"id": i}])
+                    for i in range(5)
+                ]
+            },
+        },
+    )
+
+    def alarm():
+        time.sleep(0.5)
+        os.kill(os.getpid(), signal.SIGINT)
+
+    t = threading.Thread(target=alarm)
+    t.start()
+    t0 = time.time()
+    assert ap.run() == 2, "alerts of the partial batch were processed"
+    assert time.time() - t0 < 2, "AP suspended before supplier timed out"
+    t.join()
+    assert ap.run() == 3
+    assert dev_context.db.get_collection("stock").count_documents({}) == 5
+
+
 def test_suspend_in_critical_section(dev_context, single_source_directive, monkeypatch):
     monkeypatch.setattr(
         BasicMultiFilter, "process", lambda *args: os.kill(os.getpid(), signal.SIGINT)
@@ -230,3 +294,1188 @@ def test_suspend_in_critical_section(dev_context, single_source_directive, monke
     )
     assert ap.run() == 1, "AP successfully processes alert"
     assert ap._cancel_run == AlertConsumerError.SIGINT
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 5])
+def test_batch_size(dev_context, single_source_directive, batch_size):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={
+            "filters": [
+                {
+                    "criteria": [
+                        {"attribute": "nonesuch", "value": 0, "operator": "=="}
+                    ],
+                    "len": 0,
+                    "operator": "==",
+                }
+            ]
+        },
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        iter_max=3,
+        batch_size=batch_size,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=f"stock{i}", datapoints=[{"id": i}])
+                    for i in range(5)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 3, "iter_max caps batches"
+        assert ap.run() == 2
+
+    assert dev_context.db.get_collection("stock").count_documents({}) == 5
+    assert stats[("ampel_alertprocessor_alerts_processed_total", ())] == 5
+    assert (
+        stats[
+            (
+                "ampel_alertprocessor_alerts_accepted_total",
+                (("channel", "any"),),
+            )
+        ]
+        == 5
+    )
+
+
+def test_sharded_consumer(dev_context, single_source_directive):
+    dev_context.register_unit(QueueAlertSupplier)
+    alerts = [
+        AmpelAlert(id=i, stock=stock, datapoints=[{"id": i}])
+        for i, stock in enumerate([1, 2, 3, 1, 2, "ZTFabc", "ZTFabc"])
+    ]
+    sac = ShardedAlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        workers=2,
+        chunk_size=2,
+        supplier={"unit": "UnitTestAlertSupplier", "config": {"alerts": alerts}},
+        consumer={
+            "shaper": "NoShaper",
+            "iter_max": 2,
+            "directives": [single_source_directive],
+        },
+    )
+    assert sac.run() == len(alerts)
+    assert get_shard("ZTFabc", 2) == get_shard("ZTFabc", 2)
+    assert [get_shard(el, 2) for el in (1, 2, 3)] == [1, 0, 1]
+
+
+def test_sharded_consumer_worker_failure(dev_context, single_source_directive, monkeypatch):
+    dev_context.register_unit(QueueAlertSupplier)
+    work = ShardedAlertConsumer._work
+
+    def failing_work(self, shard, queue, counts):
+        if shard == 1:
+            os._exit(3)
+        work(self, shard, queue, counts)
+
+    monkeypatch.setattr(ShardedAlertConsumer, "_work", failing_work)
+    sac = ShardedAlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        workers=2,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(10)]},
+        },
+        consumer={"shaper": "NoShaper", "directives": [single_source_directive]},
+    )
+    stats = {}
+    with collect_diff(stats), pytest.raises(RuntimeError):
+        sac.run()
+    # odd stock ids are routed to the failing worker
+    assert stats[("ampel_alertprocessor_alerts_dropped_total", ())] == 5
+
+
+@pytest.mark.parametrize("max_datapoints", [None, 1])
+def test_read_ahead_supplier(dev_context, single_source_directive, max_datapoints):
+    dev_context.register_unit(ReadAheadAlertSupplier)
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        iter_max=3,
+        supplier={
+            "unit": "ReadAheadAlertSupplier",
+            "config": {
+                "queue_size": 2,
+                "max_datapoints": max_datapoints,
+                "supplier": {
+                    "unit": "UnitTestAlertSupplier",
+                    "config": {
+                        "alerts": [
+                            AmpelAlert(id=i, stock=i, datapoints=[{"id": i}, {"id": -i}])
+                            for i in range(1, 6)
+                        ]
+                    },
+                },
+            },
+        },
+    )
+    assert ap.process_alerts() == 5
+    assert dev_context.db.get_collection("stock").count_documents({}) == 5
+
+
+@pytest.mark.parametrize("timing_sample,timed", [(0, 0), (1, 4), (2, 2)])
+def test_timing_sample(dev_context, single_source_directive, timing_sample, timed):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter", config={"filters": []}
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        timing_sample=timing_sample,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+
+    for section in ("filter.TEST_CHANNEL", "push", "log_flush"):
+        assert (
+            stats.get(
+                ("ampel_alertprocessor_time_seconds_count", (("section", section),)), 0
+            )
+            == timed
+        )
+
+
+@pytest.mark.parametrize("filter_threads", [0, 2])
+def test_filter_threads(dev_context, single_source_directive, filter_threads):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={
+            "filters": [
+                {
+                    "criteria": [
+                        {"attribute": "nonesuch", "value": 0, "operator": "=="}
+                    ],
+                    "len": 0,
+                    "operator": "==",
+                }
+            ]
+        },
+    )
+    rejecting_directive = IngestDirective(
+        channel="LONG_CHANNEL",
+        filter=FilterModel(
+            unit="BasicMultiFilter",
+            config={
+                "filters": [
+                    {
+                        "criteria": [
+                            {"attribute": "nonesuch", "value": 0, "operator": "=="}
+                        ],
+                        "len": 1,
+                        "operator": ">=",
+                    }
+                ]
+            },
+        ),
+        ingest=single_source_directive.ingest,
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive, rejecting_directive],
+        batch_size=3,
+        filter_threads=filter_threads,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+
+    assert dev_context.db.get_collection("stock").count_documents({}) == 4
+    for channel, accepted in (("TEST_CHANNEL", 4), ("LONG_CHANNEL", 0)):
+        assert (
+            stats.get(
+                ("ampel_alertprocessor_alerts_accepted_total", (("channel", channel),)), 0
+            )
+            == accepted
+        )
+
+
+class AsyncUnitTestAlertSupplier(AbsAsyncAlertSupplier):
+    alerts: list = []
+
+    async def __aiter__(self):
+        for alert in self.alerts:
+            await asyncio.sleep(0)
+            yield alert
+
+
+class BatchFilter(AbsAlertFilter):
+    """ Accepts alerts with even ids, evaluates batches natively """
+    log_evaluations: bool = False
+
+    def process(self, alert):
+        if self.log_evaluations:
+            self.logger.info(f"evaluating {alert.id}")
+        return alert.id % 2 == 0
+
+    def process_batch(self, alerts):
+        return [self.process(alert) for alert in alerts]
+
+
+rejected_records: list = []
+
+
+class RecordingRejectedLogsHandler(ContextUnit):
+    channel: str
+    logger: AmpelLogger
+    level: int = 0
+
+    def set_run_id(self, run_id):
+        pass
+
+    def handle(self, record):
+        rejected_records.append(record)
+
+    def flush(self):
+        pass
+
+
+@pytest.mark.parametrize("supplier", ["UnitTestAlertSupplier", "AsyncUnitTestAlertSupplier"])
+def test_async_consumer(dev_context, single_source_directive, supplier):
+    dev_context.register_unit(AsyncUnitTestAlertSupplier)
+    ap = AsyncAlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        iter_max=4,
+        batch_size=3,
+        updates_buffer_size=1,
+        max_pending_flushes=1,
+        supplier={
+            "unit": supplier,
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(5)
+                ]
+            },
+        },
+    )
+    assert ap.run() == 4
+    assert dev_context.db.get_collection("stock").count_documents({}) == 4
+    assert ap.run() == 1
+    assert dev_context.db.get_collection("stock").count_documents({}) == 5
+
+
+def test_async_consumer_signal(dev_context, single_source_directive):
+
+    # simulate a producer that blocks once while waiting for upstream input
+    class StallingAsyncAlertSupplier(AsyncUnitTestAlertSupplier):
+        async def __aiter__(self):
+            for i, alert in enumerate(self.alerts):
+                if i == 2:
+                    await asyncio.sleep(2)
+                yield alert
+
+    dev_context.register_unit(StallingAsyncAlertSupplier)
+    ap = AsyncAlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        supplier={
+            "unit": "StallingAsyncAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+
+    def alarm():
+        time.sleep(0.5)
+        os.kill(os.getpid(), signal.SIGINT)
+
+    t = threading.Thread(target=alarm)
+    t.start()
+    t0 = time.time()
+    assert ap.run() == 2
+    assert time.time() - t0 < 1.5, "signal interrupts waiting for alerts"
+    t.join()
+    # the supplier is not closed, the pending alert is processed by the next run
+    assert ap.run() == 2
+    assert dev_context.db.get_collection("stock").count_documents({}) == 4
+
+
+def test_checkpoint(dev_context, single_source_directive, tmp_path):
+    config = dict(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        iter_max=3,
+        batch_size=2,
+        checkpoint_file=str(tmp_path / "checkpoint.json"),
+        checkpoint_interval=0,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(5)
+                ]
+            },
+        },
+    )
+    assert AlertConsumer(**config).run() == 3
+    with open(tmp_path / "checkpoint.json") as f:
+        assert json.load(f)["checkpoint"] == {"index": 3}
+
+    # a new consumer resumes after the third alert
+    assert AlertConsumer(**config).process_alerts() == 2
+    assert dev_context.db.get_collection("stock").count_documents({}) == 5
+
+
+@pytest.mark.parametrize("failure", ["bulk_write", "finish"])
+def test_checkpoint_failure(dev_context, single_source_directive, tmp_path, monkeypatch, failure):
+    if failure == "bulk_write":
+        def bulk_write(self, *args, **kwargs):
+            raise RuntimeError("write failed")
+        monkeypatch.setattr(type(dev_context.db.get_collection("stock")), "bulk_write", bulk_write)
+    else:
+        def done(self):
+            raise RuntimeError("flush failed")
+        monkeypatch.setattr(FilterBlocksHandler, "done", done)
+
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        checkpoint_file=str(tmp_path / "checkpoint.json"),
+        # "finish": only the final checkpoint is written
+        checkpoint_interval=0 if failure == "bulk_write" else 3600,
+        iter_max=3,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(3)]},
+        },
+    )
+    ap.run()
+    # alerts whose updates, registers or logs were lost must be processed again
+    assert not (tmp_path / "checkpoint.json").exists()
+
+
+def test_checkpoint_flush(dev_context, single_source_directive, tmp_path, monkeypatch):
+    events = []
+    save_checkpoint = AlertConsumer._save_checkpoint
+    monkeypatch.setattr(AlertConsumer, "_save_checkpoint", lambda self: events.append("checkpoint") or save_checkpoint(self))
+    monkeypatch.setattr(RecordingRejectedLogsHandler, "flush", lambda self: events.append("log"))
+    flush_register = GeneralAlertRegister.flush
+    monkeypatch.setattr(GeneralAlertRegister, "flush", lambda self: events.append("register") or flush_register(self))
+
+    dev_context.register_unit(RecordingRejectedLogsHandler)
+    dev_context.register_unit(GeneralAlertRegister)
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={"filters": []},
+        reject={
+            "log": {"unit": "RecordingRejectedLogsHandler"},
+            "register": {"unit": "GeneralAlertRegister", "config": {"path_base": str(tmp_path)}},
+        },
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        checkpoint_file=str(tmp_path / "checkpoint.json"),
+        checkpoint_interval=0,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(3)]},
+        },
+    )
+    assert ap.run() == 3
+    # rejected logs and registers are written before each checkpoint (mid-run and final)
+    # registers are closed at the end of the run
+    assert events == ["log", "register", "checkpoint"] * 3 + ["log", "checkpoint"]
+
+
+def test_adaptive_flush(dev_context, single_source_directive):
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        adaptive_flush={"min_size": 1},
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+    assert dev_context.db.get_collection("stock").count_documents({}) == 4
+    assert stats[
+        ("ampel_alertprocessor_write_latency_seconds_count", (("target", "updates"),))
+    ] > 0
+
+
+def test_async_adaptive_flush(dev_context, single_source_directive, monkeypatch):
+    ap = AsyncAlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        updates_buffer_size=1000,
+        adaptive_flush={"min_size": 1, "max_size": 1},
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+    pushes = []
+    apush_updates = ap._apush_updates
+    monkeypatch.setattr(ap, "_apush_updates", lambda executor: pushes.append(1) or apush_updates(executor))
+    assert ap.run() == 4
+    assert len(pushes) == 4, "the flush size tuned by adaptive_flush is used"
+    assert dev_context.db.get_collection("stock").count_documents({}) == 4
+
+
+def test_dedup(dev_context, single_source_directive):
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        batch_size=2,
+        dedup={},
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in (0, 1, 0, 2, 1)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 5
+    assert dev_context.db.get_collection("stock").count_documents({}) == 3
+    assert stats[("ampel_alertprocessor_alerts_duplicated_total", ())] == 2
+    assert stats[("ampel_alertprocessor_alerts_processed_total", ())] == 3
+    assert all(ap._dedup.seen(el) for el in range(3))
+
+
+def test_dedup_failed_push(dev_context, single_source_directive, monkeypatch):
+    def bulk_write(self, *args, **kwargs):
+        raise RuntimeError("write failed")
+    monkeypatch.setattr(type(dev_context.db.get_collection("stock")), "bulk_write", bulk_write)
+
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        dedup={},
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i}]) for i in range(3)]},
+        },
+    )
+    ap.run()
+    # alerts whose updates were lost must be processed again
+    assert not any(ap._dedup.seen(el) for el in range(3))
+
+
+def test_compact_stock_index(dev_context, single_source_directive):
+    dev_context.db.get_collection("stock").insert_many(
+        [{"stock": 1, "channel": ["TEST_CHANNEL"]}, {"stock": "a", "channel": ["TEST_CHANNEL"]}]
+    )
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        on_stock_match="bypass",
+        config={
+            "filters": [
+                {
+                    "criteria": [
+                        {"attribute": "nonesuch", "value": 0, "operator": "=="}
+                    ],
+                    "len": 1,
+                    "operator": ">=",
+                }
+            ]
+        },
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        compact_stock_index=True,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=stock, datapoints=[{"id": i}])
+                    for i, stock in enumerate((0, 1, "a"))
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 3
+    assert isinstance(ap._fbh.filter_blocks[0].stock_ids, StockIndex)
+    assert stats[
+        ("ampel_alertprocessor_alerts_rejected_total", (("channel", "TEST_CHANNEL"),))
+    ] == 1
+    assert dev_context.db.get_collection("t0").count_documents({}) == 2
+
+
+@pytest.mark.parametrize("stock_scan_threads", [0, 2])
+@pytest.mark.parametrize("compact_stock_index", [False, True])
+def test_stock_scan(dev_context, single_source_directive, stock_scan_threads, compact_stock_index):
+    dev_context.db.get_collection("stock").insert_many(
+        [
+            {"stock": 1, "channel": ["TEST_CHANNEL", "LONG_CHANNEL"]},
+            {"stock": "a", "channel": ["TEST_CHANNEL"]},
+            {"stock": 2, "channel": ["OTHER_CHANNEL"]},
+        ]
+    )
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter", on_stock_match="bypass", config={"filters": []}
+    )
+    directives = [
+        single_source_directive,
+        IngestDirective(channel="LONG_CHANNEL", filter=single_source_directive.filter),
+        IngestDirective(channel="LONG_CHANNEL"),
+    ]
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=directives,
+        supplier={"unit": "UnitTestAlertSupplier", "config": {"alerts": []}},
+        compact_stock_index=compact_stock_index,
+        stock_scan_threads=stock_scan_threads,
+    )
+    stock_ids = ap._fbh.load_stock_ids()
+    assert list(stock_ids) == [0, 1], "blocks without auto complete are skipped"
+    assert [len(el) for el in stock_ids.values()] == [2, 1]
+    assert 1 in stock_ids[0] and "a" in stock_ids[0] and 1 in stock_ids[1]
+    assert all(isinstance(el, StockIndex) == compact_stock_index for el in stock_ids.values())
+
+
+def test_incremental_stock_refresh(dev_context, single_source_directive):
+    col = dev_context.db.get_collection("stock")
+    col.insert_one({"stock": 1, "channel": ["TEST_CHANNEL"], "ts": {"TEST_CHANNEL": {"tied": 0}}})
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter", on_stock_match="bypass", config={"filters": []}
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        supplier={"unit": "UnitTestAlertSupplier", "config": {"alerts": []}},
+        incremental_stock_refresh=True,
+    )
+    fb = ap._fbh.filter_blocks[0]
+    ap.run()
+    assert fb.stock_ids == {1}
+
+    col.insert_many(
+        [
+            {"stock": 2, "channel": ["TEST_CHANNEL"], "ts": {"TEST_CHANNEL": {"tied": time.time()}}},
+            {"stock": 3, "channel": ["TEST_CHANNEL"], "ts": {"TEST_CHANNEL": {"tied": 0}}},
+        ]
+    )
+    ap.run()
+    assert fb.stock_ids == {1, 2}, "only stocks tied since the previous run are loaded"
+
+    ap._fbh.reload_interval = 0
+    ap.run()
+    assert fb.stock_ids == {1, 2, 3}
+
+
+def test_stock_snapshot(dev_context, single_source_directive, tmp_path):
+    col = dev_context.db.get_collection("stock")
+    col.insert_one({"stock": 1, "channel": ["TEST_CHANNEL"], "ts": {"TEST_CHANNEL": {"tied": 0}}})
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter", on_stock_match="bypass", config={"filters": []}
+    )
+    config = dict(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        supplier={"unit": "UnitTestAlertSupplier", "config": {"alerts": []}},
+        stock_snapshot_dir=str(tmp_path / "snapshots"),
+    )
+    AlertConsumer(**config).run()
+    assert (tmp_path / "snapshots" / "TEST_CHANNEL.idx").exists()
+
+    # a new consumer loads the snapshot and only queries stocks tied since then
+    col.delete_many({})
+    col.insert_many(
+        [
+            {"stock": 2, "channel": ["TEST_CHANNEL"], "ts": {"TEST_CHANNEL": {"tied": time.time()}}},
+            {"stock": 3, "channel": ["TEST_CHANNEL"], "ts": {"TEST_CHANNEL": {"tied": 0}}},
+        ]
+    )
+    ap = AlertConsumer(**config)
+    ap.run()
+    stock_ids = ap._fbh.filter_blocks[0].stock_ids
+    assert isinstance(stock_ids, StockIndex)
+    assert [el in stock_ids for el in (1, 2, 3)] == [True, True, False]
+
+
+def test_rejection_fast_path(dev_context, single_source_directive):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={
+            "filters": [
+                {
+                    "criteria": [
+                        {"attribute": "id", "value": 2, "operator": "=="}
+                    ],
+                    "len": 1,
+                    "operator": ">=",
+                }
+            ]
+        },
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+    fb = ap._fbh.filter_blocks[0]
+    assert fb.filter == fb._filter_reject_fast
+    assert stats[("ampel_alertprocessor_alerts_rejected_total", (("channel", "TEST_CHANNEL"),))] == 3
+    assert stats[("ampel_alertprocessor_alerts_accepted_total", (("channel", "TEST_CHANNEL"),))] == 1
+    assert dev_context.db.get_collection("stock").count_documents({}) == 1
+
+    stats = {}
+    with collect_diff(stats):
+        fb.filter(AmpelAlert(id=4, stock=4, datapoints=[{"id": 4, "candid": 4}]))
+    assert stats[("ampel_alertprocessor_alerts_rejected_total", (("channel", "TEST_CHANNEL"),))] == 1, \
+        "rejections are published immediately"
+
+    res = benchmark_rejection(dev_context, alerts=100, repeat=1, verbose=False)
+    assert res.keys() == {"generic", "fast"}
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_rejection_fast_path_logs(dev_context, single_source_directive, monkeypatch, fast):
+    def process(self, alert):
+        self.logger.info(f"evaluating {alert.id}")
+        return alert.id % 2 == 0
+
+    monkeypatch.setattr(BasicMultiFilter, "process", process)
+    monkeypatch.setattr(AmpelLogger, "loggers", {})
+    if not fast:
+        monkeypatch.setattr(FilterBlock, "_filter_reject_fast", FilterBlock.filter)
+    single_source_directive.filter = FilterModel(unit="BasicMultiFilter", config={"filters": []})
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(1, 5)]},
+        },
+    )
+    assert ap.run() == 4
+    # records of rejected alerts are routed identically by both paths (and not along with the next alert)
+    assert [
+        (doc["m"], doc["s"], doc["x"]["a"])
+        for doc in dev_context.db.get_collection("log").find({"m": {"$regex": "^evaluating"}})
+    ] == [(f"evaluating {i}", i, i) for i in range(1, 5)]
+
+
+def test_verdict_cache(dev_context, single_source_directive, tmp_path):
+    def get_consumer(value):
+        single_source_directive.filter = FilterModel(
+            unit="BasicMultiFilter",
+            config={
+                "filters": [
+                    {
+                        "criteria": [
+                            {"attribute": "id", "value": value, "operator": "=="}
+                        ],
+                        "len": 1,
+                        "operator": ">=",
+                    }
+                ]
+            },
+        )
+        return AlertConsumer(
+            context=dev_context,
+            process_name="ap",
+            shaper="NoShaper",
+            directives=[single_source_directive],
+            verdict_cache=str(tmp_path),
+            supplier={
+                "unit": "UnitTestAlertSupplier",
+                "config": {
+                    "alerts": [
+                        AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(4)
+                    ]
+                },
+            },
+        )
+
+    assert get_consumer(2).run() == 4
+    assert [os.path.getsize(el) for el in tmp_path.iterdir()] == [48]
+
+    ap = get_consumer(2)
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+    assert ap._fbh.filter_blocks[0].verdict_cache.hits == 4
+    assert stats[("ampel_alertprocessor_alerts_accepted_total", (("channel", "TEST_CHANNEL"),))] == 1
+
+    # config changes invalidate the cache
+    ap = get_consumer(3)
+    assert len(ap._fbh.filter_blocks[0].verdict_cache) == 0
+    ap.run()
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+@pytest.mark.parametrize("filter_threads", [0, 2])
+def test_share_filters(dev_context, single_source_directive, filter_threads):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={
+            "filters": [
+                {
+                    "criteria": [
+                        {"attribute": "id", "value": 2, "operator": "=="}
+                    ],
+                    "len": 1,
+                    "operator": ">=",
+                }
+            ]
+        },
+    )
+    other_directive = IngestDirective(
+        channel="LONG_CHANNEL",
+        filter=FilterModel(**single_source_directive.filter.dict() | {"on_stock_match": "bypass"}),
+        ingest=single_source_directive.ingest,
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive, other_directive],
+        batch_size=3,
+        filter_threads=filter_threads,
+        share_filters=True,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(4)
+                ]
+            },
+        },
+    )
+    fbs = ap._fbh.filter_blocks
+    assert fbs[0].unit_instance is fbs[1].unit_instance
+    assert fbs[0].shared_filter is fbs[1].shared_filter
+
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+    assert fbs[0].shared_filter.calls == 8
+    if not filter_threads:
+        assert fbs[0].shared_filter.evaluations == 4
+    for channel in ("TEST_CHANNEL", "LONG_CHANNEL"):
+        assert stats[("ampel_alertprocessor_alerts_accepted_total", (("channel", channel),))] == 1
+    assert set(dev_context.db.get_collection("stock").find_one({})["channel"]) == {"LONG_CHANNEL", "TEST_CHANNEL"}
+
+
+def test_share_filters_logs(dev_context, single_source_directive, monkeypatch):
+    def process(self, alert):
+        self.logger.info(f"evaluating {alert.id}")
+        time.sleep(0.001)
+        return alert.id % 2 == 0
+
+    monkeypatch.setattr(BasicMultiFilter, "process", process)
+    monkeypatch.setattr(AmpelLogger, "loggers", {})
+    rejected_records.clear()
+    dev_context.register_unit(RecordingRejectedLogsHandler)
+    filter_model = FilterModel(
+        unit="BasicMultiFilter",
+        config={"filters": []},
+        reject={"log": {"unit": "RecordingRejectedLogsHandler"}},
+    )
+    single_source_directive.filter = filter_model
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[
+            single_source_directive,
+            IngestDirective(channel="LONG_CHANNEL", filter=filter_model, ingest=single_source_directive.ingest),
+        ],
+        batch_size=20,
+        filter_threads=2,
+        share_filters=True,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(1, 21)]},
+        },
+    )
+    assert ap.run() == 20
+    # each filter block gets the records of the alert it rejected, once
+    assert sorted((r.channel, r.msg, r.extra["a"]) for r in rejected_records) == sorted(
+        (channel, f"evaluating {i}", i) for channel in ("LONG_CHANNEL", "TEST_CHANNEL") for i in range(1, 21, 2)
+    )
+
+
+def test_share_filters_buffers(dev_context, single_source_directive, monkeypatch):
+    def process(self, alert):
+        self.logger.info(f"evaluating {alert.id}")
+        # the filter block owning the unit handles its own records meanwhile (other thread)
+        fbs[0].buffer.clear()
+        return True
+
+    monkeypatch.setattr(BasicMultiFilter, "process", process)
+    monkeypatch.setattr(AmpelLogger, "loggers", {})
+    single_source_directive.filter = FilterModel(unit="BasicMultiFilter", config={"filters": []})
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[
+            single_source_directive,
+            IngestDirective(channel="LONG_CHANNEL", filter=single_source_directive.filter, ingest=single_source_directive.ingest),
+        ],
+        share_filters=True,
+        supplier={"unit": "UnitTestAlertSupplier", "config": {"alerts": []}},
+    )
+    fbs = ap._fbh.filter_blocks
+    fbs[0].buffer.append(LightLogRecord(0, 0, "pending"))
+    assert fbs[1].filter_func(AmpelAlert(id=1, stock=1, datapoints=[])) is True
+    assert [r.msg for r in fbs[1].buffer] == ["evaluating 1"]
+
+
+def test_filter_budget(dev_context, single_source_directive, monkeypatch):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={
+            "filters": [
+                {
+                    "criteria": [
+                        {"attribute": "nonesuch", "value": 0, "operator": "=="}
+                    ],
+                    "len": 0,
+                    "operator": "==",
+                }
+            ]
+        },
+    )
+
+    process = BasicMultiFilter.process
+
+    def slow_process(self, alert):
+        if alert.id in (1, 2):
+            start = time.thread_time()
+            while time.thread_time() - start < 0.02:
+                pass
+        return process(self, alert)
+
+    monkeypatch.setattr(BasicMultiFilter, "process", slow_process)
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        filter_budget={"call_limit": 0.01, "strikes": 3, "channels": {"TEST_CHANNEL": {"strikes": 2}}},
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(6)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 6
+    labels = (("channel", "TEST_CHANNEL"),)
+    assert stats[("ampel_alertprocessor_filter_overruns_total", labels)] == 2
+    assert stats[("ampel_alertprocessor_filter_quarantined_total", labels)] == 3
+    assert stats[("ampel_alertprocessor_alerts_accepted_total", labels)] == 1
+
+    # quarantines end with the run
+    ap.run()
+    assert ap._fbh.filter_blocks[0].budget.quarantined is None
+
+
+def test_process_batch(dev_context, single_source_directive, monkeypatch):
+    alerts = make_alerts(50)
+    batches = []
+    process_batch = BatchFilter.process_batch
+
+    def spy(self, alerts):
+        batches.append(len(alerts))
+        return process_batch(self, alerts)
+
+    monkeypatch.setattr(BatchFilter, "process_batch", spy)
+    dev_context.register_unit(BatchFilter)
+    single_source_directive.filter = FilterModel(unit="BatchFilter")
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        batch_size=20,
+        supplier={"unit": "UnitTestAlertSupplier", "config": {"alerts": alerts}},
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 50
+    assert batches == [20, 20, 10]
+    assert stats[("ampel_alertprocessor_alerts_accepted_total", (("channel", "TEST_CHANNEL"),))] == 25
+
+
+@pytest.mark.parametrize("filter_threads", [0, 2])
+def test_process_batch_logs(dev_context, single_source_directive, monkeypatch, filter_threads):
+    rejected_records.clear()
+    # filter units of previous consumers registered loggers with the same names
+    monkeypatch.setattr(AmpelLogger, "loggers", {})
+    dev_context.register_unit(RecordingRejectedLogsHandler)
+    dev_context.register_unit(BatchFilter)
+    filter_model = FilterModel(
+        unit="BatchFilter",
+        config={"log_evaluations": True},
+        reject={"log": {"unit": "RecordingRejectedLogsHandler"}},
+    )
+    single_source_directive.filter = filter_model
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[
+            single_source_directive,
+            IngestDirective(channel="LONG_CHANNEL", filter=filter_model, ingest=single_source_directive.ingest),
+        ],
+        batch_size=4,
+        filter_threads=filter_threads,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {"alerts": [AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(8)]},
+        },
+    )
+    assert ap.run() == 8
+    # records of rejected alerts are routed to the rejected logs handler along with the alert they belong to
+    assert sorted((r.msg, r.stock, r.extra["a"]) for r in rejected_records) == sorted(
+        2 * [(f"evaluating {i}", i, i) for i in range(1, 8, 2)]
+    )
+    # batched evaluation is abandoned once records were emitted
+    assert all(fb.batch_func is None for fb in ap._fbh.filter_blocks)
+
+
+@pytest.mark.parametrize("aggregate_metrics", [None, {"alerts": None, "interval": None}])
+def test_aggregate_metrics(dev_context, single_source_directive, aggregate_metrics):
+    single_source_directive.filter = FilterModel(
+        unit="BasicMultiFilter",
+        config={
+            "filters": [
+                {
+                    "criteria": [{"attribute": "id", "value": 1, "operator": ">"}],
+                    "len": 1,
+                    "operator": ">=",
+                }
+            ]
+        },
+    )
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive],
+        batch_size=2,
+        aggregate_metrics=aggregate_metrics,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"id": i, "candid": i}]) for i in range(5)
+                ]
+            },
+        },
+    )
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 5
+    labels = (("channel", "TEST_CHANNEL"),)
+    assert stats[("ampel_alertprocessor_alerts_processed_total", ())] == 5
+    assert stats[("ampel_alertprocessor_alerts_accepted_total", labels)] == 3
+    assert stats[("ampel_alertprocessor_alerts_rejected_total", labels)] == 2
+    assert stats[("ampel_alertprocessor_time_seconds_count", (("section", "filter.TEST_CHANNEL"),))] == 5
+    assert stats[("ampel_alertprocessor_time_seconds_count", (("section", "ingest"),))] == 3
+
+
+@pytest.mark.parametrize("filter_threads", [0, 2])
+def test_alert_features(dev_context, single_source_directive, monkeypatch, filter_threads):
+    single_source_directive.filter = FilterModel(unit="BasicMultiFilter", config={"filters": []})
+    other_directive = IngestDirective(
+        channel="LONG_CHANNEL",
+        filter=FilterModel(unit="BasicMultiFilter", config={"filters": []}),
+        ingest=single_source_directive.ingest,
+    )
+
+    monkeypatch.setattr(BasicMultiFilter, "process", lambda self, alert: self.get_feature(alert, "ndet") >= 2)
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[single_source_directive, other_directive],
+        batch_size=3,
+        filter_threads=filter_threads,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(
+                        id=i, stock=i, datapoints=[{"id": j, "candid": j, "jd": 2459000.5 + j} for j in range(i)] + [{"id": -1, "jd": 2459000.}]
+                    )
+                    for i in range(4)
+                ]
+            },
+        },
+    )
+    features = ap._fbh.features
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+    for channel in ("TEST_CHANNEL", "LONG_CHANNEL"):
+        assert stats[("ampel_alertprocessor_alerts_accepted_total", (("channel", channel),))] == 2
+    # 'detections' and 'ndet' computed once per alert for both channels
+    if not filter_threads:
+        assert features.computed == 2 * 4
+    assert not features._memo
+
+
+def test_share_criteria(dev_context, single_source_directive):
+    def directive(channel, value):
+        return IngestDirective(
+            channel=channel,
+            filter=FilterModel(
+                unit="BasicMultiFilter",
+                config={
+                    "filters": [
+                        {
+                            "criteria": [
+                                {"attribute": "rb", "value": 0.5, "operator": ">"},
+                                {"attribute": "magpsf", "value": value, "operator": "<"},
+                            ],
+                            "len": 1,
+                            "operator": ">=",
+                        }
+                    ]
+                },
+            ),
+            ingest=single_source_directive.ingest,
+        )
+
+    ap = AlertConsumer(
+        context=dev_context,
+        process_name="ap",
+        shaper="NoShaper",
+        directives=[directive("TEST_CHANNEL", 18), directive("LONG_CHANNEL", 20)],
+        share_criteria=True,
+        supplier={
+            "unit": "UnitTestAlertSupplier",
+            "config": {
+                "alerts": [
+                    AmpelAlert(id=i, stock=i, datapoints=[{"candid": i, "rb": 0.6, "magpsf": 17 + i}])
+                    for i in range(4)
+                ]
+            },
+        },
+    )
+    shared = ap._fbh.shared_criteria
+    assert shared is not None and len(shared) == 4
+
+    stats = {}
+    with collect_diff(stats):
+        assert ap.run() == 4
+    # candid, rb and the magpsf criterion of each channel
+    assert shared.evaluations == 4 * 4
+    for channel, accepted in (("TEST_CHANNEL", 1), ("LONG_CHANNEL", 3)):
+        assert stats[("ampel_alertprocessor_alerts_accepted_total", (("channel", channel),))] == accepted
+
+
+def test_benchmark(testing_config):
+    alerts = make_alerts(3, datapoints=4, stocks=2)
+    assert [el.stock for el in alerts] == [0, 1, 0]
+    assert len({dp["id"] for el in alerts for dp in el.datapoints}) == 12
+
+    results = AlertConsumerBenchmark(testing_config, isolate=False).benchmark(
+        alerts=10,
+        datapoints=3,
+        channels=2,
+        filters="BasicMultiFilter",
+        registers=True,
+        db_log_formats="standard",
+        verbose=False,
+    )
+    assert len(results) == 1
+    assert results[0]["alerts"] == 10
+    assert results[0]["alerts_per_sec"] > 0
+    assert {"filter.BENCHMARK_0", "register.BENCHMARK_1"} <= results[0]["stages"].keys()
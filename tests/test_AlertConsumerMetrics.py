@@ -0,0 +1,30 @@
+import pytest
+
+from ampel.alert.AlertConsumerMetrics import MetricsBuffer
+from ampel.metrics.AmpelMetricsRegistry import AmpelMetricsRegistry
+
+
+def test_metrics_buffer():
+    histogram = AmpelMetricsRegistry.histogram("test_buffer", "test", subsystem="test")
+    metrics = MetricsBuffer(alerts=3, interval=None)
+    local = metrics.histogram(histogram)
+    assert metrics.histogram(histogram) is local
+    values = [0.001, 0.1, 0.1, 3, 100]
+    for v in values[:2]:
+        local.observe(v)
+    metrics.tick(2)
+
+    def samples(hist):
+        return {
+            (s.name.rsplit("_", 1)[1], s.labels.get("le")): s.value
+            for m in hist.collect() for s in m.samples if not s.name.endswith("_created")
+        }
+
+    assert samples(histogram)[("sum", None)] == 0
+    for v in values[2:]:
+        local.observe(v)
+    metrics.tick(1)
+    reference = AmpelMetricsRegistry.histogram("test_reference", "test", subsystem="test")
+    for v in values:
+        reference.observe(v)
+    assert samples(histogram) == {**samples(reference), ("sum", None): pytest.approx(sum(values))}
@@ -0,0 +1,35 @@
+from ampel.alert.AlertDeduplicator import AlertDeduplicator
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.reject.GeneralAlertRegister import GeneralAlertRegister
+from ampel.log.AmpelLogger import AmpelLogger
+
+
+def test_dedup():
+    dedup = AlertDeduplicator(lru_size=1, bloom_capacity=100)
+    dedup.hold(1)
+    assert dedup.seen(1) and not dedup.seen(2)
+    # held ids are registered or discarded by the caller
+    assert dedup.release() == {1}
+    assert not dedup.seen(1)
+    for el in (1, 2, "a"):
+        dedup.add(el)
+    assert [dedup.seen(el) for el in (1, 2, "a", "b")] == [True, True, True, False]
+
+
+def test_dedup_registers(dev_context, tmp_path):
+    for channel, ids in (("A", (1, 2, 3)), ("B", (2, 3, 4))):
+        reg = GeneralAlertRegister(
+            context=dev_context, channel=channel, run_id=0,
+            path_base=str(tmp_path), logger=AmpelLogger.get_logger()
+        )
+        for i in ids:
+            reg.file(AmpelAlert(id=i, stock=i, datapoints=[]))
+        reg.close()
+
+    # only alerts rejected by all channels are seen
+    dedup = AlertDeduplicator(registers=[f"{tmp_path}/*/*.bin.gz"])
+    assert [dedup.seen(i) for i in range(1, 5)] == [False, True, True, False]
+    dedup = AlertDeduplicator(registers=[f"{tmp_path}/*/*.bin.gz"], channels=["A"])
+    assert [dedup.seen(i) for i in range(1, 5)] == [True, True, True, False]
+    dedup = AlertDeduplicator(registers=[f"{tmp_path}/A/*.bin.gz"], channels=["A", "B"])
+    assert not any(dedup.seen(i) for i in range(1, 5))
@@ -0,0 +1,21 @@
+import pytest
+
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter
+from ampel.log.AmpelLogger import AmpelLogger
+
+
+def test_alert_features():
+    alert = AmpelAlert(
+        id=0, stock=0,
+        datapoints=[
+            {"candid": 2, "jd": 2459002.5, "fid": 2, "magpsf": 18.5},
+            {"candid": 1, "jd": 2459000.5, "fid": 1, "magpsf": 19.0},
+            {"candid": 3, "jd": 2459003.0, "fid": 1, "magpsf": 18.0},
+            {"jd": 2459004.0, "fid": 1, "diffmaglim": 20.0},
+        ],
+    )
+    unit = BasicMultiFilter(filters=[], logger=AmpelLogger.get_logger())
+    assert [unit.get_feature(alert, f) for f in ("ndet", "last_mag", "age", "color")] == [3, 18.0, 2.5, -0.5]
+    with pytest.raises(ValueError):
+        unit.get_feature(alert, "nonesuch")
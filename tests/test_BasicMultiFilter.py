@@ -0,0 +1,47 @@
+import pytest
+import random
+
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter
+from ampel.dev.AlertConsumerBenchmark import make_alerts
+from ampel.dev.BasicMultiFilterBenchmark import benchmark_backends
+from ampel.log.AmpelLogger import AmpelLogger
+
+
+def test_compiled_multi_filter(random_filters):
+    rand = random.Random(0)
+    alerts = make_alerts(100, datapoints=8)
+    attributes = [("rb", 0, 1), ("magpsf", 15, 21), ("sigmapsf", 0, 0.3), ("nonesuch", 0, 1)]
+    for _ in range(100):
+        filters = random_filters(rand, attributes)
+        unit = BasicMultiFilter(filters=filters, logger=AmpelLogger.get_logger())
+        assert unit._evaluate
+        assert [unit.process(alert) for alert in alerts] == [
+            unit._process_generic(alert) for alert in alerts
+        ]
+
+
+def test_numpy_multi_filter(random_filters):
+    pytest.importorskip("numpy")
+    rand = random.Random(0)
+    alerts = make_alerts(50, datapoints=8)
+    # missing and None fields, values not comparable exactly as float64
+    alerts.append(AmpelAlert(id=50, stock=50, datapoints=[{"candid": 1, "rb": 0.95}, {"rb": 0.99, "magpsf": 15}]))
+    alerts.append(AmpelAlert(id=51, stock=51, datapoints=[{"candid": 1, "rb": None, "magpsf": 15}]))
+    alerts.append(AmpelAlert(id=52, stock=52, datapoints=[{"candid": 1, "rb": 2**60 + 1, "magpsf": 15}]))
+    attributes = [("rb", 0, 1), ("magpsf", 15, 21), ("nonesuch", 0, 1)]
+    for _ in range(50):
+        filters = random_filters(rand, attributes, max_len=4, max_conditions=3)
+        unit = BasicMultiFilter(
+            filters=filters, backend="numpy", numpy_min_datapoints=0, logger=AmpelLogger.get_logger()
+        )
+        assert unit._vectorized
+        for alert in alerts:
+            try:
+                expected = unit._evaluate(alert.datapoints)
+            except TypeError:  # None compared (the numpy backend might skip the comparison)
+                continue
+            assert unit.process(alert) == expected
+
+    res = benchmark_backends(lengths=[10], alerts=10, repeat=1, verbose=False)
+    assert res[10].keys() == {"generic", "python", "numpy"}
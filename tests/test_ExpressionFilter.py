@@ -0,0 +1,41 @@
+import pytest
+import random
+
+from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter
+from ampel.alert.filter.ExpressionFilter import ExpressionFilter
+from ampel.dev.AlertConsumerBenchmark import make_alerts
+from ampel.log.AmpelLogger import AmpelLogger
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_expression_filter(backend, random_filters):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    rand = random.Random(0)
+    alerts = make_alerts(50, datapoints=8)
+    attributes = [("rb", 0, 1), ("magpsf", 15, 21), ("nonesuch", 0, 1)]
+    for _ in range(50):
+        filters = random_filters(rand, attributes, max_len=4)
+        # equivalent expression (left to right combination of conditions)
+        expression = ""
+        for i, f in enumerate(filters):
+            pred = " and ".join(f"{q['attribute']} {q['operator']} {q['value']!r}" for q in f["criteria"])
+            cond = f"count({pred}) {f['operator']} {f['len']}"
+            expression = cond if i == 0 else f"({expression}) {f['logicalConnection'].lower()} {cond}"
+        unit = ExpressionFilter(
+            expression=expression, backend=backend, numpy_min_datapoints=0, logger=AmpelLogger.get_logger()
+        )
+        ref = BasicMultiFilter(filters=filters, logger=AmpelLogger.get_logger())
+        assert [unit.process(alert) for alert in alerts] == [ref.process(alert) for alert in alerts]
+
+    unit = ExpressionFilter(
+        expression="count(-magpsf < -15 and not fid != 1 or magpsf + sigmapsf > 25) == count(fid == 1) > 0",
+        backend=backend, numpy_min_datapoints=0, logger=AmpelLogger.get_logger()
+    )
+    assert [unit.process(alert) for alert in alerts] == [
+        0 < sum(1 for dp in alert.datapoints if dp["fid"] == 1) for alert in alerts
+    ]
+
+    for expression in ["rb > 0.8", "count(rb) > 1", "count(rb.real > 1) > 1", "count(rb in [1]) > 0", "count(rb > 1"]:
+        with pytest.raises(ValueError):
+            ExpressionFilter(expression=expression, logger=AmpelLogger.get_logger())
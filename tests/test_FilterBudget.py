@@ -0,0 +1,27 @@
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.FilterBudget import FilterBudget
+
+
+def test_filter_budget_release(monkeypatch):
+    clock = {"cpu": 0.0, "wall": 0.0}
+    monkeypatch.setattr("ampel.alert.FilterBudget.thread_time", lambda: clock["cpu"])
+    monkeypatch.setattr("ampel.alert.FilterBudget.time", lambda: clock["wall"])
+
+    def process(alert):
+        clock["cpu"] += 1
+        return True
+
+    budget = FilterBudget("TEST_CHANNEL", run_limit=1.5, quarantine_time=10)
+    budgeted = budget.wrap(process)
+    alert = AmpelAlert(id=0, stock=0, datapoints=[])
+
+    assert budgeted(alert) is True
+    assert budgeted(alert) is True
+    assert budget.quarantined == 10
+    assert budgeted(alert) is False
+
+    # the run budget is renewed once the quarantine ends
+    clock["wall"] = 11
+    assert budgeted(alert) is True
+    assert budget.quarantined is None
+    assert budget.used == 1
@@ -0,0 +1,18 @@
+import pytest
+
+from ampel.alert.AmpelAlert import AmpelAlert
+from ampel.alert.FilterVerdictCache import FilterVerdictCache
+
+
+def test_verdict_cache_rejection_codes(tmp_path):
+    results = {1: False, 2: -7, 3: True, 4: 12}
+    vc = FilterVerdictCache(str(tmp_path / "test.vc"))
+    cached = vc.wrap(lambda alert: results[alert.id])
+    alerts = [AmpelAlert(id=i, stock=i, datapoints=[]) for i in results]
+    assert [cached(alert) for alert in alerts] == list(results.values())
+    vc.flush()
+
+    vc = FilterVerdictCache(str(tmp_path / "test.vc"))
+    cached = vc.wrap(lambda alert: pytest.fail("verdict not cached"))
+    assert [cached(alert) for alert in alerts] == list(results.values())
+    assert vc.hits == 4
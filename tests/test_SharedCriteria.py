@@ -0,0 +1,39 @@
+import random
+
+from ampel.alert.filter.BasicMultiFilter import BasicMultiFilter
+from ampel.alert.filter.SharedCriteria import SharedCriteria
+from ampel.dev.AlertConsumerBenchmark import make_alerts
+from ampel.log.AmpelLogger import AmpelLogger
+
+
+def test_shared_criteria():
+    rand = random.Random(0)
+    alerts = make_alerts(100, datapoints=8)
+    criteria = [
+        {"attribute": attr, "operator": op, "value": value}
+        for attr, values in [("rb", (0.2, 0.5, 0.8)), ("magpsf", (17, 19)), ("nonesuch", (0,))]
+        for op in (">", "<=", "!=")
+        for value in values
+    ]
+    shared = SharedCriteria(memo_size=len(alerts))
+    units = []
+    for _ in range(20):
+        filters = [
+            {
+                "criteria": rand.sample(criteria, rand.randint(0, 3)),
+                "len": rand.randint(0, 6),
+                "operator": rand.choice([">", "<", ">=", "<=", "==", "!="]),
+                "logicalConnection": rand.choice(["AND", "OR"]),
+            }
+            for _ in range(rand.randint(1, 4))
+        ]
+        unit = BasicMultiFilter(filters=filters, logger=AmpelLogger.get_logger())
+        assert unit.share_criteria(shared)
+        units.append(unit)
+    for unit in units:
+        assert [unit.process(alert) for alert in alerts] == [
+            unit._process_generic(alert) for alert in alerts
+        ]
+    # each distinct criterion is evaluated at most once per alert
+    assert len(shared) <= len(criteria) + 1
+    assert shared.evaluations <= len(shared) * len(alerts)
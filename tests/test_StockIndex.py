@@ -0,0 +1,24 @@
+from ampel.alert.StockIndex import StockIndex
+
+
+def test_stock_index():
+    index = StockIndex([3, 1, "b", 2**70, 1], merge_size=2)
+    assert len(index) == 4
+    assert all(el in index for el in (1, 3, "b", 2**70))
+    assert not any(el in index for el in (0, 2, "a", 2**71, str(2**70)))
+    index.add(2)
+    index.add("a")
+    assert len(index._added) == 0, "ids are merged into the arrays once merge_size is reached"
+    assert 2 in index and "a" in index and len(index) == 6
+
+
+def test_stock_index_snapshot(tmp_path):
+    index = StockIndex([5, 1, "x"])
+    index.add(3)
+    index.save(str(tmp_path / "snap.idx"), 42.0)
+    loaded, ts = StockIndex.load(str(tmp_path / "snap.idx"))
+    assert ts == 42.0 and len(loaded) == 4
+    assert all(el in loaded for el in (1, 3, 5, "x")) and 2 not in loaded
+    loaded.add(2)
+    loaded.merge()
+    assert 2 in loaded and 5 in loaded
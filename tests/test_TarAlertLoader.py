@@ -0,0 +1,27 @@
+import io, json, tarfile
+
+from ampel.alert.load.TarAlertLoader import TarAlertLoader
+
+
+def test_tar_checkpoint_nested_first_member(tmp_path):
+    def add(tar, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+    nested = io.BytesIO()
+    with tarfile.open(fileobj=nested, mode="w:gz") as tar:
+        for i in range(3):
+            add(tar, f"nested_{i}", f"nested_{i}".encode())
+    with tarfile.open(tmp_path / "alerts.tar.gz", mode="w:gz") as tar:
+        add(tar, "first.tar.gz", nested.getvalue())
+        add(tar, "outer", b"outer")
+
+    loader = TarAlertLoader(file_path=str(tmp_path / "alerts.tar.gz"))
+    assert next(loader).read() == b"nested_0"
+    checkpoint = loader.get_checkpoint()
+    assert checkpoint["offset"] == 0 and "nested" in checkpoint
+
+    loader = TarAlertLoader(file_path=str(tmp_path / "alerts.tar.gz"))
+    loader.set_checkpoint(json.loads(json.dumps(checkpoint)))
+    assert [f.read() for f in loader] == [b"nested_1", b"nested_2", b"outer"]